@@ -0,0 +1,271 @@
+"""
+Tạo quiz hàng loạt cho nhiều cặp (DOCX, đáp án) - ví dụ cả tổ bộ môn.
+Input là một thư mục (ghép DOCX với file đáp án cùng tên) hoặc một manifest
+JSON/CSV. Mọi file dùng chung một model backend, rate limiter và response
+cache; tối đa `max_concurrent_files` file chạy cùng lúc và mỗi kết quả được
+lưu qua QuizTestEngine.save_quiz_to_storage.
+
+    python run_bulk_generation.py de_thi/ --concurrency 3 --compile-workers 2
+"""
+
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TEXT_ANSWER_SUFFIXES = (".txt",)
+IMAGE_ANSWER_SUFFIXES = (".png", ".jpg", ".jpeg", ".webp", ".bmp")
+ANSWER_NAME_SUFFIXES = ("", "_dap_an", "_dapan", "_answers", "_answer", ".answers")
+
+@dataclass
+class BulkQuizItem:
+    """Một đề trong lô: file DOCX, file đáp án và tên quiz khi lưu."""
+    docx_path: str
+    answer_path: str
+    quiz_name: str
+    answer_type: str = "text"
+    
+    def load_answer_data(self):
+        if self.answer_type == "image":
+            return Path(self.answer_path).read_bytes()
+        return Path(self.answer_path).read_text(encoding='utf-8')
+
+def _answer_type_for(path: Path) -> str:
+    return "image" if path.suffix.lower() in IMAGE_ANSWER_SUFFIXES else "text"
+
+def discover_bulk_items(directory: str) -> List[BulkQuizItem]:
+    """Ghép mỗi <tên>.docx với <tên>[_dap_an|_answers].txt/.png/.jpg trong cùng thư mục."""
+    directory = Path(directory)
+    items = []
+    
+    for docx_path in sorted(directory.glob("*.docx")):
+        if docx_path.name.startswith("~$"):
+            continue  # Word lock files
+            
+        answer_path = None
+        for name_suffix in ANSWER_NAME_SUFFIXES:
+            for suffix in TEXT_ANSWER_SUFFIXES + IMAGE_ANSWER_SUFFIXES:
+                candidate = docx_path.with_name(f"{docx_path.stem}{name_suffix}{suffix}")
+                if candidate.exists():
+                    answer_path = candidate
+                    break
+            if answer_path:
+                break
+                
+        if answer_path is None:
+            logger.warning(f"⚠️ Bỏ qua {docx_path.name}: không tìm thấy file đáp án")
+            continue
+            
+        items.append(BulkQuizItem(
+            docx_path=str(docx_path),
+            answer_path=str(answer_path),
+            quiz_name=docx_path.stem,
+            answer_type=_answer_type_for(answer_path)
+        ))
+        
+    return items
+
+def load_manifest(manifest_path: str) -> List[BulkQuizItem]:
+    """Đọc manifest JSON (list các object) hoặc CSV với cột docx, answers[, name, answer_type].
+    
+    Đường dẫn tương đối được tính từ thư mục chứa manifest.
+    """
+    manifest_path = Path(manifest_path)
+    base_dir = manifest_path.parent
+    
+    if manifest_path.suffix.lower() == ".csv":
+        with open(manifest_path, 'r', encoding='utf-8-sig', newline='') as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            rows = json.load(f)
+            
+    items = []
+    for index, row in enumerate(rows, start=1):
+        if not row.get("docx") or not row.get("answers"):
+            raise ValueError(f"Manifest dòng {index}: thiếu 'docx' hoặc 'answers'")
+            
+        docx_path = base_dir / row["docx"]
+        answer_path = base_dir / row["answers"]
+        items.append(BulkQuizItem(
+            docx_path=str(docx_path),
+            answer_path=str(answer_path),
+            quiz_name=row.get("name") or docx_path.stem,
+            answer_type=row.get("answer_type") or _answer_type_for(answer_path)
+        ))
+        
+    return items
+
+def load_bulk_items(source: str) -> List[BulkQuizItem]:
+    """Thư mục → discover_bulk_items, file → load_manifest."""
+    if Path(source).is_dir():
+        return discover_bulk_items(source)
+    return load_manifest(source)
+
+class BulkQuizGenerator:
+    """Chạy pipeline cho nhiều đề với backend/limiter/cache dùng chung.
+    
+    Mỗi file có agent riêng (state của một lần chạy nằm trên agent) nhưng tất
+    cả trỏ tới cùng backend, rate limiter và response cache, nên quota được
+    chia đúng giữa các file đang chạy song song.
+    """
+    
+    def __init__(self, api_key: str = None, quiz_engine=None, max_concurrent_files: int = 2,
+                 agent_config: Dict[str, Any] = None, backend=None, enable_logging: bool = False):
+        # Imported here so manifest/discovery helpers stay usable without the Gemini stack
+        from .simple_agent import EnhancedMultimodalQuizAgent
+        
+        self._agent_class = EnhancedMultimodalQuizAgent
+        self.enable_logging = enable_logging
+        self.agent_config = agent_config or {}
+        self.max_concurrent_files = max(1, max_concurrent_files)
+        self.quiz_engine = quiz_engine
+        
+        # The first agent resolves the shared client, limiter and cache for the whole batch
+        template = self._agent_class(api_key=api_key, enable_logging=enable_logging, backend=backend)
+        self.api_key = template.api_key
+        self.backend = template.backend
+        self.rate_limiter = template.rate_limiter
+        self.response_cache = template.response_cache
+        
+        # QuizTestEngine keeps an in-memory index; saves go one at a time
+        self._save_lock = threading.Lock()
+        
+    def _create_agent(self):
+        agent = self._agent_class(
+            api_key=self.api_key,
+            enable_logging=self.enable_logging,
+            rate_limiter=self.rate_limiter,
+            response_cache=self.response_cache,
+            backend=self.backend
+        )
+        agent.config.update(self.agent_config)
+        return agent
+        
+    def process_item(self, item: BulkQuizItem, save: bool = True) -> Dict[str, Any]:
+        """Chạy pipeline cho một đề và lưu quiz; trả về bản tóm tắt kết quả."""
+        start = time.time()
+        summary = {
+            **asdict(item),
+            "success": False,
+            "saved_as": None,
+            "questions": 0,
+            "fallback_questions": 0,
+            "errors": []
+        }
+        
+        try:
+            agent = self._create_agent()
+            results = agent.process_complete_quiz_enhanced(
+                item.load_answer_data(), Path(item.docx_path), item.answer_type
+            )
+            
+            compiled = results.get("compiled_questions", [])
+            summary.update(
+                success=bool(results.get("success")),
+                questions=len(compiled),
+                fallback_questions=sum(1 for q in compiled if q.get("is_fallback")),
+                errors=list(results.get("errors", []))
+            )
+            
+            if save and compiled and self.quiz_engine is not None:
+                with self._save_lock:
+                    summary["saved_as"] = self.quiz_engine.save_quiz_to_storage(compiled, item.quiz_name)
+                if not summary["saved_as"]:
+                    summary["errors"].append("Không lưu được quiz")
+                    
+        except Exception as e:
+            logger.error(f"❌ {item.quiz_name}: {e}")
+            summary["errors"].append(str(e))
+            
+        summary["seconds"] = round(time.time() - start, 2)
+        return summary
+        
+    def run(self, items: List[BulkQuizItem], save: bool = True,
+            progress_callback: Callable[[Dict[str, Any], int, int], None] = None) -> List[Dict[str, Any]]:
+        """Xử lý cả lô, tối đa max_concurrent_files đề cùng lúc; kết quả theo thứ tự input."""
+        summaries: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        workers = min(self.max_concurrent_files, len(items)) or 1
+        
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="quiz-bulk") as executor:
+            futures = {executor.submit(self.process_item, item, save): index for index, item in enumerate(items)}
+            
+            for done, future in enumerate(as_completed(futures), start=1):
+                summary = future.result()
+                summaries[futures[future]] = summary
+                if progress_callback:
+                    progress_callback(summary, done, len(items))
+                    
+        return summaries
+
+def main():
+    parser = argparse.ArgumentParser(description="QuizForce - tạo quiz hàng loạt")
+    parser.add_argument("source", help="Thư mục chứa DOCX + đáp án, hoặc manifest .json/.csv")
+    parser.add_argument("--concurrency", type=int, default=2, help="Số đề xử lý cùng lúc")
+    parser.add_argument("--compile-workers", type=int, default=1, help="compile_workers của mỗi đề")
+    parser.add_argument("--batch", action="store_true", help="Dùng batch compile mode")
+    parser.add_argument("--no-save", action="store_true", help="Không lưu vào quiz storage")
+    parser.add_argument("--report", default=None, help="Ghi bản tóm tắt JSON ra file")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(threadName)s - %(message)s')
+    
+    if not os.getenv("GOOGLE_API_KEY"):
+        print("❌ Cần GOOGLE_API_KEY trong environment")
+        return 1
+        
+    items = load_bulk_items(args.source)
+    if not items:
+        print(f"❌ Không tìm thấy cặp DOCX + đáp án nào trong {args.source}")
+        return 1
+        
+    from .quiz_test_engine import QuizTestEngine
+    
+    generator = BulkQuizGenerator(
+        quiz_engine=None if args.no_save else QuizTestEngine(),
+        max_concurrent_files=args.concurrency,
+        agent_config={
+            "compile_workers": args.compile_workers,
+            "compile_mode": "batch" if args.batch else "single"
+        },
+        enable_logging=args.verbose
+    )
+    
+    print(f"📚 Bắt đầu tạo {len(items)} quiz ({args.concurrency} đề cùng lúc)")
+    
+    def report(summary: Dict[str, Any], done: int, total: int) -> None:
+        status = "✅" if summary["success"] else "❌"
+        print(f"{status} [{done}/{total}] {summary['quiz_name']}: {summary['questions']} câu "
+              f"({summary['fallback_questions']} cần xem lại) trong {summary['seconds']}s")
+        for error in summary["errors"][:3]:
+            print(f"   ⚠️ {error}")
+            
+    summaries = generator.run(items, save=not args.no_save, progress_callback=report)
+    
+    succeeded = sum(1 for s in summaries if s["success"])
+    print(f"\n🏁 Hoàn tất: {succeeded}/{len(summaries)} đề thành công")
+    
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({
+                "timestamp": datetime.now().isoformat(),
+                "source": args.source,
+                "results": summaries
+            }, f, ensure_ascii=False, indent=2)
+        print(f"📝 Đã ghi báo cáo: {args.report}")
+        
+    return 0 if succeeded == len(summaries) else 2
+
+if __name__ == "__main__":
+    raise SystemExit(main())
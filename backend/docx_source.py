@@ -0,0 +1,149 @@
+"""
+Đọc DOCX qua một ZipFile duy nhất.
+Text (main document part) và media (word/media/*) dùng chung một handle mở
+trực tiếp trên buffer của upload hoặc trên file trên đĩa: không copy cả file
+sang BytesIO mới và không load mọi part vào RAM như docx.Document(); ảnh chỉ
+được đọc khi có câu hỏi cần đến.
+"""
+
+import io
+import mimetypes
+import posixpath
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+from xml.etree import ElementTree
+from zipfile import ZipFile
+
+from docx.oxml import parse_xml
+
+PACKAGE_RELS_PART = "_rels/.rels"
+CONTENT_TYPES_PART = "[Content_Types].xml"
+DEFAULT_DOCUMENT_PART = "word/document.xml"
+
+RELS_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+CONTENT_TYPES_NS = "{http://schemas.openxmlformats.org/package/2006/content-types}"
+OFFICE_DOCUMENT_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"
+IMAGE_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/image"
+
+@dataclass
+class DocxImageRef:
+    """Một ảnh được main document tham chiếu qua relationship ID."""
+    rel_id: str
+    partname: str
+    content_type: str
+    
+    @property
+    def name(self) -> str:
+        return posixpath.basename(self.partname)
+
+class DocxSource:
+    """Một ZipFile handle phục vụ cả body XML lẫn media của một DOCX.
+    
+    docx_file có thể là đường dẫn (đọc thẳng từ đĩa), bytes, hoặc stream
+    seekable như Streamlit UploadedFile/BytesIO (dùng chính buffer đó).
+    Handle phải còn mở khi đọc ảnh lazy, nên caller giữ source tới khi xong.
+    """
+    
+    def __init__(self, docx_file):
+        if isinstance(docx_file, (str, Path)):
+            self._zip = ZipFile(docx_file, 'r')
+        elif isinstance(docx_file, bytes):
+            # BytesIO over immutable bytes shares the buffer instead of copying it
+            self._zip = ZipFile(io.BytesIO(docx_file), 'r')
+        else:
+            docx_file.seek(0)
+            self._zip = ZipFile(docx_file, 'r')
+            
+        # Uploads are shared file objects; serialize reads from compile threads
+        self._lock = threading.Lock()
+        self._body = None
+        
+        self.document_partname = self._find_document_partname()
+        self._content_types = self._read_content_types()
+        self.images = self._read_image_relationships()
+        
+    def read_part(self, partname: str) -> bytes:
+        with self._lock:
+            return self._zip.read(partname)
+            
+    @property
+    def body(self):
+        """w:body của main document (parse một lần, chỉ đọc part này)."""
+        if self._body is None:
+            self._body = parse_xml(self.read_part(self.document_partname)).body
+        return self._body
+        
+    def read_image(self, rel_id: str) -> Optional[bytes]:
+        """Bytes của ảnh theo relationship ID; None nếu không phải ảnh nội bộ."""
+        image = self.images.get(rel_id)
+        if image is None:
+            return None
+        return self.read_part(image.partname)
+        
+    def close(self) -> None:
+        with self._lock:
+            self._zip.close()
+            
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, *exc_info):
+        self.close()
+        
+    def _read_xml(self, partname: str) -> Optional[ElementTree.Element]:
+        try:
+            return ElementTree.fromstring(self.read_part(partname))
+        except (KeyError, ElementTree.ParseError):
+            return None
+            
+    def _find_document_partname(self) -> str:
+        rels = self._read_xml(PACKAGE_RELS_PART)
+        if rels is not None:
+            for rel in rels.iter(f"{RELS_NS}Relationship"):
+                if rel.get("Type") == OFFICE_DOCUMENT_REL and rel.get("TargetMode") != "External":
+                    return self._resolve_target("", rel.get("Target", ""))
+        return DEFAULT_DOCUMENT_PART
+        
+    def _read_content_types(self) -> Dict[str, str]:
+        """partname/extension -> content type từ [Content_Types].xml."""
+        content_types = {}
+        types_xml = self._read_xml(CONTENT_TYPES_PART)
+        if types_xml is None:
+            return content_types
+            
+        for default in types_xml.iter(f"{CONTENT_TYPES_NS}Default"):
+            content_types["." + default.get("Extension", "").lower()] = default.get("ContentType", "")
+        for override in types_xml.iter(f"{CONTENT_TYPES_NS}Override"):
+            content_types[override.get("PartName", "").lstrip("/")] = override.get("ContentType", "")
+        return content_types
+        
+    def _content_type(self, partname: str) -> str:
+        content_type = self._content_types.get(partname)
+        if content_type is None:
+            extension = posixpath.splitext(partname)[1].lower()
+            content_type = self._content_types.get(extension) or mimetypes.guess_type(partname)[0] or ""
+        return content_type
+        
+    def _read_image_relationships(self) -> Dict[str, DocxImageRef]:
+        """rId -> ảnh từ relationships của main document."""
+        doc_dir, doc_name = posixpath.split(self.document_partname)
+        rels = self._read_xml(posixpath.join(doc_dir, "_rels", f"{doc_name}.rels"))
+        images = {}
+        if rels is None:
+            return images
+            
+        for rel in rels.iter(f"{RELS_NS}Relationship"):
+            if rel.get("TargetMode") == "External":
+                continue
+            partname = self._resolve_target(doc_dir, rel.get("Target", ""))
+            content_type = self._content_type(partname)
+            if rel.get("Type") == IMAGE_REL or content_type.startswith("image/"):
+                images[rel.get("Id")] = DocxImageRef(rel.get("Id"), partname, content_type or "image/jpeg")
+        return images
+        
+    def _resolve_target(self, base_dir: str, target: str) -> str:
+        if target.startswith("/"):
+            return posixpath.normpath(target.lstrip("/"))
+        return posixpath.normpath(posixpath.join(base_dir, target))
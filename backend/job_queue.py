@@ -0,0 +1,410 @@
+"""
+SQLite-backed job queue cho quiz generation.
+UI chỉ submit job và poll status; một hoặc nhiều worker processes claim job
+và chạy pipeline qua checkpointed jobs (quiz_jobs), nên Streamlit không bị
+block và throughput tăng theo số worker.
+
+Chạy workers riêng:  python -m backend.job_queue --workers 2
+(API key lấy từ GOOGLE_API_KEY, không bao giờ lưu vào queue).
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from .quiz_jobs import QuizJobStore, JobHeartbeat
+
+logger = logging.getLogger(__name__)
+
+QUEUE_STATUS_QUEUED = "queued"
+QUEUE_STATUS_RUNNING = "running"
+QUEUE_STATUS_COMPLETED = "completed"
+QUEUE_STATUS_FAILED = "failed"
+QUEUE_STATUS_CANCELLED = "cancelled"
+
+# Worker heartbeat chạy trên timer thread riêng (mỗi JOB_HEARTBEAT_INTERVAL giây), nên
+# chỉ worker đã chết mới im lặng lâu như vậy; phải lớn hơn hẳn retry_deadline của agent
+QUEUE_STALE_AFTER = 900
+
+class QuizJobQueue:
+    """Queue lưu trong SQLite; claim là atomic nên an toàn với nhiều processes.
+    
+    Mỗi claim có một claim_token riêng: heartbeat, progress, finish và checkpoint
+    của worker chỉ có hiệu lực khi token còn khớp, nên worker bị coi là chết
+    (và job đã bị claim lại) không thể ghi chồng lên worker mới. Token chỉ nằm
+    trong SQLite; checkpoint kiểm tra nó qua claim_fence của job store.
+    """
+    
+    def __init__(self, db_path: str = None, jobs_dir: str = None, stale_after: float = QUEUE_STALE_AFTER):
+        self.db_path = Path(db_path or os.getenv("QUIZ_JOB_QUEUE_DB", "quiz_storage/job_queue.db"))
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.job_store = QuizJobStore(jobs_dir or os.getenv("QUIZ_JOBS_DIR", "quiz_storage/jobs"))
+        self.job_store.claim_fence = self._claim_fence
+        self.stale_after = stale_after
+        
+        conn = self._connect()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS queue (
+                    job_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    config TEXT NOT NULL DEFAULT '{}',
+                    options TEXT NOT NULL DEFAULT '{}',
+                    submitted_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    heartbeat_at REAL,
+                    worker TEXT,
+                    claim_token TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    completed INTEGER NOT NULL DEFAULT 0,
+                    total INTEGER NOT NULL DEFAULT 0,
+                    message TEXT NOT NULL DEFAULT '',
+                    error TEXT NOT NULL DEFAULT ''
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_queue_status ON queue(status, submitted_at)")
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(queue)")}
+            if "claim_token" not in columns:
+                conn.execute("ALTER TABLE queue ADD COLUMN claim_token TEXT")
+        finally:
+            conn.close()
+            
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+        
+    def submit(self, answer_data: Union[str, bytes], docx_bytes: bytes, answer_type: str = "text",
+               config: Dict[str, Any] = None, options: Dict[str, Any] = None,
+               source_name: str = "") -> str:
+        """Lưu input thành job và đưa vào hàng đợi. Returns job_id."""
+        job_id = self.job_store.create_job(
+            answer_data, docx_bytes, answer_type, extra={"source_name": source_name, "queued": True}
+        )
+        
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO queue (job_id, status, config, options, submitted_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, QUEUE_STATUS_QUEUED, json.dumps(config or {}),
+                 json.dumps(options or {}, ensure_ascii=False), time.time())
+            )
+        finally:
+            conn.close()
+            
+        logger.info(f"📥 Queued job {job_id}")
+        return job_id
+        
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        """Atomically claim the oldest queued job (hoặc job running có heartbeat quá hạn).
+        
+        Job trả về có claim_token mới; token cũ (nếu có) mất hiệu lực ngay.
+        """
+        now = time.time()
+        claim_token = uuid.uuid4().hex
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                """
+                SELECT * FROM queue
+                WHERE status = ? OR (status = ? AND heartbeat_at < ?)
+                ORDER BY submitted_at ASC LIMIT 1
+                """,
+                (QUEUE_STATUS_QUEUED, QUEUE_STATUS_RUNNING, now - self.stale_after)
+            ).fetchone()
+            
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+                
+            conn.execute(
+                """
+                UPDATE queue SET status = ?, worker = ?, claim_token = ?, started_at = COALESCE(started_at, ?),
+                                 heartbeat_at = ?, attempts = attempts + 1
+                WHERE job_id = ?
+                """,
+                (QUEUE_STATUS_RUNNING, worker, claim_token, now, now, row["job_id"])
+            )
+            conn.execute("COMMIT")
+            
+            job = self._row_to_dict(row)
+            job["attempts"] += 1
+            job["worker"] = worker
+            job["claim_token"] = claim_token
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return job
+        
+    @contextmanager
+    def _claim_fence(self, job_id: str, claim_token: str) -> Iterator[bool]:
+        """Yields claim còn hiệu lực không; giữ write lock của SQLite đến khi thoát,
+        nên claim() của process khác không thể đổi token giữa lúc kiểm tra và ghi."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT 1 FROM queue WHERE job_id = ? AND claim_token = ?", (job_id, claim_token)
+            ).fetchone()
+            yield row is not None
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+            
+    def _update(self, job_id: str, claim_token: str = None, **fields) -> bool:
+        """UPDATE một job; với claim_token chỉ áp dụng khi token còn khớp và job vẫn running
+        (job đã cancelled là terminal). Returns có row nào đổi."""
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        query = f"UPDATE queue SET {columns} WHERE job_id = ?"
+        params = [*fields.values(), job_id]
+        if claim_token is not None:
+            query += " AND claim_token = ? AND status = ?"
+            params.extend([claim_token, QUEUE_STATUS_RUNNING])
+        conn = self._connect()
+        try:
+            return conn.execute(query, params).rowcount > 0
+        finally:
+            conn.close()
+            
+    def heartbeat(self, job_id: str, claim_token: str = None) -> bool:
+        """Làm mới heartbeat; False nếu claim đã mất (job bị worker khác claim lại hoặc đã bị hủy)."""
+        return self._update(job_id, claim_token, heartbeat_at=time.time())
+        
+    def report_progress(self, job_id: str, completed: int = None, total: int = None, message: str = None,
+                        claim_token: str = None) -> bool:
+        """Cập nhật tiến độ + heartbeat của job đang chạy."""
+        fields = {"heartbeat_at": time.time()}
+        if completed is not None:
+            fields["completed"] = completed
+        if total is not None:
+            fields["total"] = total
+        if message is not None:
+            fields["message"] = message
+        return self._update(job_id, claim_token, **fields)
+        
+    def finish(self, job_id: str, status: str, error: str = "", claim_token: str = None) -> bool:
+        return self._update(job_id, claim_token, status=status, error=error,
+                            finished_at=time.time(), heartbeat_at=time.time())
+        
+    def cancel(self, job_id: str) -> bool:
+        """Hủy job queued hoặc running; worker đang chạy dừng ở heartbeat/report_progress kế tiếp
+        và không thể ghi đè trạng thái cancelled."""
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "UPDATE queue SET status = ?, finished_at = ? WHERE job_id = ? AND status IN (?, ?)",
+                (QUEUE_STATUS_CANCELLED, time.time(), job_id, QUEUE_STATUS_QUEUED, QUEUE_STATUS_RUNNING)
+            )
+            return cursor.rowcount > 0
+        finally:
+            conn.close()
+            
+    def get_status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM queue WHERE job_id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return self._row_to_dict(row) if row else None
+        
+    def list_jobs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT * FROM queue ORDER BY submitted_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [self._row_to_dict(row) for row in rows]
+        
+    def _row_to_dict(self, row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["config"] = json.loads(job["config"] or "{}")
+        job["options"] = json.loads(job["options"] or "{}")
+        return job
+        
+    def save_results(self, job_id: str, results: Dict[str, Any]) -> None:
+        """Lưu results đầy đủ cạnh checkpoint của job để UI đọc lại."""
+        results_file = self.job_store.jobs_dir / job_id / "results.json"
+        tmp_file = results_file.with_suffix(".json.tmp")
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, default=str)
+        os.replace(tmp_file, results_file)
+        
+    def load_results(self, job_id: str) -> Optional[Dict[str, Any]]:
+        results_file = self.job_store.jobs_dir / job_id / "results.json"
+        if not results_file.exists():
+            return None
+        with open(results_file, 'r', encoding='utf-8') as f:
+            results = json.load(f)
+        # JSON object keys are strings; the pipeline uses int question numbers
+        for key in ("parsed_answers", "question_blocks"):
+            if isinstance(results.get(key), dict):
+                results[key] = {int(k) if k.isdigit() else k: v for k, v in results[key].items()}
+        return results
+
+def run_worker(api_key: str = None, db_path: str = None, jobs_dir: str = None,
+               poll_interval: float = 2.0, stop_event=None, max_jobs: int = None) -> None:
+    """Worker loop: claim job → chạy checkpointed pipeline → ghi kết quả."""
+    # Imported here so the queue itself stays usable without the Gemini stack
+    from .simple_agent import EnhancedMultimodalQuizAgent
+    
+    job_queue = QuizJobQueue(db_path, jobs_dir)
+    job_queue.job_store.prune_expired()
+    worker_name = f"{socket.gethostname()}:{os.getpid()}"
+    agent = EnhancedMultimodalQuizAgent(api_key=api_key, job_store=job_queue.job_store)
+    base_config = dict(agent.config)
+    processed = 0
+    
+    if job_queue.stale_after <= 2 * agent.config["retry_deadline"]:
+        logger.warning(
+            f"⚠️ stale_after ({job_queue.stale_after}s) nên lớn hơn nhiều retry_deadline "
+            f"({agent.config['retry_deadline']}s)"
+        )
+    
+    logger.info(f"👷 Worker {worker_name} started")
+    
+    while not (stop_event and stop_event.is_set()):
+        if max_jobs is not None and processed >= max_jobs:
+            break
+            
+        job = job_queue.claim(worker_name)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+            
+        job_id = job["job_id"]
+        claim_token = job["claim_token"]
+        agent.config = {**base_config, **job["config"]}
+        last_report = 0.0
+        logger.info(f"⚙️ Worker {worker_name} running {job_id} (attempt {job['attempts']})")
+        
+        def beat() -> None:
+            if not job_queue.heartbeat(job_id, claim_token):
+                logger.warning(f"⚠️ Worker {worker_name} lost the claim on {job_id} (or it was cancelled), stopping")
+                agent.cancel()
+        
+        def on_progress(event: Dict[str, Any]) -> None:
+            nonlocal last_report
+            kind = event["event"]
+            if "completed" in event and "total" in event:
+                message = f"Câu {event.get('so_cau', '')} ({event['completed']}/{event['total']})"
+                completed, total = event["completed"], event["total"]
+            else:
+                message, completed, total = kind, None, None
+                
+            # Throttle SQLite writes; always report stage changes
+            now = time.time()
+            if kind == "stage" or now - last_report >= 1.0:
+                last_report = now
+                if not job_queue.report_progress(job_id, completed, total, message, claim_token):
+                    agent.cancel()
+                    
+        try:
+            with JobHeartbeat(beat):
+                results = agent.process_quiz_job(job_id=job_id, progress_callback=on_progress,
+                                                 claim_token=claim_token)
+                
+            if results.get("claim_lost"):
+                # Another worker owns the job now; leave its results and status alone
+                logger.warning(f"⚠️ Worker {worker_name} dropped {job_id} after losing its claim")
+            else:
+                job_queue.save_results(job_id, results)
+                
+                if results.get("cancelled"):
+                    job_queue.finish(job_id, QUEUE_STATUS_CANCELLED, claim_token=claim_token)
+                elif results.get("success"):
+                    job_queue.report_progress(job_id, len(results["compiled_questions"]), message="done",
+                                              claim_token=claim_token)
+                    job_queue.finish(job_id, QUEUE_STATUS_COMPLETED, claim_token=claim_token)
+                else:
+                    job_queue.finish(job_id, QUEUE_STATUS_FAILED, "; ".join(results.get("errors", [])),
+                                     claim_token=claim_token)
+        except Exception as e:
+            logger.error(f"❌ Job {job_id} failed: {e}")
+            job_queue.finish(job_id, QUEUE_STATUS_FAILED, str(e), claim_token=claim_token)
+            
+        processed += 1
+        
+    logger.info(f"👋 Worker {worker_name} stopped")
+
+_local_workers: List[multiprocessing.Process] = []
+_local_workers_lock = threading.Lock()
+
+def ensure_local_workers(api_key: str, count: int = 1, db_path: str = None, jobs_dir: str = None) -> int:
+    """Start worker processes owned by this process (idempotent across Streamlit reruns).
+    
+    API key chỉ được truyền qua memory cho process con, không ghi ra queue.
+    Returns số worker đang sống.
+    """
+    with _local_workers_lock:
+        _local_workers[:] = [p for p in _local_workers if p.is_alive()]
+        
+        while len(_local_workers) < count:
+            process = multiprocessing.Process(
+                target=run_worker,
+                kwargs={"api_key": api_key, "db_path": db_path, "jobs_dir": jobs_dir},
+                name=f"quiz-worker-{len(_local_workers) + 1}",
+                daemon=True
+            )
+            process.start()
+            _local_workers.append(process)
+            
+        return len(_local_workers)
+
+def main():
+    parser = argparse.ArgumentParser(description="QuizForce generation workers")
+    parser.add_argument("--workers", type=int, default=1, help="Số worker processes")
+    parser.add_argument("--db", default=None, help="Đường dẫn SQLite queue")
+    parser.add_argument("--jobs-dir", default=None, help="Thư mục checkpoint của jobs")
+    parser.add_argument("--poll", type=float, default=2.0, help="Chu kỳ poll (giây)")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(processName)s - %(message)s')
+    
+    if not os.getenv("GOOGLE_API_KEY"):
+        print("❌ Cần GOOGLE_API_KEY trong environment để chạy workers")
+        return
+        
+    print(f"👷 Starting {args.workers} worker(s) - Ctrl+C để dừng")
+    processes = [
+        multiprocessing.Process(
+            target=run_worker,
+            kwargs={"db_path": args.db, "jobs_dir": args.jobs_dir, "poll_interval": args.poll},
+            name=f"quiz-worker-{i + 1}"
+        )
+        for i in range(args.workers)
+    ]
+    
+    for process in processes:
+        process.start()
+        
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        print("\n⏹️ Stopping workers...")
+        for process in processes:
+            process.terminate()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+LLM backends cho QuizMaster agent.
+GeminiBackend gọi Google Gemini thật; FakeLLMBackend là stand-in local,
+deterministic - trả về JSON giống thật theo từng task, có latency cấu hình
+được và có thể inject lỗi 429 (kèm retry_delay) hoặc output hỏng để
+benchmark concurrency, batching và retry mà không tốn quota.
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import Any, Dict, List, Union
+
+from PIL import Image
+
+class LLMBackend(ABC):
+    """Interface tối thiểu mà agent cần từ một model backend."""
+    
+    name = "base"
+    
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        
+    @abstractmethod
+    def generate(self, content: Union[str, List[Any]], metadata: Dict[str, Any] = None) -> str:
+        """Gửi prompt (text hoặc list text/PIL images) và trả về response text.
+        
+        Lỗi được raise dưới dạng Exception với message giống API thật để agent
+        phân loại (quota/safety/invalid) như bình thường.
+        """
+
+class GeminiBackend(LLMBackend):
+    """Google Gemini qua google-generativeai."""
+    
+    name = "gemini"
+    
+    def __init__(self, api_key: str, model_name: str = "gemini-2.0-flash"):
+        super().__init__(model_name)
+        # Imported lazily so offline/fake runs don't need the SDK configured
+        import google.generativeai as genai
+        
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model_name)
+        
+    def generate(self, content: Union[str, List[Any]], metadata: Dict[str, Any] = None) -> str:
+        response = self.model.generate_content(content)
+        return self._extract_response_text(response)
+        
+    def _extract_response_text(self, response) -> str:
+        """Safely extract text from Gemini response."""
+        try:
+            # Handle different response types
+            if hasattr(response, 'text'):
+                return response.text
+            elif hasattr(response, 'candidates') and response.candidates:
+                candidate = response.candidates[0]
+                if hasattr(candidate, 'content'):
+                    return candidate.content.parts[0].text
+                    
+            # Fallback
+            return str(response)
+            
+        except Exception:
+            return str(response)
+
+class FakeLLMBackend(LLMBackend):
+    """Deterministic local stand-in cho Gemini.
+    
+    Chạy in-process (gọi thẳng generate(), không có HTTP server giả): đo được
+    retry, batching và concurrency của agent, nhưng không đo network/serialization.
+    
+    Mọi quyết định (latency jitter, lỗi inject) được suy ra từ hash của prompt
+    và số lần prompt đó đã được gửi, nên kết quả lặp lại được bất kể thứ tự
+    threads; retry cùng prompt có thể thành công ở lần sau.
+    
+    latency: giây cố định mỗi request; latency_jitter: thêm tối đa bấy nhiêu giây;
+    latency_per_1k_chars: thêm theo độ dài prompt.
+    rate_limit_rate / server_error_rate / malformed_rate: xác suất (0-1) trả về
+    429 kèm retry_delay, lỗi 503, hoặc JSON hỏng.
+    """
+    
+    name = "fake"
+    
+    def __init__(self, model_name: str = "fake-gemini", latency: float = 0.0,
+                 latency_jitter: float = 0.0, latency_per_1k_chars: float = 0.0,
+                 rate_limit_rate: float = 0.0, retry_delay: int = 2,
+                 server_error_rate: float = 0.0, malformed_rate: float = 0.0,
+                 ocr_answer_count: int = 40, seed: int = 0):
+        super().__init__(model_name)
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.latency_per_1k_chars = latency_per_1k_chars
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_delay = retry_delay
+        self.server_error_rate = server_error_rate
+        self.malformed_rate = malformed_rate
+        self.ocr_answer_count = ocr_answer_count
+        self.seed = seed
+        
+        self._lock = threading.Lock()
+        self._prompt_counts = Counter()
+        self.stats = Counter()
+        
+    def _roll(self, digest: str, salt: str) -> float:
+        """Deterministic pseudo-random number in [0, 1)."""
+        value = hashlib.sha256(f"{self.seed}:{digest}:{salt}".encode()).hexdigest()[:8]
+        return int(value, 16) / 0x100000000
+        
+    def _prompt_text(self, content: Union[str, List[Any]]) -> str:
+        parts = content if isinstance(content, list) else [content]
+        return "\n".join(part for part in parts if isinstance(part, str))
+        
+    def _content_digest(self, content: Union[str, List[Any]]) -> str:
+        digest = hashlib.sha256()
+        parts = content if isinstance(content, list) else [content]
+        for part in parts:
+            if isinstance(part, str):
+                digest.update(part.encode("utf-8"))
+            elif isinstance(part, Image.Image):
+                digest.update(f"{part.mode}:{part.size}".encode())
+                digest.update(part.tobytes()[:4096])
+        return digest.hexdigest()
+        
+    def generate(self, content: Union[str, List[Any]], metadata: Dict[str, Any] = None) -> str:
+        metadata = metadata or {}
+        task = metadata.get("task", "unknown")
+        prompt = self._prompt_text(content)
+        digest = self._content_digest(content)
+        
+        with self._lock:
+            self._prompt_counts[digest] += 1
+            attempt = self._prompt_counts[digest]
+            self.stats["requests"] += 1
+            self.stats[f"task:{task}"] += 1
+            
+        delay = (self.latency
+                 + self.latency_jitter * self._roll(digest, f"latency:{attempt}")
+                 + self.latency_per_1k_chars * len(prompt) / 1000)
+        if delay > 0:
+            time.sleep(delay)
+            
+        if self._roll(digest, f"429:{attempt}") < self.rate_limit_rate:
+            self._count("injected_429")
+            raise Exception(
+                "429 Resource has been exhausted (e.g. check quota). "
+                f"[violations {{ quota_metric: \"generate_content_free_tier_requests\" }}, "
+                f"retry_delay {{ seconds: {self.retry_delay} }}]"
+            )
+            
+        if self._roll(digest, f"503:{attempt}") < self.server_error_rate:
+            self._count("injected_503")
+            raise Exception("503 The service is currently unavailable.")
+            
+        response = self._respond(task, prompt, digest)
+        
+        if self._roll(digest, f"malformed:{attempt}") < self.malformed_rate:
+            self._count("injected_malformed")
+            # Truncated mid-object, like a response cut off by max tokens
+            return "Đây là kết quả:\n```json\n" + response[:max(1, len(response) // 2)]
+            
+        return response
+        
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+            
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.stats)
+            
+    def _respond(self, task: str, prompt: str, digest: str) -> str:
+        """Build a realistic JSON response for the agent task."""
+        if task == "compile_question":
+            return json.dumps(self._compile_from_prompt(prompt), ensure_ascii=False, indent=2)
+            
+        if task == "compile_question_batch":
+            blocks = re.findall(
+                r'=== CÂU so_cau=(\d+) \| dap_an=(\w*) ===\n(.*?)(?=\n\n=== CÂU so_cau=|\Z)',
+                self._section(prompt, "NỘI DUNG:", "CHỈ TRẢ VỀ JSON"), re.DOTALL
+            )
+            compiled = [
+                self._compile_question(int(num), text.strip(), answer)
+                for num, answer, text in blocks
+            ]
+            return "```json\n" + json.dumps(compiled, ensure_ascii=False, indent=2) + "\n```"
+            
+        if task == "parse_text_answers":
+            pairs = re.findall(
+                r'(?<!\d)(\d{1,4})\s*[\.\):\-]?\s*([A-Da-d])(?![A-Za-z])',
+                self._section(prompt, "VĂN BẢN PHÂN TÍCH:", "VÍ DỤ CHUẨN:")
+            )
+            return json.dumps({num: answer.upper() for num, answer in pairs})
+            
+        if task == "ocr_image_answers":
+            return json.dumps({
+                str(i): "ABCD"[int(self._roll(digest, f"answer:{i}") * 4)]
+                for i in range(1, self.ocr_answer_count + 1)
+            })
+            
+        if task == "ai_extract_questions":
+            blocks = re.split(
+                r'\n(?=(?:Câu\s*)?\d+[\.:\)])', self._section(prompt, "VĂN BẢN:", "CHỈ TRẢ VỀ JSON")
+            )
+            questions = {}
+            for block in blocks:
+                match = re.match(r'(?:Câu\s*)?(\d+)[\.:\)]\s*(.+)', block.strip(), re.DOTALL)
+                if match and len(match.group(2)) > 50:
+                    questions[match.group(1)] = match.group(2).strip()
+            return json.dumps(questions, ensure_ascii=False)
+            
+        return "{}"
+        
+    def _section(self, prompt: str, start: str, end: str) -> str:
+        """Text between two prompt markers (whole prompt if the markers are missing)."""
+        return prompt.split(start, 1)[-1].split(end, 1)[0]
+        
+    def _compile_from_prompt(self, prompt: str) -> Dict[str, Any]:
+        num = re.search(r'"so_cau":\s*(\d+)', prompt)
+        answer = re.search(r'"dap_an":\s*"(\w*)"', prompt)
+        text = self._section(prompt, "NỘI DUNG:", "CHỈ TRẢ VỀ JSON")
+        return self._compile_question(
+            int(num.group(1)) if num else 0, text.strip(), answer.group(1) if answer else ""
+        )
+        
+    def _compile_question(self, question_num: int, text: str, answer: str) -> Dict[str, Any]:
+        """Split a raw block into stem + A-D choices, like the real model would."""
+        text = re.sub(r'^(?:Câu|Question|Bài)?\s*\d+\s*[\.:\)]\s*', '', text.strip(), flags=re.IGNORECASE)
+        parts = re.split(r'(?:^|\s)([A-D])[\.\)]\s+', text)
+        stem = parts[0].strip()
+        choices = {letter: choice.strip() for letter, choice in zip(parts[1::2], parts[2::2])}
+        
+        return {
+            "so_cau": question_num,
+            "cau_hoi": stem or text[:200],
+            "lua_chon": {letter: choices.get(letter, f"Lựa chọn {letter}") for letter in "ABCD"},
+            "dap_an": answer,
+            "do_kho": "trung_binh",
+            "mon_hoc": "auto_detect",
+            "ghi_chu": f"Generated by {self.model_name}"
+        }
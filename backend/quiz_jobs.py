@@ -0,0 +1,334 @@
+"""
+Checkpointed quiz-generation jobs.
+Mỗi job có một thư mục quiz_storage/jobs/<job_id>/ chứa input (đáp án + DOCX),
+meta.json và questions.jsonl - mỗi câu biên dịch xong được append ngay,
+nên job có thể resume sau crash/refresh mà không biên dịch lại.
+Job hoàn tất được giải phóng input (DOCX, đáp án); job không còn cập nhật
+quá QUIZ_JOBS_MAX_AGE_DAYS ngày bị xóa hẳn.
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUS_PENDING = "pending"
+JOB_STATUS_RUNNING = "running"
+JOB_STATUS_COMPLETED = "completed"
+JOB_STATUS_CANCELLED = "cancelled"
+JOB_STATUS_FAILED = "failed"
+
+# Job "running" chỉ resume được khi heartbeat đã quá hạn (xem QuizJobStore.is_resumable)
+RESUMABLE_STATUSES = (JOB_STATUS_PENDING, JOB_STATUS_CANCELLED, JOB_STATUS_FAILED)
+
+JOB_HEARTBEAT_INTERVAL = 15  # giây giữa hai heartbeat của job đang chạy
+JOB_STALE_AFTER = 120  # job "running" không heartbeat lâu hơn thế được coi là đã chết
+DEFAULT_MAX_AGE_DAYS = 7
+
+class JobHeartbeat:
+    """Gọi `beat()` định kỳ trên daemon thread cho tới khi stop().
+    
+    Heartbeat độc lập với progress events, nên một request dài (retry, quota
+    wait) không làm job trông như đã chết. Dùng như context manager.
+    """
+    
+    def __init__(self, beat: Callable[[], None], interval: float = JOB_HEARTBEAT_INTERVAL):
+        self._beat = beat
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="job-heartbeat", daemon=True)
+        
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self._beat()
+            except Exception as e:
+                logger.warning(f"⚠️ Heartbeat failed: {e}")
+                
+    def start(self) -> "JobHeartbeat":
+        self._thread.start()
+        return self
+        
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=self.interval + 5)
+            
+    def __enter__(self) -> "JobHeartbeat":
+        return self.start()
+        
+    def __exit__(self, *exc_info):
+        self.stop()
+
+def write_docx_input(target: Path, docx_file) -> None:
+    """Ghi DOCX input ra `target` từ path, bytes/memoryview, hoặc upload/stream.
+    
+    Upload có getbuffer() (Streamlit UploadedFile, BytesIO) được ghi thẳng từ
+    buffer của nó, không tạo bản copy trung gian.
+    """
+    if isinstance(docx_file, (str, Path)):
+        shutil.copyfile(docx_file, target)
+    elif isinstance(docx_file, (bytes, bytearray, memoryview)):
+        target.write_bytes(docx_file)
+    elif hasattr(docx_file, "getbuffer"):
+        with docx_file.getbuffer() as buffer:
+            target.write_bytes(buffer)
+    else:
+        docx_file.seek(0)
+        with open(target, 'wb') as f:
+            shutil.copyfileobj(docx_file, f)
+
+def docx_input_name(docx_file) -> str:
+    """Tên file gốc của DOCX input (rỗng với bytes)."""
+    if isinstance(docx_file, (str, Path)):
+        return Path(docx_file).name
+    return getattr(docx_file, "name", "") or ""
+
+class QuizJobStore:
+    """Filesystem store cho quiz-generation jobs và checkpoints của chúng."""
+    
+    def __init__(self, jobs_dir: str = "quiz_storage/jobs", max_age_days: float = None):
+        """max_age_days: prune_expired() xóa jobs không cập nhật lâu hơn số ngày này
+        (0 = giữ mãi); mặc định từ QUIZ_JOBS_MAX_AGE_DAYS hoặc 7 ngày."""
+        self.jobs_dir = Path(jobs_dir)
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # Set by the job queue: claim_fence(job_id, claim_token) is a context manager that
+        # yields whether the claim is still valid and keeps it from changing until exit
+        self.claim_fence: Optional[Callable[[str, str], ContextManager[bool]]] = None
+        
+        if max_age_days is None:
+            max_age_days = float(os.getenv("QUIZ_JOBS_MAX_AGE_DAYS", DEFAULT_MAX_AGE_DAYS))
+        self.max_age_days = max_age_days
+        
+    def _job_dir(self, job_id: str) -> Path:
+        return self.jobs_dir / job_id
+        
+    def _write_meta(self, job_id: str, meta: Dict[str, Any]) -> None:
+        """Atomic write: ghi ra file tạm rồi os.replace."""
+        meta_file = self._job_dir(job_id) / "meta.json"
+        tmp_file = meta_file.with_suffix(".json.tmp")
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, meta_file)
+        
+    def create_job(self, answer_data: Union[str, bytes], docx_file,
+                   answer_type: str = "text", job_id: str = None,
+                   extra: Dict[str, Any] = None) -> str:
+        """Lưu input của job và trả về job_id.
+        
+        docx_file: path, bytes/memoryview hoặc upload (xem write_docx_input).
+        """
+        job_id = job_id or f"job_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        job_dir = self._job_dir(job_id)
+        job_dir.mkdir(parents=True, exist_ok=True)
+        
+        if isinstance(answer_data, str):
+            (job_dir / "answers.txt").write_text(answer_data, encoding='utf-8')
+        else:
+            (job_dir / "answers.bin").write_bytes(answer_data)
+        write_docx_input(job_dir / "source.docx", docx_file)
+        (job_dir / "questions.jsonl").touch()
+        
+        now = datetime.now().isoformat()
+        self._write_meta(job_id, {
+            "job_id": job_id,
+            "status": JOB_STATUS_PENDING,
+            "answer_type": answer_type,
+            "source_name": docx_input_name(docx_file),
+            "created_time": now,
+            "updated_time": now,
+            "checkpointed_questions": 0,
+            **(extra or {})
+        })
+        
+        logger.info(f"🗂️ Created job {job_id}")
+        return job_id
+        
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Đọc meta.json của job; None nếu không tồn tại."""
+        meta_file = self._job_dir(job_id) / "meta.json"
+        if not meta_file.exists():
+            return None
+        try:
+            with open(meta_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"⚠️ Không đọc được meta của job {job_id}: {e}")
+            return None
+            
+    def update_job(self, job_id: str, **fields) -> Optional[Dict[str, Any]]:
+        """Merge `fields` vào meta.json."""
+        with self._lock:
+            meta = self.get_job(job_id)
+            if meta is None:
+                return None
+            meta.update(fields)
+            meta["updated_time"] = datetime.now().isoformat()
+            self._write_meta(job_id, meta)
+            return meta
+            
+    def heartbeat(self, job_id: str) -> None:
+        """Đánh dấu job đang chạy còn sống."""
+        self.update_job(job_id, heartbeat_at=time.time())
+        
+    def is_stale(self, meta: Dict[str, Any], stale_after: float = JOB_STALE_AFTER) -> bool:
+        """Job "running" không heartbeat trong stale_after giây (process chạy nó đã chết)."""
+        return time.time() - meta.get("heartbeat_at", 0) > stale_after
+        
+    def is_resumable(self, meta: Dict[str, Any], stale_after: float = JOB_STALE_AFTER) -> bool:
+        status = meta.get("status")
+        return status in RESUMABLE_STATUSES or (status == JOB_STATUS_RUNNING and self.is_stale(meta, stale_after))
+        
+    def _iter_recent_jobs(self) -> Iterator[Dict[str, Any]]:
+        """Meta của jobs theo thứ tự cập nhật gần nhất trước; chỉ parse khi được lấy tới."""
+        entries = []
+        for job_dir in self.jobs_dir.iterdir():
+            try:
+                entries.append(((job_dir / "meta.json").stat().st_mtime, job_dir.name))
+            except OSError:
+                continue
+        for _, job_id in sorted(entries, reverse=True):
+            meta = self.get_job(job_id)
+            if meta:
+                yield meta
+                
+    def list_jobs(self, statuses: Tuple[str, ...] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """Tối đa `limit` jobs cập nhật gần nhất (mới tạo nhất trước), lọc theo status nếu có."""
+        return self._select_jobs(lambda meta: statuses is None or meta.get("status") in statuses, limit)
+        
+    def list_resumable_jobs(self, limit: int = 20, stale_after: float = JOB_STALE_AFTER) -> List[Dict[str, Any]]:
+        """Jobs chưa hoàn tất có thể resume, kể cả job "running" đã mất heartbeat."""
+        return self._select_jobs(lambda meta: self.is_resumable(meta, stale_after), limit)
+        
+    def _select_jobs(self, predicate: Callable[[Dict[str, Any]], bool], limit: int) -> List[Dict[str, Any]]:
+        jobs = []
+        for meta in self._iter_recent_jobs():
+            if predicate(meta):
+                jobs.append(meta)
+                if limit and len(jobs) >= limit:
+                    break
+        return sorted(jobs, key=lambda m: m.get("created_time", ""), reverse=True)
+        
+    def load_inputs(self, job_id: str) -> Tuple[Union[str, bytes], Path, str]:
+        """Trả về (answer_data, đường dẫn DOCX, answer_type) đã lưu của job.
+        
+        DOCX được trả về dưới dạng path để agent mở ZipFile thẳng trên đĩa
+        thay vì đọc cả file vào RAM.
+        """
+        job_dir = self._job_dir(job_id)
+        meta = self.get_job(job_id)
+        if meta is None:
+            raise FileNotFoundError(f"Job not found: {job_id}")
+        if meta.get("inputs_released"):
+            raise FileNotFoundError(f"Job {job_id} đã hoàn tất, input đã được giải phóng")
+            
+        text_file = job_dir / "answers.txt"
+        if text_file.exists():
+            answer_data = text_file.read_text(encoding='utf-8')
+        else:
+            answer_data = (job_dir / "answers.bin").read_bytes()
+            
+        return answer_data, job_dir / "source.docx", meta.get("answer_type", "text")
+        
+    def append_question(self, job_id: str, question: Dict[str, Any], claim_token: str = None) -> bool:
+        """Checkpoint một câu đã biên dịch (append + fsync).
+        
+        Với claim_token (job chạy qua queue), append chạy bên trong claim_fence nên
+        việc kiểm tra token và ghi là atomic với claim của worker khác (kể cả process
+        khác); returns False nếu worker khác đã claim job.
+        """
+        line = json.dumps(question, ensure_ascii=False, default=str)
+        questions_file = self._job_dir(job_id) / "questions.jsonl"
+        if claim_token is None:
+            with self._lock:
+                self._append_line(questions_file, line)
+            return True
+            
+        if self.claim_fence is None:
+            raise ValueError("claim_token cần claim_fence của job queue")
+        with self._lock, self.claim_fence(job_id, claim_token) as claimed:
+            if not claimed:
+                logger.warning(f"⚠️ Job {job_id}: claim token không còn hiệu lực, bỏ qua checkpoint")
+                return False
+            self._append_line(questions_file, line)
+        return True
+        
+    def _append_line(self, questions_file: Path, line: str) -> None:
+        # A crash can leave a partial last line; start a fresh line so it stays isolated
+        if questions_file.exists() and questions_file.stat().st_size > 0:
+            with open(questions_file, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    line = "\n" + line
+        with open(questions_file, 'a', encoding='utf-8') as f:
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+                
+    def load_questions(self, job_id: str) -> List[Dict[str, Any]]:
+        """Đọc các câu đã checkpoint; bỏ qua dòng cuối bị ghi dở khi crash."""
+        questions_file = self._job_dir(job_id) / "questions.jsonl"
+        if not questions_file.exists():
+            return []
+            
+        questions = []
+        with open(questions_file, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    questions.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.warning(f"⚠️ Job {job_id}: bỏ qua checkpoint hỏng ở dòng {line_no}")
+        return questions
+        
+    def release_inputs(self, job_id: str) -> None:
+        """Xóa bản copy input (DOCX, đáp án) của job đã hoàn tất; meta/checkpoint/results giữ lại."""
+        job_dir = self._job_dir(job_id)
+        for name in ("source.docx", "answers.txt", "answers.bin"):
+            try:
+                (job_dir / name).unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # Still open elsewhere (Windows); prune_jobs removes it later
+                logger.warning(f"⚠️ Job {job_id}: không xóa được {name}: {e}")
+        self.update_job(job_id, inputs_released=True)
+        
+    def prune_expired(self) -> int:
+        """Áp dụng max_age_days; gọi một lần khi worker/app khởi động, không phải mỗi lần tạo store."""
+        if self.max_age_days <= 0:
+            return 0
+        return self.prune_jobs(self.max_age_days * 24 * 3600)
+        
+    def prune_jobs(self, max_age_seconds: float) -> int:
+        """Xóa jobs có meta không cập nhật trong max_age_seconds (job đang chạy luôn heartbeat)."""
+        cutoff = time.time() - max_age_seconds
+        pruned = 0
+        for job_dir in self.jobs_dir.iterdir():
+            try:
+                expired = (job_dir / "meta.json").stat().st_mtime < cutoff
+            except OSError:
+                continue
+            if expired and self.delete_job(job_dir.name):
+                pruned += 1
+        if pruned:
+            logger.info(f"🧹 Pruned {pruned} old jobs")
+        return pruned
+        
+    def delete_job(self, job_id: str) -> bool:
+        """Xóa toàn bộ thư mục job."""
+        job_dir = self._job_dir(job_id)
+        if not job_dir.exists():
+            return False
+        shutil.rmtree(job_dir, ignore_errors=True)
+        return True
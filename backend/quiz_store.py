@@ -0,0 +1,465 @@
+"""
+SQLite-backed quiz store cho QuizTestEngine.
+Thay cho mỗi quiz một file JSON + index.json: ba bảng quizzes / questions /
+images với index theo tên quiz, mon_hoc và do_kho. Sửa một câu chỉ ghi
+đúng một row (trong transaction) thay vì parse và ghi lại cả file.
+
+Migrate layout cũ (quiz_storage/index.json + *.json) một lần:
+    python -m backend.quiz_store --migrate quiz_storage
+"""
+
+import argparse
+import json
+import sqlite3
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+QUESTION_COLUMNS = ("so_cau", "cau_hoi", "lua_chon", "dap_an", "do_kho", "mon_hoc", "ghi_chu")
+IMAGE_COLUMNS = ("name", "path", "type", "size", "description")
+
+LEGACY_MIGRATION_KEY = "legacy_json_migrated"
+
+class QuizStore:
+    """Quizzes, questions và images trong một file SQLite (WAL, an toàn đa process)."""
+    
+    def __init__(self, db_path: str = "quiz_storage/quizzes.db"):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS quizzes (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL UNIQUE,
+                    created_time TEXT NOT NULL,
+                    updated_time TEXT NOT NULL,
+                    version TEXT NOT NULL DEFAULT '',
+                    revision INTEGER NOT NULL DEFAULT 1,
+                    previous_versions TEXT NOT NULL DEFAULT '[]'
+                );
+                CREATE TABLE IF NOT EXISTS questions (
+                    id INTEGER PRIMARY KEY,
+                    quiz_id INTEGER NOT NULL REFERENCES quizzes(id) ON DELETE CASCADE,
+                    position INTEGER NOT NULL,
+                    so_cau INTEGER,
+                    cau_hoi TEXT NOT NULL DEFAULT '',
+                    lua_chon TEXT NOT NULL DEFAULT '{}',
+                    dap_an TEXT NOT NULL DEFAULT '',
+                    do_kho TEXT,
+                    mon_hoc TEXT,
+                    ghi_chu TEXT,
+                    extra TEXT NOT NULL DEFAULT '{}',
+                    payload_size INTEGER NOT NULL DEFAULT 0,
+                    UNIQUE (quiz_id, position)
+                );
+                CREATE TABLE IF NOT EXISTS images (
+                    id INTEGER PRIMARY KEY,
+                    question_id INTEGER NOT NULL REFERENCES questions(id) ON DELETE CASCADE,
+                    position INTEGER NOT NULL,
+                    name TEXT,
+                    path TEXT,
+                    type TEXT,
+                    size INTEGER,
+                    description TEXT,
+                    extra TEXT NOT NULL DEFAULT '{}'
+                );
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_questions_mon_hoc ON questions(mon_hoc);
+                CREATE INDEX IF NOT EXISTS idx_questions_do_kho ON questions(do_kho);
+                CREATE INDEX IF NOT EXISTS idx_images_question ON images(question_id, position);
+            """)
+        finally:
+            conn.close()
+            
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+        
+    def _quiz_id(self, conn: sqlite3.Connection, name: str) -> Optional[int]:
+        row = conn.execute("SELECT id FROM quizzes WHERE name = ?", (name,)).fetchone()
+        return row["id"] if row else None
+        
+    # ----- Serialization -----
+    
+    def _question_row(self, question: Dict[str, Any]) -> Dict[str, Any]:
+        """Split a question dict into indexed columns + JSON extra (images go to their table)."""
+        extra = {k: v for k, v in question.items() if k not in QUESTION_COLUMNS and k != "images"}
+        try:
+            so_cau = int(question.get("so_cau"))
+        except (TypeError, ValueError):
+            so_cau = None
+            
+        return {
+            "so_cau": so_cau,
+            "cau_hoi": question.get("cau_hoi", ""),
+            "lua_chon": json.dumps(question.get("lua_chon", {}), ensure_ascii=False),
+            "dap_an": question.get("dap_an", ""),
+            "do_kho": question.get("do_kho"),
+            "mon_hoc": question.get("mon_hoc"),
+            "ghi_chu": question.get("ghi_chu"),
+            "extra": json.dumps(extra, ensure_ascii=False, default=str),
+            "payload_size": len(json.dumps(question, ensure_ascii=False, default=str).encode('utf-8'))
+        }
+        
+    def _row_to_question(self, row: sqlite3.Row, images: List[Dict[str, Any]]) -> Dict[str, Any]:
+        question = {
+            "so_cau": row["so_cau"],
+            "cau_hoi": row["cau_hoi"],
+            "lua_chon": json.loads(row["lua_chon"]),
+            "dap_an": row["dap_an"],
+            "do_kho": row["do_kho"],
+            "mon_hoc": row["mon_hoc"],
+            "ghi_chu": row["ghi_chu"]
+        }
+        question = {k: v for k, v in question.items() if v is not None}
+        question.update(json.loads(row["extra"]))
+        if images:
+            question["images"] = images
+        return question
+        
+    def _row_to_image(self, row: sqlite3.Row) -> Dict[str, Any]:
+        image = {k: row[k] for k in IMAGE_COLUMNS if row[k] is not None}
+        image.update(json.loads(row["extra"]))
+        return image
+        
+    def _insert_question(self, conn: sqlite3.Connection, quiz_id: int, position: int,
+                         question: Dict[str, Any]) -> None:
+        row = self._question_row(question)
+        cursor = conn.execute(f"""
+            INSERT INTO questions (quiz_id, position, {", ".join(row)})
+            VALUES (?, ?, {", ".join("?" for _ in row)})
+        """, (quiz_id, position, *row.values()))
+        self._insert_images(conn, cursor.lastrowid, question.get("images") or [])
+        
+    def _insert_images(self, conn: sqlite3.Connection, question_id: int, images: List[Any]) -> None:
+        for position, image in enumerate(images):
+            if not isinstance(image, dict):
+                continue
+            extra = {k: v for k, v in image.items() if k not in IMAGE_COLUMNS}
+            conn.execute("""
+                INSERT INTO images (question_id, position, name, path, type, size, description, extra)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (question_id, position, *(image.get(k) for k in IMAGE_COLUMNS),
+                  json.dumps(extra, ensure_ascii=False, default=str)))
+                  
+    # ----- Quizzes -----
+    
+    def save_quiz(self, name: str, questions: List[Dict[str, Any]], version: str = "",
+                  revision: int = 1, previous_versions: List[str] = None,
+                  created_time: str = None) -> Dict[str, Any]:
+        """Tạo mới hoặc thay toàn bộ câu hỏi của quiz trong một transaction."""
+        now = datetime.now().isoformat()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM quizzes WHERE name = ?", (name,))
+            cursor = conn.execute("""
+                INSERT INTO quizzes (name, created_time, updated_time, version, revision, previous_versions)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (name, created_time or now, now, version, revision,
+                  json.dumps(previous_versions or [], ensure_ascii=False)))
+            quiz_id = cursor.lastrowid
+            
+            for position, question in enumerate(questions):
+                self._insert_question(conn, quiz_id, position, question)
+                
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+            
+        return self.get_quiz_info(name)
+        
+    def update_quiz_info(self, name: str, **fields) -> Optional[Dict[str, Any]]:
+        """Cập nhật metadata của quiz (version, revision, previous_versions)."""
+        allowed = {"version", "revision", "previous_versions"}
+        updates = {k: v for k, v in fields.items() if k in allowed}
+        if "previous_versions" in updates:
+            updates["previous_versions"] = json.dumps(updates["previous_versions"], ensure_ascii=False)
+        updates["updated_time"] = datetime.now().isoformat()
+        
+        conn = self._connect()
+        try:
+            conn.execute(
+                f"UPDATE quizzes SET {', '.join(f'{k} = ?' for k in updates)} WHERE name = ?",
+                (*updates.values(), name)
+            )
+        finally:
+            conn.close()
+        return self.get_quiz_info(name)
+        
+    def _quiz_info_query(self, where: str = "") -> str:
+        return f"""
+            SELECT z.name, z.created_time, z.updated_time, z.version, z.revision, z.previous_versions,
+                   (SELECT COUNT(*) FROM questions q WHERE q.quiz_id = z.id) AS questions_count,
+                   (SELECT COALESCE(SUM(q.payload_size), 0) FROM questions q WHERE q.quiz_id = z.id) AS size_bytes,
+                   (SELECT COUNT(*) FROM images i JOIN questions q ON i.question_id = q.id
+                    WHERE q.quiz_id = z.id) AS images_count
+            FROM quizzes z {where}
+            ORDER BY z.created_time
+        """
+        
+    def _row_to_info(self, row: sqlite3.Row) -> Dict[str, Any]:
+        """Cùng shape với entry trong index.json cũ mà UI đang dùng."""
+        try:
+            created_time = datetime.fromisoformat(row["created_time"])
+        except ValueError:
+            created_time = datetime.now()
+            
+        return {
+            "file_path": str(self.db_path),
+            "created_time": created_time,
+            "updated_time": row["updated_time"],
+            "questions_count": row["questions_count"],
+            "images_count": row["images_count"],
+            "size": f"{row['size_bytes'] / 1024:.1f} KB",
+            "version": row["version"],
+            "has_images": row["images_count"] > 0,
+            "revision": row["revision"],
+            "previous_versions": json.loads(row["previous_versions"])
+        }
+        
+    def list_quizzes(self) -> Dict[str, Dict[str, Any]]:
+        """name -> info của mọi quiz (không đọc nội dung câu hỏi)."""
+        conn = self._connect()
+        try:
+            rows = conn.execute(self._quiz_info_query()).fetchall()
+        finally:
+            conn.close()
+        return {row["name"]: self._row_to_info(row) for row in rows}
+        
+    def get_quiz_info(self, name: str) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        try:
+            row = conn.execute(self._quiz_info_query("WHERE z.name = ?"), (name,)).fetchone()
+        finally:
+            conn.close()
+        return self._row_to_info(row) if row else None
+        
+    def get_quiz_version(self, name: str) -> Optional[str]:
+        """updated_time của quiz (đổi ở mọi lần ghi); dùng làm khóa cache."""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT updated_time FROM quizzes WHERE name = ?", (name,)).fetchone()
+            return row["updated_time"] if row else None
+        finally:
+            conn.close()
+            
+    def delete_quiz(self, name: str) -> bool:
+        """Xóa quiz cùng câu hỏi và image rows (ON DELETE CASCADE)."""
+        conn = self._connect()
+        try:
+            cursor = conn.execute("DELETE FROM quizzes WHERE name = ?", (name,))
+            return cursor.rowcount > 0
+        finally:
+            conn.close()
+            
+    # ----- Questions -----
+    
+    def _load_questions(self, conn: sqlite3.Connection, quiz_id: int,
+                        position: int = None) -> List[Dict[str, Any]]:
+        where, params = "quiz_id = ?", [quiz_id]
+        if position is not None:
+            where += " AND position = ?"
+            params.append(position)
+            
+        rows = conn.execute(f"SELECT * FROM questions WHERE {where} ORDER BY position", params).fetchall()
+        images_by_question: Dict[int, List[Dict[str, Any]]] = {}
+        if rows:
+            image_rows = conn.execute(f"""
+                SELECT * FROM images WHERE question_id IN ({", ".join("?" for _ in rows)})
+                ORDER BY question_id, position
+            """, [row["id"] for row in rows]).fetchall()
+            for image_row in image_rows:
+                images_by_question.setdefault(image_row["question_id"], []).append(self._row_to_image(image_row))
+                
+        return [self._row_to_question(row, images_by_question.get(row["id"], [])) for row in rows]
+        
+    def load_questions(self, name: str) -> List[Dict[str, Any]]:
+        """Mọi câu hỏi của quiz theo thứ tự, dạng dict như file JSON cũ."""
+        conn = self._connect()
+        try:
+            quiz_id = self._quiz_id(conn, name)
+            return self._load_questions(conn, quiz_id) if quiz_id is not None else []
+        finally:
+            conn.close()
+            
+    def get_question(self, name: str, position: int) -> Optional[Dict[str, Any]]:
+        """Một câu theo vị trí (0-based) mà không tải cả quiz."""
+        conn = self._connect()
+        try:
+            quiz_id = self._quiz_id(conn, name)
+            if quiz_id is None:
+                return None
+            questions = self._load_questions(conn, quiz_id, position)
+            return questions[0] if questions else None
+        finally:
+            conn.close()
+            
+    def update_question(self, name: str, position: int, question: Dict[str, Any]) -> bool:
+        """Thay đúng một câu (và images của nó) trong một transaction."""
+        row = self._question_row(question)
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            quiz_id = self._quiz_id(conn, name)
+            existing = conn.execute(
+                "SELECT id FROM questions WHERE quiz_id = ? AND position = ?", (quiz_id, position)
+            ).fetchone() if quiz_id is not None else None
+            if existing is None:
+                conn.execute("ROLLBACK")
+                return False
+                
+            conn.execute(
+                f"UPDATE questions SET {', '.join(f'{k} = ?' for k in row)} WHERE id = ?",
+                (*row.values(), existing["id"])
+            )
+            conn.execute("DELETE FROM images WHERE question_id = ?", (existing["id"],))
+            self._insert_images(conn, existing["id"], question.get("images") or [])
+            conn.execute("UPDATE quizzes SET updated_time = ? WHERE id = ?", (datetime.now().isoformat(), quiz_id))
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+            
+    def find_questions(self, mon_hoc: str = None, do_kho: str = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Tìm câu hỏi theo môn/độ khó trên mọi quiz (dùng index)."""
+        clauses, params = [], []
+        if mon_hoc is not None:
+            clauses.append("q.mon_hoc = ?")
+            params.append(mon_hoc)
+        if do_kho is not None:
+            clauses.append("q.do_kho = ?")
+            params.append(do_kho)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        
+        conn = self._connect()
+        try:
+            rows = conn.execute(f"""
+                SELECT z.name AS quiz_name, q.quiz_id, q.position FROM questions q
+                JOIN quizzes z ON z.id = q.quiz_id {where}
+                ORDER BY z.name, q.position LIMIT ?
+            """, (*params, limit)).fetchall()
+            results = []
+            for row in rows:
+                question = self._load_questions(conn, row["quiz_id"], row["position"])[0]
+                results.append({"quiz_name": row["quiz_name"], "position": row["position"], **question})
+            return results
+        finally:
+            conn.close()
+            
+    # ----- Meta / migration -----
+    
+    def get_meta(self, key: str) -> Optional[str]:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+            return row["value"] if row else None
+        finally:
+            conn.close()
+            
+    def set_meta(self, key: str, value: str) -> None:
+        conn = self._connect()
+        try:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+        finally:
+            conn.close()
+            
+    def storage_size(self) -> int:
+        """Bytes trên đĩa của database (kể cả WAL)."""
+        return sum(
+            path.stat().st_size
+            for path in (self.db_path, self.db_path.with_name(self.db_path.name + "-wal"))
+            if path.exists()
+        )
+
+def _resolve_legacy_file(storage_dir: Path, file_path: str) -> Optional[Path]:
+    """index.json có thể chứa đường dẫn Windows (quiz_storage\\\\X.json) hoặc tương đối."""
+    candidate = Path(file_path.replace("\\", "/"))
+    for path in (candidate, storage_dir / candidate.name):
+        if path.exists():
+            return path
+    return None
+
+def migrate_legacy_storage(storage_dir: str, store: QuizStore, force: bool = False) -> int:
+    """Import quiz_storage/index.json + các file quiz JSON vào store (chỉ chạy một lần).
+    
+    index.json và các file JSON cũ được giữ nguyên (có thể đang được git track);
+    việc đã migrate được ghi vào bảng meta của store.
+    force: migrate lại dù đã chạy.
+    Returns số quiz đã import.
+    """
+    storage_dir = Path(storage_dir)
+    index_file = storage_dir / "index.json"
+    if store.get_meta(LEGACY_MIGRATION_KEY) and not force:
+        return 0
+    if not index_file.exists():
+        return 0
+        
+    with open(index_file, 'r', encoding='utf-8') as f:
+        index = json.load(f)
+        
+    migrated = 0
+    for name, info in index.items():
+        quiz_file = _resolve_legacy_file(storage_dir, info.get("file_path", ""))
+        if quiz_file is None:
+            logger.warning(f"⚠️ Bỏ qua quiz '{name}': không tìm thấy file {info.get('file_path')}")
+            continue
+            
+        try:
+            with open(quiz_file, 'r', encoding='utf-8') as f:
+                questions = json.load(f)
+            store.save_quiz(
+                name, questions,
+                version=info.get("version", ""),
+                revision=info.get("revision", 1),
+                previous_versions=info.get("previous_versions", []),
+                created_time=info.get("created_time")
+            )
+            migrated += 1
+        except (OSError, json.JSONDecodeError, sqlite3.Error) as e:
+            logger.warning(f"⚠️ Không migrate được quiz '{name}': {e}")
+            
+    store.set_meta(LEGACY_MIGRATION_KEY, datetime.now().isoformat())
+    logger.info(f"📦 Đã migrate {migrated}/{len(index)} quiz sang {store.db_path}")
+    return migrated
+
+def main():
+    parser = argparse.ArgumentParser(description="QuizForce quiz store")
+    parser.add_argument("--migrate", metavar="STORAGE_DIR", default=None,
+                        help="Import index.json + quiz JSON files từ thư mục này")
+    parser.add_argument("--db", default=None, help="Đường dẫn SQLite (mặc định STORAGE_DIR/quizzes.db)")
+    parser.add_argument("--force", action="store_true", help="Migrate lại dù đã chạy trước đó")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    
+    storage_dir = Path(args.migrate or "quiz_storage")
+    store = QuizStore(args.db or storage_dir / "quizzes.db")
+    
+    if args.migrate:
+        count = migrate_legacy_storage(storage_dir, store, force=args.force)
+        print(f"✅ Migrated {count} quiz(zes) vào {store.db_path}")
+        
+    for name, info in store.list_quizzes().items():
+        print(f"📚 {name}: {info['questions_count']} câu, {info['size']}")
+
+if __name__ == "__main__":
+    main()
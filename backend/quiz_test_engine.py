@@ -7,18 +7,23 @@ Xử lý toàn bộ logic làm bài kiểm tra trực tuyến chuyên nghiệp v
 - Enhanced Statistics
 - Question Editor
 """
-from typing import Dict, List, Any, Optional, Union, Tuple
+from typing import Dict, List, Any, Optional, Union, Tuple, Iterator, Sequence
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from dataclasses import dataclass, asdict, field
+from dataclasses import dataclass, asdict, field, replace
+from functools import wraps
 from pathlib import Path
 import json
 import random
+import threading
 import uuid
-import shutil
 import base64
 import io
 from PIL import Image
 
+from .quiz_store import QuizStore, migrate_legacy_storage
+from .test_history import TestHistoryStore
+
 @dataclass
 class ImageData:
     """Cấu trúc dữ liệu hình ảnh."""
@@ -81,13 +86,88 @@ class TestResult:
     question_stats: Dict[str, Any] = field(default_factory=dict)  # Thống kê chi tiết
     time_stats: Dict[str, Any] = field(default_factory=dict)  # Thống kê thời gian
 
+class SharedQuizCache:
+    """Cache các quiz đã parse, dùng chung cho mọi engine trong process.
+    
+    Mỗi entry gắn với version của quiz trong QuizStore (updated_time, đổi ở
+    mọi lần ghi), nên quiz bị sửa sẽ tự được tải lại. Các phần tử được dùng
+    chung, không copy (kể cả ảnh) và phải coi là read-only: get() chỉ trả về
+    list mới trỏ tới cùng các object; phiên làm bài copy riêng câu nào nó trộn
+    đáp án (xem create_test_session).
+    """
+    
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: Tuple, version: Optional[str]) -> Optional[List[Any]]:
+        if version is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return list(entry[1])
+    
+    def put(self, key: Tuple, version: Optional[str], value: List[Any]) -> None:
+        if version is None:
+            return
+        value = tuple(value)
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+_shared_quiz_cache = SharedQuizCache()
+
+def synchronized(method):
+    """Chạy method dưới lock của engine (engine được dùng chung giữa các phiên)."""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+class TestHistoryView(Sequence):
+    """Lịch sử bài kiểm tra dạng Sequence lazy trên history store.
+    
+    len() chỉ đọc summary index; mỗi phần tử (kèm detailed_results) được đọc
+    từ segment khi được truy cập, nên không giữ cả lịch sử trong RAM.
+    """
+    
+    def __init__(self, engine: "QuizTestEngine"):
+        self._engine = engine
+    
+    def __len__(self) -> int:
+        return self._engine.history_store.count()
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        # Positional read straight from the summary index: O(1), no list copy
+        record = self._engine.history_store.record_at(index)
+        return self._engine._result_from_record(record) if record else None
+    
+    def __iter__(self) -> Iterator[TestResult]:
+        return self._engine.iter_test_results()
+
 class QuizTestEngine:
     """Engine Bài Kiểm Tra Chuyên Nghiệp với Enhanced Features"""
     
     def __init__(self):
         """Khởi tạo engine với enhanced configuration."""
         self.active_sessions: Dict[str, TestSession] = {}
-        self.completed_tests: List[TestResult] = []
+        
+        # Re-entrant: save_quiz_version calls save_quiz_to_storage
+        self._lock = threading.RLock()
+        self.quiz_cache = _shared_quiz_cache
         
         # Enhanced storage directories
         self.quiz_storage_dir = Path("quiz_storage")
@@ -102,10 +182,21 @@ class QuizTestEngine:
         self.exports_dir = self.quiz_storage_dir / "exports"
         self.exports_dir.mkdir(exist_ok=True)
         
-        # Load saved data
+        # Quizzes live in SQLite; the old index.json + per-quiz JSON layout is imported once
+        self.quiz_store = QuizStore(self.quiz_storage_dir / "quizzes.db")
+        migrated = migrate_legacy_storage(self.quiz_storage_dir, self.quiz_store)
+        if migrated:
+            print(f"📦 Đã chuyển {migrated} quiz từ index.json sang {self.quiz_store.db_path}")
+        
+        # Test history is append-only JSONL; the old test_history.json array is imported once
+        self.history_store = TestHistoryStore(self.quiz_storage_dir / "test_history")
+        migrated = self.history_store.migrate_legacy_file(self.quiz_storage_dir / "test_history.json")
+        if migrated:
+            print(f"📦 Đã chuyển {migrated} bài kiểm tra từ test_history.json sang {self.history_store.history_dir}")
+        
+        # Load saved data (history is read on demand through the summary index)
         self.saved_quizzes = {}
         self._load_saved_quizzes()
-        self._load_test_history()
         
         # Engine info
         self.engine_version = "3.0"
@@ -123,88 +214,84 @@ class QuizTestEngine:
         print(f"🎯 Features: {', '.join(self.supported_features[:3])}...")
         
     def _load_saved_quizzes(self):
-        """Tải danh sách quiz đã lưu với enhanced error handling."""
+        """Tải danh sách quiz đã lưu (chỉ metadata, không đọc câu hỏi)."""
         try:
-            index_file = self.quiz_storage_dir / "index.json"
-            if index_file.exists():
-                with open(index_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.saved_quizzes = data
-            else:
-                self.saved_quizzes = {}
-                
-            # Validate và clean up
-            self._validate_quiz_index()
-            
+            self.saved_quizzes = self.quiz_store.list_quizzes()
         except Exception as e:
             print(f"⚠️ Lỗi tải danh sách quiz: {e}")
             self.saved_quizzes = {}
-            
-    def _validate_quiz_index(self):
-        """Validate quiz index và xóa entries không hợp lệ."""
-        invalid_quizzes = []
-        
-        for name, info in self.saved_quizzes.items():
-            file_path = Path(info.get("file_path", ""))
-            if not file_path.exists():
-                invalid_quizzes.append(name)
-                print(f"⚠️ Quiz file không tồn tại: {name}")
-        
-        # Remove invalid entries
-        for name in invalid_quizzes:
-            del self.saved_quizzes[name]
-            
-        if invalid_quizzes:
-            self._save_index()
-            print(f"🔧 Đã xóa {len(invalid_quizzes)} quiz entries không hợp lệ")
+    
+    @property
+    def completed_tests(self) -> TestHistoryView:
+        """Các bài đã hoàn thành (lazy, xem TestHistoryView)."""
+        return TestHistoryView(self)
     
     def _load_test_history(self):
-        """Tải lịch sử bài kiểm tra."""
+        """Dựng lại summary index của lịch sử từ các segment."""
         try:
-            history_file = self.quiz_storage_dir / "test_history.json"
-            if history_file.exists():
-                with open(history_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    # Convert back to TestResult objects
-                    for item in data:
-                        if isinstance(item.get('finish_time'), str):
-                            item['finish_time'] = datetime.fromisoformat(item['finish_time'])
-                        result = TestResult(**item)
-                        self.completed_tests.append(result)
-                        
-            print(f"📊 Đã tải {len(self.completed_tests)} bài kiểm tra từ lịch sử")
+            count = self.history_store.rebuild_summaries()
+            print(f"📊 Đã index {count} bài kiểm tra từ lịch sử")
         except Exception as e:
             print(f"⚠️ Lỗi tải lịch sử: {e}")
-            self.completed_tests = []
     
-    def _save_test_history(self):
-        """Lưu lịch sử bài kiểm tra."""
+    def _result_from_record(self, item: Dict[str, Any]) -> TestResult:
+        item = {key: value for key, value in item.items() if key != "location"}
+        if isinstance(item.get('finish_time'), str):
+            item['finish_time'] = datetime.fromisoformat(item['finish_time'])
+        item.setdefault('detailed_results', [])
+        return TestResult(**item)
+    
+    def iter_test_results(self) -> Iterator[TestResult]:
+        """Duyệt lịch sử theo thứ tự hoàn thành mà không giữ cả lịch sử trong RAM."""
+        for item in self.history_store.iter_records():
+            yield self._result_from_record(item)
+    
+    def get_test_history(self, page: int = 0, page_size: int = 20) -> Dict[str, Any]:
+        """Một trang tóm tắt lịch sử (mới nhất trước), không có detailed_results."""
+        summaries = self.history_store.summaries()
+        summaries.sort(key=lambda s: s.get("finish_time", ""), reverse=True)
+        
+        start = max(0, page) * page_size
+        items = []
+        for summary in summaries[start:start + page_size]:
+            item = {key: value for key, value in summary.items() if key != "location"}
+            if isinstance(item.get('finish_time'), str):
+                item['finish_time'] = datetime.fromisoformat(item['finish_time'])
+            items.append(item)
+        
+        return {
+            "items": items,
+            "page": page,
+            "page_size": page_size,
+            "total": len(summaries),
+            "total_pages": (len(summaries) + page_size - 1) // page_size
+        }
+    
+    def get_test_result(self, session_id: str) -> Optional[TestResult]:
+        """Kết quả đầy đủ (kèm detailed_results) của một bài, đọc khi được mở."""
+        record = self.history_store.get_record(session_id)
+        return self._result_from_record(record) if record else None
+    
+    def _record_test_result(self, result: TestResult):
+        """Ghi nối một kết quả vào lịch sử (không ghi lại các kết quả cũ)."""
         try:
-            history_file = self.quiz_storage_dir / "test_history.json"
-            data = []
-            
-            for result in self.completed_tests:
-                result_dict = asdict(result)
-                if isinstance(result_dict.get('finish_time'), datetime):
-                    result_dict['finish_time'] = result_dict['finish_time'].isoformat()
-                data.append(result_dict)
-            
-            with open(history_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            result_dict = asdict(result)
+            if isinstance(result_dict.get('finish_time'), datetime):
+                result_dict['finish_time'] = result_dict['finish_time'].isoformat()
+            self.history_store.append(result_dict)
                 
         except Exception as e:
             print(f"⚠️ Lỗi lưu lịch sử: {e}")
     
+    @synchronized
     def save_quiz_to_storage(self, questions_data: list, quiz_name: str = None) -> str:
         """Lưu quiz vào storage với enhanced features."""
         try:
             if not quiz_name:
                 quiz_name = f"Quiz_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
             
-            # Tạo file name an toàn
+            # Tên an toàn cho file ảnh
             safe_name = "".join(c for c in quiz_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
-            file_name = f"{safe_name}.json"
-            file_path = self.quiz_storage_dir / file_name
             
             # Process images if any
             processed_questions = []
@@ -243,22 +330,10 @@ class QuizTestEngine:
                 
                 processed_questions.append(processed_q)
             
-            # Save quiz data
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(processed_questions, f, ensure_ascii=False, indent=2)
-            
-            # Update index
-            self.saved_quizzes[quiz_name] = {
-                "file_path": str(file_path),
-                "created_time": datetime.now(),
-                "questions_count": len(processed_questions),
-                "images_count": total_images,
-                "size": f"{file_path.stat().st_size / 1024:.1f} KB",
-                "version": self.engine_version,
-                "has_images": total_images > 0
-            }
-            
-            self._save_index()
+            # Save quiz data (one transaction; replaces any quiz with the same name)
+            self.saved_quizzes[quiz_name] = self.quiz_store.save_quiz(
+                quiz_name, processed_questions, version=self.engine_version
+            )
             
             print(f"✅ Đã lưu quiz '{quiz_name}' với {len(processed_questions)} câu, {total_images} ảnh")
             return quiz_name
@@ -300,29 +375,7 @@ class QuizTestEngine:
             with open(file_path, 'wb') as f:
                 f.write(image_bytes)
     
-    def _save_index(self):
-        """Lưu index file với enhanced data."""
-        try:
-            index_file = self.quiz_storage_dir / "index.json"
-            index_data = {}
-            
-            for name, info in self.saved_quizzes.items():
-                index_data[name] = {
-                    "file_path": info["file_path"],
-                    "created_time": info["created_time"].isoformat() if isinstance(info["created_time"], datetime) else info["created_time"],
-                    "questions_count": info["questions_count"],
-                    "images_count": info.get("images_count", 0),
-                    "size": info["size"],
-                    "version": info.get("version", "1.0"),
-                    "has_images": info.get("has_images", False)
-                }
-            
-            with open(index_file, 'w', encoding='utf-8') as f:
-                json.dump(index_data, f, ensure_ascii=False, indent=2)
-                
-        except Exception as e:
-            print(f"❌ Lỗi lưu index: {e}")
-    
+    @synchronized
     def get_saved_quizzes(self) -> Dict[str, Any]:
         """Lấy danh sách quiz đã lưu với enhanced info."""
         self._load_saved_quizzes()
@@ -341,10 +394,14 @@ class QuizTestEngine:
         """Tải quiz từ storage với image support."""
         try:
             if quiz_name in self.saved_quizzes:
-                file_path = Path(self.saved_quizzes[quiz_name]["file_path"])
+                # Parsed quizzes are shared process-wide until the quiz changes
+                cache_key = (str(self.quiz_store.db_path), quiz_name, "questions")
+                version = self.quiz_store.get_quiz_version(quiz_name)
+                cached = self.quiz_cache.get(cache_key, version)
+                if cached is not None:
+                    return cached
                 
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    questions_data = json.load(f)
+                questions_data = self.quiz_store.load_questions(quiz_name)
                 
                 # Convert to QuestionData objects with image loading
                 questions = []
@@ -393,6 +450,7 @@ class QuizTestEngine:
                     )
                     questions.append(question)
                 
+                self.quiz_cache.put(cache_key, version, questions)
                 print(f"✅ Đã tải {len(questions)} câu hỏi từ '{quiz_name}'")
                 return questions
                 
@@ -400,31 +458,71 @@ class QuizTestEngine:
             print(f"❌ Lỗi tải quiz: {e}")
         return []
     
+    def get_quiz_source_questions(self, quiz_name: str) -> List[Dict[str, Any]]:
+        """Lấy câu hỏi dạng dict gốc (kèm source_hash) để agent biên dịch tăng dần."""
+        try:
+            if quiz_name in self.saved_quizzes:
+                cache_key = (str(self.quiz_store.db_path), quiz_name, "source")
+                version = self.quiz_store.get_quiz_version(quiz_name)
+                questions_data = self.quiz_cache.get(cache_key, version)
+                if questions_data is None:
+                    questions_data = self.quiz_store.load_questions(quiz_name)
+                    self.quiz_cache.put(cache_key, version, questions_data)
+                return questions_data
+        except Exception as e:
+            print(f"❌ Lỗi tải quiz nguồn: {e}")
+        return []
+    
+    @synchronized
+    def save_quiz_version(self, quiz_name: str, questions_data: list) -> Optional[str]:
+        """Lưu phiên bản mới của quiz, backup phiên bản hiện tại vào backups."""
+        try:
+            previous_info = self.saved_quizzes.get(quiz_name)
+            revision = 1
+            previous_versions = []
+            
+            if previous_info:
+                revision = previous_info.get("revision", 1)
+                previous_versions = list(previous_info.get("previous_versions", []))
+                
+                backup_path = self._backup_quiz(quiz_name, f"v{revision}")
+                if backup_path:
+                    previous_versions.append(str(backup_path))
+                    print(f"📦 Đã backup phiên bản {revision} vào {backup_path}")
+                
+                revision += 1
+            
+            saved_name = self.save_quiz_to_storage(questions_data, quiz_name)
+            if saved_name:
+                self.saved_quizzes[saved_name] = self.quiz_store.update_quiz_info(
+                    saved_name, revision=revision, previous_versions=previous_versions
+                )
+                print(f"✅ Đã lưu phiên bản {revision} của quiz '{saved_name}'")
+            return saved_name
+            
+        except Exception as e:
+            print(f"❌ Lỗi lưu phiên bản quiz: {e}")
+            return None
+    
+    @synchronized
     def delete_quiz_from_storage(self, quiz_name: str) -> bool:
         """Xóa quiz khỏi storage với cleanup."""
         try:
             if quiz_name in self.saved_quizzes:
                 info = self.saved_quizzes[quiz_name]
-                file_path = Path(info["file_path"])
                 
                 # Backup trước khi xóa
-                if file_path.exists():
-                    backup_name = f"{quiz_name}_deleted_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-                    backup_path = self.backups_dir / backup_name
-                    shutil.copy2(file_path, backup_path)
+                backup_path = self._backup_quiz(quiz_name, "deleted")
+                if backup_path:
                     print(f"📦 Đã backup quiz vào {backup_path}")
                 
                 # Xóa images liên quan
                 if info.get("has_images", False):
                     self._cleanup_quiz_images(quiz_name)
                 
-                # Xóa file chính
-                if file_path.exists():
-                    file_path.unlink()
-                
-                # Xóa khỏi index
+                # Xóa quiz, câu hỏi và image rows
+                self.quiz_store.delete_quiz(quiz_name)
                 del self.saved_quizzes[quiz_name]
-                self._save_index()
                 
                 print(f"✅ Đã xóa quiz '{quiz_name}'")
                 return True
@@ -433,6 +531,18 @@ class QuizTestEngine:
             print(f"❌ Lỗi xóa quiz: {e}")
         return False
     
+    def _backup_quiz(self, quiz_name: str, label: str) -> Optional[Path]:
+        """Ghi câu hỏi hiện tại của quiz ra backups/<quiz>_<label>_<timestamp>.json."""
+        questions_data = self.quiz_store.load_questions(quiz_name)
+        if not questions_data:
+            return None
+        
+        backup_name = f"{quiz_name}_{label}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        backup_path = self.backups_dir / backup_name
+        with open(backup_path, 'w', encoding='utf-8') as f:
+            json.dump(questions_data, f, ensure_ascii=False, indent=2)
+        return backup_path
+    
     def _cleanup_quiz_images(self, quiz_name: str):
         """Dọn dẹp images của quiz."""
         try:
@@ -494,6 +604,7 @@ class QuizTestEngine:
             print(f"❌ Lỗi tải câu hỏi từ JSON: {e}")
             return []
     
+    @synchronized
     def create_test_session(self, 
                           student_name: str,
                           test_title: str,
@@ -515,9 +626,10 @@ class QuizTestEngine:
             print(f"🔀 Đã trộn thứ tự {len(processed_questions)} câu hỏi")
         
         if shuffle_answers:
-            for q in processed_questions:
+            for index, q in enumerate(processed_questions):
                 if len(q.lua_chon) == 4:  # Only shuffle if we have exactly 4 choices
-                    q.lua_chon = self._shuffle_choices(q.lua_chon, q.dap_an)
+                    # Questions may be shared through the quiz cache: shuffle a private copy
+                    processed_questions[index] = replace(q, lua_chon=self._shuffle_choices(q.lua_chon, q.dap_an))
             print(f"🎲 Đã trộn thứ tự đáp án")
         
         # Prepare settings
@@ -808,6 +920,7 @@ class QuizTestEngine:
         """Hoàn thành bài kiểm tra với enhanced result."""
         return self._finish_test(session_id)
     
+    @synchronized
     def _finish_test(self, session_id: str) -> Optional[TestResult]:
         """Xử lý hoàn thành bài kiểm tra với enhanced statistics."""
         session = self.active_sessions.get(session_id)
@@ -821,8 +934,7 @@ class QuizTestEngine:
         result = self._enhanced_grade_test(session)
         
         # Save result
-        self.completed_tests.append(result)
-        self._save_test_history()
+        self._record_test_result(result)
         
         # Cleanup progress file
         try:
@@ -980,78 +1092,55 @@ class QuizTestEngine:
         return subjects
     
     def get_test_statistics(self) -> Dict[str, Any]:
-        """Lấy thống kê các bài kiểm tra với enhanced analytics."""
-        if not self.completed_tests:
-            return {"message": "Chưa có bài kiểm tra nào được hoàn thành."}
+        """Lấy thống kê các bài kiểm tra với enhanced analytics.
         
-        total_tests = len(self.completed_tests)
-        scores = [test.score for test in self.completed_tests]
-        percentages = [test.percentage for test in self.completed_tests]
+        Đọc aggregate cộng dồn của history store, nên chi phí không phụ thuộc
+        số bài đã làm.
+        """
+        aggregates = self.history_store.statistics()
+        if not aggregates.count:
+            return {"message": "Chưa có bài kiểm tra nào được hoàn thành."}
         
         # Basic stats
-        avg_score = sum(scores) / len(scores) if scores else 0
-        avg_percentage = sum(percentages) / len(percentages) if percentages else 0
-        highest_score = max(scores) if scores else 0
-        lowest_score = min(scores) if scores else 0
-        pass_rate = len([s for s in scores if s >= 5]) / len(scores) * 100 if scores else 0
-        
-        # Enhanced analytics
-        mode_stats = {"exam": 0, "practice": 0}
-        difficulty_analysis = {}
-        subject_analysis = {}
+        total_tests = aggregates.count
+        avg_score = aggregates.total_score / total_tests
+        avg_percentage = aggregates.total_percentage / total_tests
+        highest_score = aggregates.highest_score
+        lowest_score = aggregates.lowest_score
+        pass_rate = aggregates.passed / total_tests * 100
+        mode_stats = aggregates.mode_distribution
+        
+        # Monthly performance
         monthly_performance = {}
-        
-        for test in self.completed_tests:
-            # Mode statistics
-            mode_stats[test.test_mode] = mode_stats.get(test.test_mode, 0) + 1
-            
-            # Monthly performance
-            month_key = test.finish_time.strftime("%Y-%m")
-            if month_key not in monthly_performance:
-                monthly_performance[month_key] = {"count": 0, "avg_score": 0, "total_score": 0}
-            monthly_performance[month_key]["count"] += 1
-            monthly_performance[month_key]["total_score"] += test.score
-            monthly_performance[month_key]["avg_score"] = monthly_performance[month_key]["total_score"] / monthly_performance[month_key]["count"]
-            
-            # Difficulty and subject analysis
-            if hasattr(test, 'question_stats') and test.question_stats:
-                # Difficulty
-                for diff, stats in test.question_stats.get("by_difficulty", {}).items():
-                    if diff not in difficulty_analysis:
-                        difficulty_analysis[diff] = {"correct": 0, "total": 0}
-                    difficulty_analysis[diff]["correct"] += stats["correct"]
-                    difficulty_analysis[diff]["total"] += stats["total"]
-                
-                # Subject
-                for subj, stats in test.question_stats.get("by_subject", {}).items():
-                    if subj not in subject_analysis:
-                        subject_analysis[subj] = {"correct": 0, "total": 0}
-                    subject_analysis[subj]["correct"] += stats["correct"]
-                    subject_analysis[subj]["total"] += stats["total"]
+        for month_key, month in sorted(aggregates.monthly.items()):
+            monthly_performance[month_key] = {
+                "count": month["count"],
+                "avg_score": month["total_score"] / month["count"],
+                "total_score": month["total_score"]
+            }
         
         # Calculate percentages for difficulty/subject
-        for diff in difficulty_analysis:
-            total = difficulty_analysis[diff]["total"]
-            if total > 0:
-                difficulty_analysis[diff]["percentage"] = round((difficulty_analysis[diff]["correct"] / total) * 100, 1)
-        
-        for subj in subject_analysis:
-            total = subject_analysis[subj]["total"]
-            if total > 0:
-                subject_analysis[subj]["percentage"] = round((subject_analysis[subj]["correct"] / total) * 100, 1)
+        difficulty_analysis = aggregates.difficulty
+        subject_analysis = aggregates.subject
+        for analysis in (difficulty_analysis, subject_analysis):
+            for stats in analysis.values():
+                if stats["total"] > 0:
+                    stats["percentage"] = round((stats["correct"] / stats["total"]) * 100, 1)
         
         # Recent tests
         recent_tests = []
-        for test in sorted(self.completed_tests, key=lambda x: x.finish_time, reverse=True)[:15]:
+        for test in aggregates.recent_tests():
+            title = test.get("test_title") or ""
             recent_tests.append({
-                "student": test.student_name,
-                "title": test.test_title[:30] + "..." if len(test.test_title) > 30 else test.test_title,
-                "score": test.score,
-                "percentage": test.percentage,
-                "mode": test.test_mode,
-                "time": test.finish_time.strftime("%d/%m/%Y %H:%M"),
-                "questions": test.total_questions,
-                "time_taken": test.time_taken
+                "session_id": test["session_id"],
+                "student": test["student_name"],
+                "title": title[:30] + "..." if len(title) > 30 else title,
+                "score": test["score"],
+                "percentage": test["percentage"],
+                "mode": test["test_mode"],
+                "time": datetime.fromisoformat(test["finish_time"]).strftime("%d/%m/%Y %H:%M"),
+                "questions": test["total_questions"],
+                "time_taken": test["time_taken"]
             })
         
         return {
@@ -1074,18 +1163,13 @@ class QuizTestEngine:
             }
         }
     
+    @synchronized
     def update_question_in_quiz(self, quiz_name: str, question_index: int, updated_question: Dict[str, Any]) -> bool:
         """Cập nhật câu hỏi trong quiz đã lưu với image support."""
         try:
             if quiz_name in self.saved_quizzes:
-                file_path = Path(self.saved_quizzes[quiz_name]["file_path"])
-                
-                # Load current data
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    quiz_data = json.load(f)
-                
                 # Update question
-                if 0 <= question_index < len(quiz_data):
+                if 0 <= question_index < self.saved_quizzes[quiz_name]["questions_count"]:
                     # Handle images if any
                     if 'images' in updated_question and updated_question['images']:
                         processed_images = []
@@ -1112,19 +1196,17 @@ class QuizTestEngine:
                     # Add update timestamp
                     updated_question['updated_time'] = datetime.now().isoformat()
                     
-                    quiz_data[question_index] = updated_question
-                    
-                    # Save back
-                    with open(file_path, 'w', encoding='utf-8') as f:
-                        json.dump(quiz_data, f, ensure_ascii=False, indent=2)
-                    
-                    print(f"✅ Đã cập nhật câu {question_index + 1} trong quiz '{quiz_name}'")
-                    return True
+                    # Save back (only this question's row and its images)
+                    if self.quiz_store.update_question(quiz_name, question_index, updated_question):
+                        self.saved_quizzes[quiz_name] = self.quiz_store.get_quiz_info(quiz_name)
+                        print(f"✅ Đã cập nhật câu {question_index + 1} trong quiz '{quiz_name}'")
+                        return True
                     
         except Exception as e:
             print(f"❌ Lỗi cập nhật câu hỏi: {e}")
         return False
     
+    @synchronized
     def add_image_to_question(self, quiz_name: str, question_index: int, image_data: bytes, 
                             image_name: str, description: str = "") -> bool:
         """Thêm hình ảnh vào câu hỏi với enhanced handling."""
@@ -1132,25 +1214,22 @@ class QuizTestEngine:
             if quiz_name not in self.saved_quizzes:
                 return False
             
-            file_path = Path(self.saved_quizzes[quiz_name]["file_path"])
+            question = self.quiz_store.get_question(quiz_name, question_index)
             
-            with open(file_path, 'r', encoding='utf-8') as f:
-                quiz_data = json.load(f)
-            
-            if 0 <= question_index < len(quiz_data):
+            if question is not None:
                 # Create image filename
                 safe_name = "".join(c for c in quiz_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
-                img_filename = f"{safe_name}_q{quiz_data[question_index].get('so_cau', question_index)}_{image_name}"
+                img_filename = f"{safe_name}_q{question.get('so_cau', question_index)}_{image_name}"
                 img_path = self.images_dir / img_filename
                 
                 # Save image
                 self._save_image_to_disk(image_data, img_path)
                 
                 # Update question metadata
-                if "images" not in quiz_data[question_index]:
-                    quiz_data[question_index]["images"] = []
+                if "images" not in question:
+                    question["images"] = []
                 
-                quiz_data[question_index]["images"].append({
+                question["images"].append({
                     "name": image_name,
                     "path": str(img_path.relative_to(self.quiz_storage_dir)),
                     "type": "image/jpeg",
@@ -1158,17 +1237,12 @@ class QuizTestEngine:
                     "description": description
                 })
                 
-                quiz_data[question_index]["has_images"] = True
-                quiz_data[question_index]["updated_time"] = datetime.now().isoformat()
-                
-                # Save quiz data
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(quiz_data, f, ensure_ascii=False, indent=2)
+                question["has_images"] = True
+                question["updated_time"] = datetime.now().isoformat()
                 
-                # Update index
-                self.saved_quizzes[quiz_name]["images_count"] = self.saved_quizzes[quiz_name].get("images_count", 0) + 1
-                self.saved_quizzes[quiz_name]["has_images"] = True
-                self._save_index()
+                # Save question data
+                self.quiz_store.update_question(quiz_name, question_index, question)
+                self.saved_quizzes[quiz_name] = self.quiz_store.get_quiz_info(quiz_name)
                 
                 print(f"✅ Đã thêm ảnh '{image_name}' vào câu {question_index + 1}")
                 return True
@@ -1177,19 +1251,17 @@ class QuizTestEngine:
             print(f"❌ Lỗi thêm ảnh: {e}")
         return False
     
+    @synchronized
     def remove_image_from_question(self, quiz_name: str, question_index: int, image_name: str) -> bool:
         """Xóa ảnh khỏi câu hỏi."""
         try:
             if quiz_name not in self.saved_quizzes:
                 return False
             
-            file_path = Path(self.saved_quizzes[quiz_name]["file_path"])
-            
-            with open(file_path, 'r', encoding='utf-8') as f:
-                quiz_data = json.load(f)
+            question = self.quiz_store.get_question(quiz_name, question_index)
             
-            if 0 <= question_index < len(quiz_data):
-                images = quiz_data[question_index].get("images", [])
+            if question is not None:
+                images = question.get("images", [])
                 updated_images = []
                 
                 for img in images:
@@ -1202,13 +1274,13 @@ class QuizTestEngine:
                     else:
                         updated_images.append(img)
                 
-                quiz_data[question_index]["images"] = updated_images
-                quiz_data[question_index]["has_images"] = len(updated_images) > 0
-                quiz_data[question_index]["updated_time"] = datetime.now().isoformat()
+                question["images"] = updated_images
+                question["has_images"] = len(updated_images) > 0
+                question["updated_time"] = datetime.now().isoformat()
                 
-                # Save quiz data
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(quiz_data, f, ensure_ascii=False, indent=2)
+                # Save question data
+                self.quiz_store.update_question(quiz_name, question_index, question)
+                self.saved_quizzes[quiz_name] = self.quiz_store.get_quiz_info(quiz_name)
                 
                 print(f"✅ Đã xóa ảnh '{image_name}' khỏi câu {question_index + 1}")
                 return True
@@ -1353,13 +1425,8 @@ class QuizTestEngine:
         total_tests = len(self.completed_tests)
         
         # Calculate storage size
-        total_size = 0
-        image_count = 0
-        
-        for quiz_info in self.saved_quizzes.values():
-            if Path(quiz_info["file_path"]).exists():
-                total_size += Path(quiz_info["file_path"]).stat().st_size
-            image_count += quiz_info.get("images_count", 0)
+        total_size = self.quiz_store.storage_size()
+        image_count = sum(quiz_info.get("images_count", 0) for quiz_info in self.saved_quizzes.values())
         
         # Count image files
         image_files = list(self.images_dir.glob("*"))
@@ -1379,4 +1446,19 @@ class QuizTestEngine:
                 "exports": str(self.exports_dir)
             },
             "engine_version": self.engine_version
-        }
\ No newline at end of file
+        }
+
+_shared_engine: Optional[QuizTestEngine] = None
+_shared_engine_lock = threading.Lock()
+
+def get_shared_quiz_engine() -> QuizTestEngine:
+    """Engine dùng chung cho mọi phiên trong process (khởi tạo đúng một lần).
+    
+    Quiz, lịch sử và thống kê được đọc một lần cho cả lớp thay vì mỗi phiên
+    trình duyệt một bản; phiên làm bài vẫn tách biệt theo session_id.
+    """
+    global _shared_engine
+    with _shared_engine_lock:
+        if _shared_engine is None:
+            _shared_engine = QuizTestEngine()
+        return _shared_engine
\ No newline at end of file
@@ -0,0 +1,227 @@
+"""
+Token-bucket rate limiter cho Gemini API - dùng chung giữa threads và processes.
+Giới hạn đồng thời requests-per-minute (RPM) và tokens-per-minute (TPM).
+Caller chỉ chờ đúng khoảng thời gian cần thiết để bucket đủ chỗ.
+"""
+
+import sqlite3
+import threading
+import time
+import logging
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class BucketState:
+    """Trạng thái của hai bucket (request và token) tại thời điểm updated_at.
+    
+    updated_at có thể nằm ở tương lai: khi bị block, bucket chỉ bắt đầu refill
+    từ lúc block kết thúc.
+    """
+    request_level: float
+    token_level: float
+    updated_at: float
+    blocked_until: float = 0.0
+
+class RateLimiter(ABC):
+    """Base interface cho rate limiter có thể thay thế."""
+    
+    @abstractmethod
+    def acquire(self, tokens: int = 0) -> float:
+        """Reserve one request và `tokens` tokens; block until allowed. Returns seconds waited."""
+        
+    @abstractmethod
+    def block_for(self, seconds: float) -> None:
+        """Chặn mọi caller trong `seconds` giây (ví dụ khi server trả về retry_delay)."""
+        
+    @abstractmethod
+    def estimated_wait(self, tokens: int = 0) -> float:
+        """Ước tính thời gian chờ nếu acquire ngay bây giờ (không reserve)."""
+
+class TokenBucketRateLimiter(RateLimiter):
+    """In-process token bucket, thread-safe.
+    
+    Dùng reservation: bucket được phép âm, mỗi caller trừ phần của mình rồi
+    ngủ đúng phần thiếu hụt, nên các thread đồng thời tự xếp hàng mà không
+    cần giữ lock trong lúc sleep. block_for đẩy thời điểm bucket bắt đầu refill
+    tới cuối block, nên sau block các caller vẫn đi lần lượt theo rate thay vì
+    cùng bắn một lúc.
+    """
+    
+    def __init__(self, requests_per_minute: float = 15, tokens_per_minute: float = 1_000_000,
+                 burst: int = 3):
+        self.request_rate = requests_per_minute / 60.0
+        self.token_rate = tokens_per_minute / 60.0
+        self.request_capacity = float(max(1, burst))
+        # Token bucket holds one minute of budget, capped by the same burst ratio
+        self.token_capacity = max(1.0, tokens_per_minute * self.request_capacity / max(requests_per_minute, 1))
+        self._lock = threading.Lock()
+        self._state = BucketState(self.request_capacity, self.token_capacity, time.time())
+        
+    def _refill(self, state: BucketState, now: float) -> BucketState:
+        """Return state refilled up to `now` (không refill trước updated_at)."""
+        elapsed = max(0.0, now - state.updated_at)
+        return BucketState(
+            request_level=min(self.request_capacity, state.request_level + elapsed * self.request_rate),
+            token_level=min(self.token_capacity, state.token_level + elapsed * self.token_rate),
+            updated_at=max(now, state.updated_at),
+            blocked_until=state.blocked_until
+        )
+        
+    def _reserve(self, state: BucketState, now: float, tokens: int) -> Tuple[BucketState, float]:
+        """Reserve capacity on `state`; returns (new_state, seconds to wait)."""
+        state = self._refill(state, now)
+        state.request_level -= 1
+        state.token_level -= min(tokens, self.token_capacity)
+        
+        # Deficits are paid back only once refilling starts (after any block)
+        wait = (state.updated_at - now) + max(
+            -state.request_level / self.request_rate if state.request_level < 0 else 0.0,
+            -state.token_level / self.token_rate if state.token_level < 0 else 0.0
+        )
+        return state, max(0.0, wait)
+        
+    def _block(self, state: BucketState, now: float, seconds: float) -> Tuple[BucketState, float]:
+        """Block until now + seconds: refilling restarts at the block end with at most one request ready."""
+        state = self._refill(state, now)
+        block_end = now + seconds
+        if block_end > state.updated_at:
+            state.request_level = min(state.request_level, 1.0)
+            state.updated_at = block_end
+        state.blocked_until = max(state.blocked_until, block_end)
+        return state, 0.0
+        
+    def _blocked_remaining(self) -> float:
+        """Giây còn lại của block hiện tại (0 nếu không bị block)."""
+        with self._lock:
+            return max(0.0, self._state.blocked_until - time.time())
+            
+    def _sleep_through(self, wait: float) -> float:
+        """Sleep `wait`, then keep sleeping through any block set meanwhile. Returns total slept."""
+        waited = 0.0
+        while wait > 0:
+            time.sleep(wait)
+            waited += wait
+            wait = self._blocked_remaining()
+        return waited
+        
+    def _wait_for(self, state: BucketState, now: float, tokens: int) -> float:
+        """Wait time without reserving."""
+        return self._reserve(BucketState(**state.__dict__), now, tokens)[1]
+        
+    def acquire(self, tokens: int = 0) -> float:
+        with self._lock:
+            self._state, wait = self._reserve(self._state, time.time(), tokens)
+        return self._sleep_through(wait)
+        
+    def block_for(self, seconds: float) -> None:
+        with self._lock:
+            self._state, _ = self._block(self._state, time.time(), seconds)
+            
+    def estimated_wait(self, tokens: int = 0) -> float:
+        with self._lock:
+            return self._wait_for(self._state, time.time(), tokens)
+
+class SQLiteTokenBucketRateLimiter(TokenBucketRateLimiter):
+    """Token bucket với state lưu trong SQLite - chia sẻ giữa nhiều processes.
+    
+    Mỗi acquire là một transaction BEGIN IMMEDIATE ngắn (đọc state, reserve,
+    ghi state), nên các process Streamlit/worker cùng key dùng chung quota.
+    """
+    
+    def __init__(self, db_path: str, key: str, requests_per_minute: float = 15,
+                 tokens_per_minute: float = 1_000_000, burst: int = 3):
+        super().__init__(requests_per_minute, tokens_per_minute, burst)
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.key = key
+        
+        conn = self._connect()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rate_buckets (
+                    key TEXT PRIMARY KEY,
+                    request_level REAL NOT NULL,
+                    token_level REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    blocked_until REAL NOT NULL DEFAULT 0
+                )
+            """)
+        finally:
+            conn.close()
+            
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+        
+    def _transact(self, update) -> float:
+        """Run `update(state, now) -> (state, result)` atomically; returns result."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT request_level, token_level, updated_at, blocked_until FROM rate_buckets WHERE key = ?",
+                (self.key,)
+            ).fetchone()
+            now = time.time()
+            state = BucketState(*row) if row else BucketState(self.request_capacity, self.token_capacity, now)
+            
+            state, result = update(state, now)
+            
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_buckets VALUES (?, ?, ?, ?, ?)",
+                (self.key, state.request_level, state.token_level, state.updated_at, state.blocked_until)
+            )
+            conn.execute("COMMIT")
+            return result
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+            
+    def acquire(self, tokens: int = 0) -> float:
+        with self._lock:
+            wait = self._transact(lambda state, now: self._reserve(state, now, tokens))
+        return self._sleep_through(wait)
+        
+    def block_for(self, seconds: float) -> None:
+        with self._lock:
+            self._transact(lambda state, now: self._block(state, now, seconds))
+            
+    def _blocked_remaining(self) -> float:
+        with self._lock:
+            return self._transact(lambda state, now: (state, max(0.0, state.blocked_until - now)))
+            
+    def estimated_wait(self, tokens: int = 0) -> float:
+        with self._lock:
+            return self._transact(lambda state, now: (state, self._wait_for(state, now, tokens)))
+
+_shared_limiters: Dict[Tuple, RateLimiter] = {}
+_shared_lock = threading.Lock()
+
+def get_shared_rate_limiter(key: str, requests_per_minute: float = 15,
+                            tokens_per_minute: float = 1_000_000, burst: int = 3,
+                            db_path: Optional[str] = None) -> RateLimiter:
+    """Lấy limiter dùng chung trong process cho `key` (SQLite-backed nếu có db_path)."""
+    cache_key = (key, requests_per_minute, tokens_per_minute, burst, db_path)
+    
+    with _shared_lock:
+        limiter = _shared_limiters.get(cache_key)
+        if limiter is None:
+            if db_path:
+                try:
+                    limiter = SQLiteTokenBucketRateLimiter(
+                        db_path, key, requests_per_minute, tokens_per_minute, burst
+                    )
+                except (sqlite3.Error, OSError) as e:
+                    logger.warning(f"⚠️ Không mở được rate limit store {db_path}, dùng in-process limiter: {e}")
+            if limiter is None:
+                limiter = TokenBucketRateLimiter(requests_per_minute, tokens_per_minute, burst)
+            _shared_limiters[cache_key] = limiter
+            
+        return limiter
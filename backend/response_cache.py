@@ -0,0 +1,184 @@
+"""
+Persistent content-addressed cache cho Gemini responses.
+Key = SHA-256 của model name + prompt text + image bytes; lưu trong SQLite
+với TTL và LRU eviction theo tổng dung lượng.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+class ResponseCache:
+    """On-disk response cache, an toàn khi dùng từ nhiều threads và processes."""
+    
+    def __init__(self, db_path: str, ttl_seconds: float = 7 * 24 * 3600,
+                 max_bytes: int = 256 * 1024 * 1024):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        
+        conn = self._connect()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        finally:
+            conn.close()
+            
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(str(self.db_path), timeout=30)
+        
+    @staticmethod
+    def make_key(model_name: str, content: Union[str, List[Any]]) -> str:
+        """Hash model name, prompt text và image bytes thành cache key."""
+        digest = hashlib.sha256()
+        digest.update(model_name.encode("utf-8"))
+        
+        parts = content if isinstance(content, list) else [content]
+        for part in parts:
+            if isinstance(part, str):
+                digest.update(b"\x00text\x00")
+                digest.update(part.encode("utf-8"))
+            elif isinstance(part, Image.Image):
+                digest.update(b"\x00image\x00")
+                digest.update(f"{part.mode}:{part.size[0]}x{part.size[1]}".encode("ascii"))
+                digest.update(part.tobytes())
+            elif isinstance(part, (bytes, bytearray, memoryview)):
+                digest.update(b"\x00bytes\x00")
+                digest.update(part)
+            else:
+                digest.update(b"\x00repr\x00")
+                digest.update(repr(part).encode("utf-8"))
+                
+        return digest.hexdigest()
+        
+    def get(self, key: str) -> Optional[str]:
+        """Trả về response đã cache hoặc None nếu miss/hết hạn."""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                    
+                response, created_at = row
+                if now - created_at > self.ttl_seconds:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    conn.commit()
+                    return None
+                    
+                conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                conn.commit()
+                return response
+            finally:
+                conn.close()
+                
+    def set(self, key: str, response: str) -> None:
+        """Lưu response và evict entries cũ nhất nếu vượt max_bytes."""
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                    (key, response, size, now, now)
+                )
+                conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+                self._evict_lru(conn)
+                conn.commit()
+            finally:
+                conn.close()
+                
+    def delete(self, key: str) -> None:
+        """Xóa một entry (ví dụ response không còn parse được)."""
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                conn.commit()
+            finally:
+                conn.close()
+                
+    def _evict_lru(self, conn: sqlite3.Connection) -> None:
+        """Xóa entries ít được dùng nhất cho đến khi tổng dung lượng <= max_bytes."""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+            
+        evicted = 0
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+            
+        logger.info(f"🧹 Response cache evicted {evicted} entries")
+        
+    def clear(self) -> None:
+        """Xóa toàn bộ cache."""
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute("DELETE FROM responses")
+                conn.commit()
+            finally:
+                conn.close()
+                
+    def get_info(self) -> Dict[str, Any]:
+        """Thông tin tổng quan về cache."""
+        conn = self._connect()
+        try:
+            count, total = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        finally:
+            conn.close()
+            
+        return {
+            "entries": count,
+            "size": f"{total / 1024:.1f} KB",
+            "max_size": f"{self.max_bytes / 1024 / 1024:.0f} MB",
+            "ttl_hours": round(self.ttl_seconds / 3600, 1),
+            "path": str(self.db_path)
+        }
+
+_shared_caches: Dict[Tuple, ResponseCache] = {}
+_shared_lock = threading.Lock()
+
+def get_shared_response_cache(db_path: str, ttl_seconds: float = 7 * 24 * 3600,
+                              max_bytes: int = 256 * 1024 * 1024) -> Optional[ResponseCache]:
+    """Lấy cache dùng chung trong process; None nếu không mở được store."""
+    cache_key = (db_path, ttl_seconds, max_bytes)
+    
+    with _shared_lock:
+        if cache_key not in _shared_caches:
+            try:
+                _shared_caches[cache_key] = ResponseCache(db_path, ttl_seconds, max_bytes)
+            except (sqlite3.Error, OSError) as e:
+                logger.warning(f"⚠️ Không mở được response cache {db_path}: {e}")
+                return None
+                
+        return _shared_caches[cache_key]
@@ -9,21 +9,94 @@ import re
 import os
 import io
 import time
-import docx
-from typing import Dict, Optional, Tuple, Any, List, Union
+from docx.oxml.ns import qn
+from docx.table import Table
+from docx.text.paragraph import Paragraph
+from typing import Dict, Optional, Tuple, Any, List, Union, Callable, Iterator
 from PIL import Image
-import google.generativeai as genai
 from dotenv import load_dotenv
 import random
 import base64
 from pathlib import Path
-from dataclasses import dataclass
+from dataclasses import dataclass, asdict
 from enum import Enum
 import logging
-from zipfile import ZipFile
+import threading
+import hashlib
+import queue
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .rate_limiter import RateLimiter, get_shared_rate_limiter
+from .response_cache import ResponseCache, get_shared_response_cache
+from .llm_backends import LLMBackend, GeminiBackend
+from .answer_sheet import preprocess_answer_sheet, split_into_row_bands, merge_band_answers
+from .docx_source import DocxSource
+from .quiz_test_engine import ImageData
+from .quiz_jobs import QuizJobStore, JobHeartbeat, JOB_STATUS_RUNNING, JOB_STATUS_COMPLETED, JOB_STATUS_CANCELLED, JOB_STATUS_FAILED
 
 load_dotenv()
 
+# "Câu 12." / "Question 3:" / "5)" header at the start of a question block
+QUESTION_HEADER_PREFIX = re.compile(r'^(?:Câu|Question|Bài)?\s*\d+\s*[\.:\)]\s*', re.IGNORECASE)
+
+# One answer-key token in any supported format: "1. A", "Câu 2) BD", "3: C", "4 - D",
+# "Question 5 A", tab-separated spreadsheet rows. Not preceded by a digit/decimal point
+# and not followed by a letter, so "3.5 A" and "2 cách" are not read as answers.
+ANSWER_TOKEN_PATTERN = re.compile(
+    r'(?<!\d)(?<!\d[.,])(?:(?P<prefix>Câu|Question)\s*)?(?P<num>\d{1,4})'
+    r'(?:\s*(?P<sep>[\.\):\-])\s*|\s+)'
+    r'(?P<answer>[A-D]{1,4})(?![^\W\d_])',
+    re.IGNORECASE
+)
+
+# Question header families for the block splitter, in the order the former
+# re.split patterns were tried: (family, keyword, accepted separators).
+# keyword None = header must start a line; "newline" additionally excludes offset 0.
+QUESTION_HEADER_FAMILIES = [
+    ("cau", "câu", ".:"),
+    ("question", "question", ".:"),
+    ("line", None, ".:"),
+    ("newline", None, ".:"),
+    ("bai", "bài", ".:"),
+    ("paren", None, ")"),
+    ("problem", "problem", None),
+]
+DIGIT_RUN_PATTERN = re.compile(r'\d+')
+CHOICE_MARKER_PATTERN = re.compile(r'[A-D][\.:\)]')
+SENTENCE_END_PATTERN = re.compile(r'[\.!?]\s*(?:\n|$)')
+
+# do_kho/mon_hoc of locally compiled questions: no model looked at them, so they are
+# marked unclassified instead of posing as "trung_binh"/"auto_detect" in the statistics
+UNCLASSIFIED_LABEL = "chua_phan_loai"
+
+# WordprocessingML tags for the document-order body walk
+DOCX_PARAGRAPH_TAG = qn('w:p')
+DOCX_TABLE_TAG = qn('w:tbl')
+DOCX_SDT_TAG = qn('w:sdt')
+DOCX_SDT_CONTENT_TAG = qn('w:sdtContent')
+DOCX_BLIP_TAG = qn('a:blip')
+# python-docx's nsmap has no "v" prefix, so the VML tag is spelled out
+DOCX_VML_IMAGEDATA_TAG = '{urn:schemas-microsoft-com:vml}imagedata'
+DOCX_EMBED_ATTR = qn('r:embed')
+DOCX_RELID_ATTR = qn('r:id')
+
+# Question starts recognised in paragraph/table-row blocks
+STRUCTURE_QUESTION_PATTERNS = [
+    re.compile(r'^(?:Câu\s*)?(\d+)\s*[\.:\)]', re.IGNORECASE),
+    re.compile(r'^(?:Question\s*)?(\d+)\s*[\.:\)]', re.IGNORECASE),
+    re.compile(r'^(?:Bài\s*)?(\d+)\s*[\.:\)]', re.IGNORECASE),
+    re.compile(r'^\d+\.\s*', re.IGNORECASE),
+    re.compile(r'^Problem\s*(\d+)', re.IGNORECASE),
+]
+
+# Server-advised retry delay formats seen in Gemini 429 errors
+RETRY_DELAY_PATTERNS = [
+    re.compile(r'retry_delay\s*\{\s*seconds:\s*(\d+)(?:\s*nanos:\s*(?P<nanos>\d+))?'),
+    re.compile(r'"?retryDelay"?\s*:\s*"(\d+(?:\.\d+)?)s"'),
+    re.compile(r'retry in (\d+(?:\.\d+)?)\s*s', re.IGNORECASE),
+]
+
 class RequestType(Enum):
     """Enum for different types of API requests."""
     TEXT_ONLY = "text"
@@ -59,18 +132,30 @@ class EnhancedMultimodalQuizAgent:
     Được thiết kế theo enterprise-level standards cho giáo dục Việt Nam.
     """
     
-    def __init__(self, api_key: str = None, enable_logging: bool = True):
-        """Initialize Professional Multimodal Agent."""
+    def __init__(self, api_key: str = None, enable_logging: bool = True,
+                 rate_limiter: RateLimiter = None, response_cache: ResponseCache = None,
+                 job_store: QuizJobStore = None, backend: LLMBackend = None):
+        """Initialize Professional Multimodal Agent.
+        
+        rate_limiter: limiter dùng chung; mặc định là token bucket SQLite-backed
+        chia sẻ giữa mọi agent/process dùng cùng API key, với RPM/TPM lấy từ
+        QUIZ_REQUESTS_PER_MINUTE / QUIZ_TOKENS_PER_MINUTE (sửa agent.config sau
+        khi khởi tạo không đổi limiter).
+        response_cache: cache response trên disk; mặc định dùng chung theo cache_path.
+        job_store: nơi lưu checkpoint của jobs (mặc định quiz_storage/jobs).
+        backend: LLM backend thay thế (ví dụ FakeLLMBackend để benchmark offline);
+        khi có backend thì không cần API key.
+        """
         self.api_key = api_key or os.getenv("GOOGLE_API_KEY")
-        if not self.api_key:
+        if not self.api_key and backend is None:
             raise ValueError("❌ Cần có API key để khởi động agent")
         
         # Setup logging
         self._setup_logging(enable_logging)
         
-        # Initialize Gemini với professional configuration
-        genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
+        # Initialize model backend (Gemini mặc định)
+        self.backend = backend or GeminiBackend(self.api_key, 'gemini-2.0-flash')
+        self.model_name = self.backend.model_name
         
         # Agent metadata
         self.agent_info = {
@@ -87,16 +172,78 @@ class EnhancedMultimodalQuizAgent:
         self.config = {
             "requests_count": 0,
             "last_request_time": 0,
-            "base_delay": 0.5,
-            "max_retries": 3,
+            # Read once when the shared limiter is built; change via env or pass rate_limiter=
+            "requests_per_minute": float(os.getenv("QUIZ_REQUESTS_PER_MINUTE", 15)),  # Gemini free tier
+            "tokens_per_minute": float(os.getenv("QUIZ_TOKENS_PER_MINUTE", 1_000_000)),
+            "rate_limit_burst": 3,
+            "rate_limit_db": os.getenv("QUIZ_RATE_LIMIT_DB", "quiz_storage/rate_limits.db"),
+            "max_retries": 8,
+            "retry_deadline": 300,  # Tổng thời gian tối đa cho một request kể cả retry (giây)
+            "retry_base_delay": 2,
+            "retry_max_delay": 20,
             "batch_size": 10,
+            "compile_mode": "single",  # "single" = 1 câu/request, "batch" = batch_size câu/request
             "batch_delay": 5,
             "quota_exceeded_delay": 30,
             "max_image_size": 10 * 1024 * 1024,  # 10MB
             "supported_formats": ['.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp'],
             "max_docx_images": 50,  # Max images per DOCX
+            "answer_sheet_preprocess": True,  # Grayscale + autocontrast (+ deskew) before answer OCR
+            "answer_sheet_deskew": True,
+            "answer_band_height": 700,  # Row band height (px) for tiled answer OCR; 0 = whole sheet
+            "answer_band_overlap": 40,
+            "ocr_workers": 4,  # Concurrent image OCR requests (shared rate limiter still applies)
+            "ocr_pack_max_pixels": 512 * 512,  # Images at most this large are packed together
+            "ocr_pack_size": 4,  # Max small images per OCR request
+            "compile_workers": 1,  # 1 = serial, >1 = bounded thread pool
+            "cache_enabled": True,
+            "cache_path": os.getenv("QUIZ_RESPONSE_CACHE", "quiz_storage/response_cache.db"),
+            "jobs_dir": os.getenv("QUIZ_JOBS_DIR", "quiz_storage/jobs"),
+            "local_compile": False,  # Opt-in: compile well-formed blocks without the LLM (do_kho/mon_hoc unclassified)
+            "local_compile_threshold": 0.9,
+            "cache_ttl": 7 * 24 * 3600,  # 7 ngày
+            "cache_max_bytes": 256 * 1024 * 1024,
         }
         
+        # Shared state lock for concurrent compilation
+        self._state_lock = threading.RLock()
+        
+        # Choice marker offsets of the last pattern-extracted question blocks
+        self.question_block_layout = {}
+        
+        # Format/conflict report of the last regex answer parse
+        self.answer_parse_report = {}
+        
+        # Embedded DOCX images of the last extraction: question -> rIds, rId -> image part
+        self.docx_image_anchors = {}
+        self._docx_image_parts = {}
+        self._docx_image_cache = {}
+        self._docx_source = None
+        
+        # Progress events and cancellation for the current run
+        self._progress_callback = None
+        self._progress_lock = threading.Lock()
+        self._cancel_event = threading.Event()
+        
+        # Quota is per API key, so every agent using the same key shares one bucket
+        self.rate_limiter = rate_limiter or get_shared_rate_limiter(
+            key=f"{self.backend.name}:{hashlib.sha256((self.api_key or self.model_name).encode()).hexdigest()[:16]}",
+            requests_per_minute=self.config["requests_per_minute"],
+            tokens_per_minute=self.config["tokens_per_minute"],
+            burst=self.config["rate_limit_burst"],
+            db_path=self.config["rate_limit_db"]
+        )
+        
+        self.response_cache = response_cache
+        if self.response_cache is None and self.config["cache_enabled"]:
+            self.response_cache = get_shared_response_cache(
+                self.config["cache_path"],
+                ttl_seconds=self.config["cache_ttl"],
+                max_bytes=self.config["cache_max_bytes"]
+            )
+        
+        self._job_store = job_store
+        
         # Processing state
         self.failed_questions = []
         self.processing_stats = {
@@ -105,8 +252,14 @@ class EnhancedMultimodalQuizAgent:
             "failed_requests": 0,
             "quota_events": 0,
             "images_processed": 0,
-            "docx_images_extracted": 0
+            "docx_images_extracted": 0,
+            "rate_limit_wait_seconds": 0.0,
+            "quota_wait_seconds": 0.0,
+            "cache_hits": 0,
+            "cache_misses": 0
         }
+        self._stall_until = 0.0
+        self._stall_reason = ""
         
         self.logger.info(f"✨ {self.agent_info['name']} v{self.agent_info['version']} initialized")
         self.logger.info(f"🎯 {self.agent_info['specialization']}")
@@ -124,31 +277,35 @@ class EnhancedMultimodalQuizAgent:
             handler.setFormatter(formatter)
             self.logger.addHandler(handler)
     
-    def _smart_rate_limit(self) -> None:
-        """Intelligent rate limiting với exponential backoff."""
-        current_time = time.time()
-        time_since_last = current_time - self.config["last_request_time"]
-        
-        # Calculate dynamic delay based on request count
-        requests_count = self.config["requests_count"]
-        if requests_count > 50:
-            delay = self.config["base_delay"] * 3
-        elif requests_count > 30:
-            delay = self.config["base_delay"] * 2
-        elif requests_count > 15:
-            delay = self.config["base_delay"] * 1.5
-        else:
-            delay = self.config["base_delay"]
-        
-        # Apply delay if needed
-        if time_since_last < delay:
-            sleep_time = delay - time_since_last
-            if sleep_time > 0:
-                self.logger.info(f"⏳ Rate limiting: waiting {sleep_time:.1f}s")
-                time.sleep(sleep_time)
-        
-        self.config["last_request_time"] = time.time()
-        self.config["requests_count"] += 1
+    def _smart_rate_limit(self, tokens: int = 0) -> None:
+        """Token-bucket rate limiting (RPM + TPM), chỉ chờ đúng thời gian cần thiết."""
+        waited = self.rate_limiter.acquire(tokens)
+        if waited > 0.05:
+            self.logger.info(f"⏳ Rate limiting: waited {waited:.1f}s")
+        if waited >= 1:
+            self._emit_progress("rate_limit_wait", seconds=round(waited, 1))
+        
+        with self._state_lock:
+            self.config["last_request_time"] = time.time()
+            self.config["requests_count"] += 1
+            self.processing_stats["total_requests"] += 1
+            self.processing_stats["rate_limit_wait_seconds"] += waited
+    
+    def _estimate_request_tokens(self, request: "APIRequest") -> int:
+        """Rough prompt token estimate: ~4 chars/token, ~258 tokens per image."""
+        parts = request.content if isinstance(request.content, list) else [request.content]
+        tokens = 0
+        for part in parts:
+            if isinstance(part, str):
+                tokens += len(part) // 4 + 1
+            else:
+                tokens += 258
+        return tokens
+    
+    def _increment_stat(self, key: str, amount: int = 1) -> None:
+        """Thread-safe increment of a processing stat."""
+        with self._state_lock:
+            self.processing_stats[key] = self.processing_stats.get(key, 0) + amount
     
     def _create_api_request(self, content: Union[str, List[Any]], metadata: Dict = None) -> APIRequest:
         """Create properly typed API request."""
@@ -167,33 +324,51 @@ class EnhancedMultimodalQuizAgent:
             metadata=metadata or {}
         )
     
-    def _execute_api_request(self, request: APIRequest) -> ProcessingResult:
-        """Execute API request với comprehensive error handling."""
+    def _execute_api_request(self, request: APIRequest, parse: Callable[[str], Any] = None) -> ProcessingResult:
+        """Execute API request với comprehensive error handling.
+        
+        parse: chuyển response thành payload (mặc định giữ nguyên text). Chỉ response
+        là JSON hoàn chỉnh và có payload hợp lệ (truthy) mới được cache, nên JSON hỏng
+        hay bị cắt (kể cả khi đã salvage được một phần) không bị replay suốt TTL;
+        entry cache không đạt điều kiện đó sẽ bị xóa và request lại.
+        """
+        parse = parse or (lambda text: text)
+        cache_key = self._lookup_cache_key(request)
+        if cache_key:
+            cached = self._read_cache(cache_key)
+            if cached is not None:
+                payload = parse(cached) if self._is_complete_json(cached) else None
+                if payload:
+                    self._increment_stat("cache_hits")
+                    self.logger.debug(f"💾 Cache hit: {request.request_type.value}")
+                    return ProcessingResult(
+                        success=True,
+                        data=payload,
+                        metadata={"request_type": request.request_type.value, "cache_hit": True}
+                    )
+                self._delete_cache(cache_key)
+            self._increment_stat("cache_misses")
+        
         try:
-            self._smart_rate_limit()
-            self.processing_stats["total_requests"] += 1
-            
-            # Execute based on request type
-            if request.request_type == RequestType.TEXT_ONLY:
-                response = self.model.generate_content(request.content)
-            else:
-                # Multimodal request
-                response = self.model.generate_content(request.content)
+            self._smart_rate_limit(self._estimate_request_tokens(request))
             
-            # Extract text from response
-            response_text = self._extract_response_text(response)
+            response_text = self.backend.generate(request.content, request.metadata)
             
-            self.processing_stats["successful_requests"] += 1
+            self._increment_stat("successful_requests")
             self.logger.debug(f"✅ API request successful: {request.request_type.value}")
             
+            payload = parse(response_text)
+            if cache_key and payload and self._is_complete_json(response_text):
+                self._write_cache(cache_key, response_text)
+            
             return ProcessingResult(
                 success=True,
-                data=response_text,
+                data=payload,
                 metadata={"request_type": request.request_type.value}
             )
             
         except Exception as e:
-            self.processing_stats["failed_requests"] += 1
+            self._increment_stat("failed_requests")
             error_msg = str(e).lower()
             
             self.logger.error(f"❌ API request failed: {e}")
@@ -207,23 +382,52 @@ class EnhancedMultimodalQuizAgent:
                 }
             )
     
-    def _extract_response_text(self, response) -> str:
-        """Safely extract text from Gemini response."""
+    def _lookup_cache_key(self, request: APIRequest) -> Optional[str]:
+        """Content-addressed cache key (model + prompt + image bytes), None if caching is off."""
+        if not self.response_cache:
+            return None
         try:
-            # Handle different response types
-            if hasattr(response, 'text'):
-                return response.text
-            elif hasattr(response, 'candidates') and response.candidates:
-                candidate = response.candidates[0]
-                if hasattr(candidate, 'content'):
-                    return candidate.content.parts[0].text
-            
-            # Fallback
-            return str(response)
-            
+            return ResponseCache.make_key(self.model_name, request.content)
         except Exception as e:
-            self.logger.warning(f"⚠️ Response extraction issue: {e}")
-            return str(response)
+            self.logger.warning(f"⚠️ Cache key error: {e}")
+            return None
+    
+    def _read_cache(self, cache_key: str) -> Optional[str]:
+        """Read from cache; cache failures never break a request."""
+        try:
+            return self.response_cache.get(cache_key)
+        except Exception as e:
+            self.logger.warning(f"⚠️ Cache read failed: {e}")
+            return None
+    
+    def _write_cache(self, cache_key: str, response_text: str) -> None:
+        """Write to cache; cache failures never break a request."""
+        try:
+            self.response_cache.set(cache_key, response_text)
+        except Exception as e:
+            self.logger.warning(f"⚠️ Cache write failed: {e}")
+    
+    def _is_complete_json(self, response_text: str) -> bool:
+        """True if the response (minus markdown fences) decodes as one JSON document."""
+        cleaned = (response_text or "").strip()
+        if cleaned.startswith("```json"):
+            cleaned = cleaned[7:]
+        if cleaned.startswith("```"):
+            cleaned = cleaned[3:]
+        if cleaned.endswith("```"):
+            cleaned = cleaned[:-3]
+        try:
+            json.loads(cleaned)
+            return True
+        except ValueError:
+            return False
+    
+    def _delete_cache(self, cache_key: str) -> None:
+        """Drop a cached response that no longer parses; cache failures never break a request."""
+        try:
+            self.response_cache.delete(cache_key)
+        except Exception as e:
+            self.logger.warning(f"⚠️ Cache delete failed: {e}")
     
     def _classify_error(self, error_str: str) -> str:
         """Classify error type for better handling."""
@@ -236,54 +440,114 @@ class EnhancedMultimodalQuizAgent:
         else:
             return "unknown_error"
     
+    def _parse_retry_delay(self, error_str: str) -> Optional[float]:
+        """Extract the server-advised retry delay (seconds) from a Gemini error, if any."""
+        if not error_str:
+            return None
+        
+        for pattern in RETRY_DELAY_PATTERNS:
+            match = pattern.search(error_str)
+            if match:
+                seconds = float(match.group(1))
+                nanos = match.groupdict().get("nanos")
+                if nanos:
+                    seconds += int(nanos) / 1e9
+                return seconds
+        return None
+    
+    def _compute_retry_wait(self, attempt: int, error_type: str, server_delay: Optional[float]) -> float:
+        """Backoff with jitter; the server-advised delay is the floor when present."""
+        if server_delay is not None:
+            # Server knows when the window reopens: wait just past it
+            return server_delay + random.uniform(0.2, 1.0)
+        
+        cap = self.config["quota_exceeded_delay"] if error_type == "quota_exceeded" else self.config["retry_max_delay"]
+        backoff = min(cap, self.config["retry_base_delay"] * (2 ** attempt))
+        # Equal jitter: keep half, randomize half
+        return backoff / 2 + random.uniform(0, backoff / 2)
+    
+    def _begin_stall(self, seconds: float, reason: str) -> None:
+        """Record an expected stall so callers/UI can see how long compilation will wait."""
+        with self._state_lock:
+            self._stall_until = max(self._stall_until, time.time() + seconds)
+            self._stall_reason = reason
+            self.processing_stats["quota_wait_seconds"] += seconds
+    
+    def get_stall_status(self) -> Dict[str, Any]:
+        """How long requests are expected to stall right now (quota backoff + rate limiter)."""
+        with self._state_lock:
+            backoff_remaining = max(0.0, self._stall_until - time.time())
+            reason = self._stall_reason if backoff_remaining > 0 else ""
+        
+        limiter_wait = self.rate_limiter.estimated_wait()
+        expected = max(backoff_remaining, limiter_wait)
+        
+        return {
+            "stalled": expected > 0,
+            "expected_wait_seconds": round(expected, 1),
+            "backoff_remaining_seconds": round(backoff_remaining, 1),
+            "rate_limiter_wait_seconds": round(limiter_wait, 1),
+            "reason": reason or ("rate_limit" if limiter_wait > 0 else ""),
+            "total_quota_wait_seconds": round(self.processing_stats["quota_wait_seconds"], 1)
+        }
+    
     def _make_api_request_with_enhanced_recovery(self, 
                                                content: Union[str, List[Any]], 
                                                retries: int = 0, 
-                                               metadata: Dict = None) -> str:
-        """Enhanced API request với professional recovery mechanism."""
-        request = self._create_api_request(content, metadata)
-        request.retry_count = retries
-        
-        result = self._execute_api_request(request)
+                                               metadata: Dict = None,
+                                               parse: Callable[[str], Any] = None) -> Any:
+        """Enhanced API request với deadline-aware, non-recursive recovery.
         
-        if result.success:
-            return result.data
-        
-        # Handle specific error types
-        error_type = result.metadata.get("error_type", "unknown")
+        Với parse, trả về payload đã parse thay vì text (xem _execute_api_request).
+        """
+        deadline = time.time() + self.config["retry_deadline"]
+        attempt = retries
         
-        if error_type == "quota_exceeded" and retries < self.config["max_retries"]:
-            self.processing_stats["quota_events"] += 1
+        while True:
+            request = self._create_api_request(content, metadata)
+            request.retry_count = attempt
             
-            # Enhanced backoff strategy
-            if retries == 0:
-                wait_time = 2 + random.uniform(0.5, 1.5)
-            elif retries == 1:
-                wait_time = 5 + random.uniform(0.5, 1.5)
-            else:
-                wait_time = self.config["quota_exceeded_delay"] + random.uniform(0.5, 2.0)
+            result = self._execute_api_request(request, parse)
             
-            self.logger.warning(
-                f"⏳ Quota limit, waiting {wait_time:.1f}s before retry {retries + 1}/{self.config['max_retries']}"
-            )
-            time.sleep(wait_time)
+            if result.success:
+                return result.data
             
-            return self._make_api_request_with_enhanced_recovery(content, retries + 1, metadata)
-        
-        elif error_type == "safety_filter":
-            raise Exception("❌ Content bị từ chối bởi safety filter. Vui lòng kiểm tra nội dung.")
-        
-        elif error_type == "invalid_request":
-            raise Exception("❌ Request không hợp lệ. Vui lòng kiểm tra dữ liệu đầu vào.")
-        
-        else:
-            if retries < self.config["max_retries"]:
-                wait_time = (2 ** retries) + random.uniform(0.5, 1.5)
-                self.logger.warning(f"⚠️ Retrying in {wait_time:.1f}s: {result.error}")
-                time.sleep(wait_time)
-                return self._make_api_request_with_enhanced_recovery(content, retries + 1, metadata)
-            else:
+            # Handle specific error types
+            error_type = result.metadata.get("error_type", "unknown")
+            
+            if error_type == "safety_filter":
+                raise Exception("❌ Content bị từ chối bởi safety filter. Vui lòng kiểm tra nội dung.")
+            
+            if error_type == "invalid_request":
+                raise Exception("❌ Request không hợp lệ. Vui lòng kiểm tra dữ liệu đầu vào.")
+            
+            if error_type == "quota_exceeded":
+                self._increment_stat("quota_events")
+            
+            server_delay = self._parse_retry_delay(result.error)
+            wait_time = self._compute_retry_wait(attempt - retries, error_type, server_delay)
+            remaining = deadline - time.time()
+            
+            if attempt >= self.config["max_retries"] or wait_time > remaining:
+                if error_type == "quota_exceeded":
+                    raise Exception(f"QUOTA_EXCEEDED_AFTER_RETRIES: {result.error}")
                 raise Exception(f"Max retries exceeded: {result.error}")
+            
+            if error_type == "quota_exceeded":
+                # Every agent sharing the limiter backs off, not just this thread
+                self.rate_limiter.block_for(wait_time)
+                self._begin_stall(wait_time, "quota_exceeded")
+                self._emit_progress("quota_wait", seconds=round(wait_time, 1), server_delay=server_delay,
+                                    attempt=attempt + 1, task=(metadata or {}).get("task", ""))
+                source = f"server retry_delay {server_delay:.0f}s" if server_delay is not None else "backoff"
+                self.logger.warning(
+                    f"⏳ Quota limit ({source}), waiting {wait_time:.1f}s before retry {attempt + 1}/{self.config['max_retries']}"
+                )
+            else:
+                self.logger.warning(f"⚠️ Retrying in {wait_time:.1f}s: {result.error}")
+            
+            time.sleep(wait_time)
+            attempt += 1
     
     def process_text_answers(self, answer_text: str) -> Dict[int, str]:
         """Process text answers với enhanced Vietnamese support."""
@@ -299,11 +563,11 @@ class EnhancedMultimodalQuizAgent:
         prompt = self._create_answer_parsing_prompt(answer_text)
         
         try:
-            response_text = self._make_api_request_with_enhanced_recovery(
+            result = self._make_api_request_with_enhanced_recovery(
                 prompt, 
-                metadata={"task": "parse_text_answers"}
+                metadata={"task": "parse_text_answers"},
+                parse=self._parse_json_response
             )
-            result = self._parse_json_response(response_text)
             
             # Validate and normalize
             validated_result = self._validate_answers(result)
@@ -322,19 +586,33 @@ class EnhancedMultimodalQuizAgent:
         try:
             # Validate and optimize image
             image = self._prepare_image_for_processing(image_data)
-            self.processing_stats["images_processed"] += 1
+            self._increment_stat("images_processed")
             
-            # Create OCR prompt
-            prompt = self._create_ocr_prompt()
+            if self.config.get("answer_sheet_preprocess", True):
+                image, angle = preprocess_answer_sheet(image, deskew=self.config.get("answer_sheet_deskew", True))
+                if angle:
+                    self.logger.info(f"📐 Deskewed answer sheet by {angle:.1f}°")
             
-            # Make multimodal API request
-            response_text = self._make_api_request_with_enhanced_recovery(
-                [prompt, image],
-                metadata={"task": "ocr_image_answers"}
+            bands = split_into_row_bands(
+                image, self.config.get("answer_band_height", 0), self.config.get("answer_band_overlap", 0)
             )
             
-            result = self._parse_json_response(response_text)
-            validated_result = self._validate_answers(result)
+            if len(bands) > 1:
+                validated_result = self._ocr_answer_bands(image, bands)
+                if not validated_result:
+                    self.logger.warning("⚠️ Band OCR found no answers, retrying with the whole sheet")
+            else:
+                validated_result = {}
+            
+            if not validated_result:
+                # Make multimodal API request
+                result = self._make_api_request_with_enhanced_recovery(
+                    [self._create_ocr_prompt(), image],
+                    metadata={"task": "ocr_image_answers"},
+                    parse=self._parse_json_response
+                )
+                
+                validated_result = self._validate_answers(result)
             
             self.logger.info(f"✅ OCR processing successful: {len(validated_result)} answers extracted")
             return validated_result
@@ -343,6 +621,42 @@ class EnhancedMultimodalQuizAgent:
             self.logger.error(f"❌ Image processing failed: {e}")
             return {}
     
+    def _ocr_answer_bands(self, image: Image.Image, bands: List[Tuple[int, int]]) -> Dict[int, str]:
+        """OCR horizontal bands of an answer sheet concurrently and merge by question number."""
+        self.logger.info(f"✂️ Answer sheet split into {len(bands)} row bands")
+        
+        def ocr_band(indexed_band: Tuple[int, Tuple[int, int]]) -> Dict[int, str]:
+            index, (top, bottom) = indexed_band
+            if self._cancel_event.is_set():
+                return {}
+            try:
+                result = self._make_api_request_with_enhanced_recovery(
+                    [self._create_ocr_band_prompt(index, len(bands)), image.crop((0, top, image.width, bottom))],
+                    metadata={"task": "ocr_image_answers", "band": index, "bands": len(bands)},
+                    parse=self._parse_json_response
+                )
+                return self._validate_answers(result)
+            except Exception as e:
+                self.logger.warning(f"⚠️ OCR failed for band {index + 1}/{len(bands)}: {e}")
+                return {}
+        
+        band_results = self._map_ocr_requests(ocr_band, list(enumerate(bands)))
+        answers, conflicts = merge_band_answers(band_results)
+        if conflicts:
+            self.logger.warning(f"⚠️ Bands disagree on questions {conflicts[:10]}; kept the majority reading")
+        return answers
+    
+    def _create_ocr_band_prompt(self, index: int, total: int) -> str:
+        """OCR prompt for one horizontal band of an answer sheet."""
+        return self._create_ocr_prompt().replace(
+            "CHỈ TRẢ VỀ JSON:",
+            f"""LƯU Ý: Đây là dải ngang {index + 1}/{total} của phiếu đáp án (cắt theo hàng).
+        - Chỉ đọc các dòng hiển thị trọn vẹn; bỏ qua dòng bị cắt ở mép trên/dưới
+        - Trả về {{}} nếu dải không có đáp án
+        
+        CHỈ TRẢ VỀ JSON:"""
+        )
+    
     def _prepare_image_for_processing(self, image_data: bytes) -> Image.Image:
         """Prepare image for optimal processing."""
         if len(image_data) > self.config["max_image_size"]:
@@ -366,28 +680,33 @@ class EnhancedMultimodalQuizAgent:
         self.logger.info("📄 Extracting questions from DOCX with image support...")
         
         try:
-            # Read DOCX content
-            file_stream = io.BytesIO(docx_file.getvalue())
-            document = docx.Document(file_stream)
+            # One archive handle over the upload's own buffer serves text and media
+            source = self._open_docx_source(docx_file)
+            
+            # One streaming pass over the body: images are anchored to their questions
+            # (decoded only on demand) while the structure method consumes the text blocks
+            texts = []
+            embedded_image_ids = []
             
-            # Extract text and structure
-            all_content = self._extract_docx_content(document)
+            def text_blocks() -> Iterator[Tuple[str, str]]:
+                for kind, text in self._index_docx_images(source, self._iter_docx_blocks(source), embedded_image_ids):
+                    texts.append(text)
+                    yield kind, text
             
-            # Extract embedded images if any
-            embedded_images = self._extract_docx_images(docx_file)
-            if embedded_images:
-                self.logger.info(f"📷 Found {len(embedded_images)} embedded images in DOCX")
-                self.processing_stats["docx_images_extracted"] += len(embedded_images)
+            blocks_by_structure = self._extract_by_content_structure(text_blocks())
+            if embedded_image_ids:
+                self.logger.info(f"📷 Found {len(embedded_image_ids)} embedded images in DOCX")
+                self._increment_stat("docx_images_extracted", len(embedded_image_ids))
             
             # Combine text content
-            full_text = "\n".join([content[1] for content in all_content])
+            full_text = "\n".join(texts)
             cleaned_text = self._clean_vietnamese_text(full_text)
             
             self.logger.info(f"📋 Extracted {len(cleaned_text)} characters from DOCX")
             
             # Try multiple extraction methods
             question_blocks = self._extract_questions_with_multiple_methods(
-                all_content, cleaned_text, embedded_images
+                blocks_by_structure, cleaned_text, embedded_image_ids
             )
             
             self.logger.info(f"✅ Total extracted: {len(question_blocks)} questions")
@@ -397,76 +716,169 @@ class EnhancedMultimodalQuizAgent:
             self.logger.error(f"❌ DOCX extraction failed: {e}")
             return {}
     
-    def _extract_docx_content(self, document) -> List[Tuple[str, str]]:
-        """Extract structured content from DOCX."""
-        all_content = []
-        
-        # Extract paragraphs
-        for para in document.paragraphs:
-            text = para.text.strip()
-            if text:
-                all_content.append(("paragraph", text))
-        
-        # Extract tables
-        for table in document.tables:
-            for row in table.rows:
-                row_text = " | ".join([
-                    cell.text.strip() for cell in row.cells 
-                    if cell.text.strip()
-                ])
-                if row_text:
-                    all_content.append(("table", row_text))
-        
-        return all_content
-    
-    def _extract_docx_images(self, docx_file) -> List[Image.Image]:
-        """Extract embedded images from DOCX file."""
-        images = []
+    def _open_docx_source(self, docx_file) -> DocxSource:
+        """Open the DOCX archive for this run, closing the previous run's handle."""
+        source = DocxSource(docx_file)
+        with self._state_lock:
+            previous, self._docx_source = self._docx_source, source
+        if previous is not None:
+            previous.close()
+        return source
+    
+    def _close_docx_source(self) -> None:
+        """Close the last run's DOCX handle (its images were already inlined into results)."""
+        with self._state_lock:
+            source, self._docx_source = self._docx_source, None
+        if source is not None:
+            source.close()
+    
+    def _iter_docx_blocks(self, source: DocxSource) -> Iterator[Tuple[str, str]]:
+        """Stream typed blocks from the DOCX body in document order.
         
-        try:
-            # DOCX is actually a ZIP file
-            file_stream = io.BytesIO(docx_file.getvalue())
-            
-            with ZipFile(file_stream, 'r') as zip_ref:
-                # Look for image files in media folder
-                image_files = [
-                    name for name in zip_ref.namelist() 
-                    if name.startswith('word/media/') and 
-                    any(name.lower().endswith(ext) for ext in ['.png', '.jpg', '.jpeg', '.gif', '.bmp'])
-                ]
+        Yields ("paragraph", text), ("table", row_text) cho từng hàng của bảng (đúng
+        vị trí giữa các đoạn văn) và ("image", rId) cho mỗi ảnh nhúng trong đoạn văn
+        hoặc trong các ô của hàng. Nội dung trong content controls (w:sdt) được duyệt
+        như body bình thường.
+        """
+        yield from self._iter_body_elements(source.body)
+    
+    def _iter_body_elements(self, container) -> Iterator[Tuple[str, str]]:
+        """Walk block-level children of a body/sdtContent element."""
+        # Proxies get no parent: text access never needs the story part
+        for child in container.iterchildren():
+            if child.tag == DOCX_PARAGRAPH_TAG:
+                text = Paragraph(child, None).text.strip()
+                if text:
+                    yield ("paragraph", text)
                 
-                for img_path in image_files[:self.config["max_docx_images"]]:
-                    try:
-                        img_data = zip_ref.read(img_path)
-                        image = Image.open(io.BytesIO(img_data))
-                        
-                        # Optimize embedded images
-                        if image.width > 1024 or image.height > 1024:
-                            image.thumbnail((1024, 1024), Image.Resampling.LANCZOS)
-                        
-                        if image.mode != 'RGB':
-                            image = image.convert('RGB')
-                            
-                        images.append(image)
-                        
-                    except Exception as e:
-                        self.logger.warning(f"⚠️ Couldn't process embedded image {img_path}: {e}")
-                        continue
+                for image_id in self._element_image_ids(child):
+                    yield ("image", image_id)
+            
+            elif child.tag == DOCX_TABLE_TAG:
+                for row in Table(child, None).rows:
+                    row_text = " | ".join([
+                        cell.text.strip() for cell in row.cells
+                        if cell.text.strip()
+                    ])
+                    if row_text:
+                        yield ("table", row_text)
+                    
+                    # Images in the row's cells follow the row, so they anchor to a
+                    # question that starts in that row (questions laid out in tables)
+                    for image_id in self._element_image_ids(row._tr):
+                        yield ("image", image_id)
+            
+            elif child.tag == DOCX_SDT_TAG:
+                content = child.find(DOCX_SDT_CONTENT_TAG)
+                if content is not None:
+                    yield from self._iter_body_elements(content)
+    
+    def _element_image_ids(self, element) -> List[str]:
+        """Relationship IDs of images drawn inside a paragraph or table row (DrawingML blips and VML imagedata)."""
+        image_ids = []
+        for element in element.iter(DOCX_BLIP_TAG, DOCX_VML_IMAGEDATA_TAG):
+            image_id = element.get(DOCX_EMBED_ATTR) or element.get(DOCX_RELID_ATTR)
+            if image_id:
+                image_ids.append(image_id)
+        return image_ids
+    
+    def _index_docx_images(self, source: DocxSource, blocks: Iterator[Tuple[str, str]],
+                           image_ids: List[str]) -> Iterator[Tuple[str, str]]:
+        """Map image anchors to questions without decoding any image.
+        
+        Lọc luồng block: các block text được yield tiếp, mỗi ("image", rId) được gán
+        cho câu hỏi đang mở tại vị trí đó; ảnh trước câu đầu tiên (logo, tiêu đề)
+        không thuộc câu nào. rIds ảnh được thêm vào image_ids theo thứ tự xuất hiện
+        (không trùng).
+        """
+        self.docx_image_anchors = {}
+        self._docx_image_parts = {}
+        self._docx_image_cache = {}
         
-        except Exception as e:
-            self.logger.warning(f"⚠️ Couldn't extract images from DOCX: {e}")
+        current_question = None
         
+        for content_type, text in blocks:
+            if content_type != "image":
+                question_num = self._match_structure_question_start(text)
+                if question_num is not None:
+                    current_question = question_num
+                yield content_type, text
+                continue
+            
+            image_ref = source.images.get(text)
+            if image_ref is None:
+                continue
+            
+            if text not in self._docx_image_parts:
+                self._docx_image_parts[text] = image_ref
+                image_ids.append(text)
+            
+            if current_question is not None:
+                anchors = self.docx_image_anchors.setdefault(current_question, [])
+                if text not in anchors:
+                    anchors.append(text)
+        
+        if self.docx_image_anchors:
+            self.logger.info(f"📎 Anchored images to {len(self.docx_image_anchors)} questions")
+    
+    def _decode_docx_image(self, image_id: str) -> Optional[Image.Image]:
+        """Decode one embedded image for OCR (resized, RGB)."""
+        image_ref = self._docx_image_parts.get(image_id)
+        if image_ref is None or self._docx_source is None:
+            return None
+        
+        try:
+            image = Image.open(io.BytesIO(self._docx_source.read_image(image_id)))
+            
+            # Optimize embedded images
+            if image.width > 1024 or image.height > 1024:
+                image.thumbnail((1024, 1024), Image.Resampling.LANCZOS)
+            
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            
+            return image
+            
+        except Exception as e:
+            self.logger.warning(f"⚠️ Couldn't process embedded image {image_ref.partname}: {e}")
+            return None
+    
+    def _question_docx_images(self, question_num: int) -> List[Dict]:
+        """Embedded images anchored to a question, as ImageData dicts (base64 data)."""
+        images = []
+        for image_id in self.docx_image_anchors.get(question_num, []):
+            image = self._docx_image_cache.get(image_id)
+            if image is None:
+                image_ref = self._docx_image_parts[image_id]
+                try:
+                    blob = self._docx_source.read_image(image_id)
+                except Exception as e:
+                    self.logger.warning(f"⚠️ Couldn't read embedded image {image_ref.partname}: {e}")
+                    continue
+                image = asdict(ImageData(
+                    name=image_ref.name,
+                    data=base64.b64encode(blob).decode('utf-8'),
+                    type=image_ref.content_type,
+                    size=len(blob),
+                    description=f"Hình nhúng trong DOCX ({image_ref.name})"
+                ))
+                image.update(reference=image_ref.name, source="docx", rel_id=image_id)
+                self._docx_image_cache[image_id] = image
+            images.append(dict(image))
         return images
     
+    def _question_images(self, question_num: int, question_text: str) -> List[Dict]:
+        """Images for a question: anchored DOCX images, else text references ("Hình 1")."""
+        return self._question_docx_images(question_num) or self._detect_question_images(question_text)
+    
     def _extract_questions_with_multiple_methods(self, 
-                                               all_content: List[Tuple[str, str]], 
+                                               blocks_by_structure: Dict[int, str], 
                                                cleaned_text: str,
-                                               embedded_images: List[Image.Image]) -> Dict[int, str]:
+                                               embedded_image_ids: List[str]) -> Dict[int, str]:
         """Extract questions using multiple intelligent methods."""
         question_blocks = {}
         
-        # Method 1: Structure-based extraction
-        blocks_by_structure = self._extract_by_content_structure(all_content)
+        # Method 1: Structure-based extraction (computed during the body walk)
         if blocks_by_structure:
             question_blocks.update(blocks_by_structure)
             self.logger.info(f"📋 Structure method: {len(blocks_by_structure)} questions")
@@ -484,8 +896,13 @@ class EnhancedMultimodalQuizAgent:
                 question_blocks = ai_blocks
                 self.logger.info(f"📋 AI method: {len(ai_blocks)} questions")
         
-        # Method 4: Process embedded images if available
-        if embedded_images and len(question_blocks) < 10:
+        # Method 4: Process embedded images if available (decoded only now)
+        if embedded_image_ids and len(question_blocks) < 10:
+            unique_ids = self._dedupe_docx_images(embedded_image_ids[:self.config["max_docx_images"]])
+            embedded_images = [
+                image for image in map(self._decode_docx_image, unique_ids)
+                if image is not None
+            ]
             image_blocks = self._extract_questions_from_images(embedded_images)
             if image_blocks:
                 # Merge with existing blocks
@@ -494,48 +911,132 @@ class EnhancedMultimodalQuizAgent:
                         question_blocks[k] = v
                 self.logger.info(f"📷 Image method added: {len(image_blocks)} questions")
         
+        # Choice offsets only describe blocks that came from the pattern scanner
+        self.question_block_layout = {
+            q_num: layout for q_num, layout in self.question_block_layout.items()
+            if question_blocks.get(q_num) == blocks_by_pattern.get(q_num)
+        }
+        
         return question_blocks
     
-    def _extract_questions_from_images(self, images: List[Image.Image]) -> Dict[int, str]:
-        """Extract questions from embedded images."""
-        question_blocks = {}
-        
-        for i, image in enumerate(images):
+    def _dedupe_docx_images(self, image_ids: List[str]) -> List[str]:
+        """Drop embedded images whose bytes repeat an earlier one (logos, re-used scans)."""
+        unique_ids = []
+        seen = set()
+        for image_id in image_ids:
             try:
-                self.logger.info(f"🔍 Processing embedded image {i+1}/{len(images)}")
-                
-                prompt = """
-                Bạn là chuyên gia OCR cho hệ thống giáo dục Việt Nam.
-                
-                NHIỆM VỤ: Trích xuất câu hỏi trắc nghiệm từ hình ảnh.
-                
-                YÊU CẦU:
-                - Tìm patterns: "Câu X", "X.", "Question X"
-                - Trích xuất đầy đủ nội dung câu hỏi và 4 lựa chọn A, B, C, D
-                - Format JSON: {"1": "Câu hỏi với lựa chọn đầy đủ..."}
-                - Bỏ qua text không phải câu hỏi
-                
-                CHỈ TRẢ VỀ JSON:
-                """
-                
-                response_text = self._make_api_request_with_enhanced_recovery(
-                    [prompt, image],
-                    metadata={"task": "extract_questions_from_image", "image_index": i}
-                )
-                
-                result = self._parse_json_response(response_text)
-                
-                # Validate and add to blocks
-                for k, v in result.items():
-                    if str(k).isdigit() and len(str(v)) > 50:
-                        question_blocks[int(k)] = str(v)
-                
-            except Exception as e:
-                self.logger.warning(f"⚠️ Failed to process embedded image {i+1}: {e}")
+                digest = hashlib.sha256(self._docx_source.read_image(image_id)).hexdigest()
+            except Exception:
+                # Let decoding report unreadable images
+                unique_ids.append(image_id)
                 continue
+            if digest not in seen:
+                seen.add(digest)
+                unique_ids.append(image_id)
+        
+        if len(unique_ids) < len(image_ids):
+            self.logger.info(f"🧮 Skipped {len(image_ids) - len(unique_ids)} duplicate embedded images")
+        return unique_ids
+    
+    def _pack_images_for_ocr(self, images: List[Image.Image]) -> List[List[int]]:
+        """Group image indexes into OCR requests: large images alone, small ones packed."""
+        max_pixels = self.config.get("ocr_pack_max_pixels", 0)
+        pack_size = max(1, int(self.config.get("ocr_pack_size", 1)))
+        
+        units = []
+        pack = []
+        for index, image in enumerate(images):
+            if image.width * image.height > max_pixels:
+                units.append([index])
+                continue
+            pack.append(index)
+            if len(pack) == pack_size:
+                units.append(pack)
+                pack = []
+        if pack:
+            units.append(pack)
+        
+        # Keep document order so merge precedence matches the serial loop
+        return sorted(units, key=lambda unit: unit[0])
+    
+    def _create_image_questions_prompt(self, image_count: int) -> str:
+        """OCR prompt for extracting questions from one or more images."""
+        source = "hình ảnh" if image_count == 1 else f"{image_count} hình ảnh (theo thứ tự)"
+        return f"""
+        Bạn là chuyên gia OCR cho hệ thống giáo dục Việt Nam.
+        
+        NHIỆM VỤ: Trích xuất câu hỏi trắc nghiệm từ {source}.
+        
+        YÊU CẦU:
+        - Tìm patterns: "Câu X", "X.", "Question X"
+        - Trích xuất đầy đủ nội dung câu hỏi và 4 lựa chọn A, B, C, D
+        - Format JSON: {{"1": "Câu hỏi với lựa chọn đầy đủ..."}}
+        - Bỏ qua text không phải câu hỏi
+        
+        CHỈ TRẢ VỀ JSON:
+        """
+    
+    def _ocr_image_unit(self, images: List[Image.Image], indexes: List[int]) -> Dict[int, str]:
+        """OCR one request unit (one large image or a pack of small ones)."""
+        if self._cancel_event.is_set():
+            return {}
+        
+        label = ", ".join(str(i + 1) for i in indexes)
+        try:
+            self.logger.info(f"🔍 Processing embedded image(s) {label}/{len(images)}")
+            
+            result = self._make_api_request_with_enhanced_recovery(
+                [self._create_image_questions_prompt(len(indexes))] + [images[i] for i in indexes],
+                metadata={"task": "extract_questions_from_image", "image_indexes": indexes},
+                parse=self._parse_json_response
+            )
+            
+            # Validate blocks
+            return {
+                int(k): str(v) for k, v in result.items()
+                if str(k).isdigit() and len(str(v)) > 50
+            }
+            
+        except Exception as e:
+            self.logger.warning(f"⚠️ Failed to process embedded image(s) {label}: {e}")
+            return {}
+    
+    def _extract_questions_from_images(self, images: List[Image.Image]) -> Dict[int, str]:
+        """Extract questions from embedded images.
+        
+        Ảnh nhỏ được gộp nhiều ảnh/request, ảnh lớn đi riêng; các request chạy song
+        song (ocr_workers) qua cùng rate limiter dùng chung. Kết quả gộp theo thứ tự
+        ảnh trong tài liệu, ảnh sau ghi đè số câu trùng như vòng lặp tuần tự.
+        """
+        units = self._pack_images_for_ocr(images)
+        if not units:
+            return {}
+        
+        if len(units) < len(images):
+            self.logger.info(f"📦 OCR: {len(images)} images packed into {len(units)} requests")
+        
+        unit_results = self._map_ocr_requests(lambda unit: self._ocr_image_unit(images, unit), units)
+        
+        question_blocks = {}
+        for result in unit_results:
+            question_blocks.update(result)
         
         return question_blocks
     
+    def _map_ocr_requests(self, func: Callable[[Any], Any], units: List[Any]) -> List[Any]:
+        """Run OCR request units on a bounded pool (ocr_workers); results keep unit order."""
+        try:
+            workers = max(1, min(int(self.config.get("ocr_workers", 1)), len(units)))
+        except (TypeError, ValueError):
+            workers = 1
+        
+        if workers == 1:
+            return [func(unit) for unit in units]
+        
+        self.logger.info(f"🧵 OCR {len(units)} requests with {workers} workers")
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="quiz-ocr") as executor:
+            return list(executor.map(func, units))
+    
     def _create_answer_parsing_prompt(self, answer_text: str) -> str:
         """Create optimized prompt for answer parsing."""
         return f"""
@@ -584,38 +1085,47 @@ class EnhancedMultimodalQuizAgent:
         """
     
     def _parse_answers_with_regex(self, text: str) -> Dict[int, str]:
-        """Enhanced regex parsing for Vietnamese answer patterns."""
-        answers = {}
+        """Single-pass answer-key tokenizer for Vietnamese answer formats.
         
-        # Vietnamese-optimized patterns
-        patterns = [
-            r'(?:Câu\s*)?(\d+)\s*\.\s*([A-D]+)',  # Câu 1. A
-            r'(?:Câu\s*)?(\d+)\s*\)\s*([A-D]+)',  # Câu 1) A  
-            r'(?:Câu\s*)?(\d+)\s*:\s*([A-D]+)',   # Câu 1: A
-            r'(?:Câu\s*)?(\d+)\s+([A-D]+)\b',     # Câu 1 A
-            r'(?:Question\s*)?(\d+)\s*[\.:\)]\s*([A-D]+)',  # Question patterns
-            r'^(\d+)\s*[\.:\)]\s*([A-D]+)',       # 1. A (line start)
-        ]
+        Một lần quét ANSWER_TOKEN_PATTERN cho mọi định dạng; định dạng phổ biến
+        nhất và các câu bị trùng với đáp án khác nhau được ghi vào
+        self.answer_parse_report (câu trùng giữ đáp án xuất hiện sau cùng).
+        """
+        answers = {}
+        seen = {}
+        formats = {}
         
-        for pattern in patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE | re.MULTILINE)
-            temp_answers = {}
+        for match in ANSWER_TOKEN_PATTERN.finditer(text):
+            q_num = int(match.group("num"))
+            # Sort combination answers
+            answer = ''.join(sorted(set(match.group("answer").upper())))
             
-            for match in matches:
-                try:
-                    q_num = int(match[0])
-                    answer = match[1].upper().strip()
-                    
-                    if re.match(r'^[A-D]+$', answer):
-                        # Sort combination answers
-                        answer = ''.join(sorted(set(answer)))
-                        temp_answers[q_num] = answer
-                except (ValueError, IndexError):
-                    continue
+            prefix = match.group("prefix")
+            sep = match.group("sep")
+            label = f"{prefix.capitalize() + ' ' if prefix else ''}N{sep or ''} X"
+            formats[label] = formats.get(label, 0) + 1
             
-            # Keep best result
-            if len(temp_answers) > len(answers):
-                answers = temp_answers
+            seen.setdefault(q_num, []).append(answer)
+            answers[q_num] = answer
+        
+        conflicts = {
+            q_num: values for q_num, values in seen.items() if len(set(values)) > 1
+        }
+        
+        self.answer_parse_report = {
+            "format": max(formats, key=formats.get) if formats else None,
+            "formats": formats,
+            "tokens": sum(formats.values()),
+            "answers": len(answers),
+            "duplicates": sum(len(values) - 1 for values in seen.values()),
+            "conflicts": conflicts
+        }
+        
+        if conflicts:
+            self.logger.warning(
+                f"⚠️ Conflicting answers for {len(conflicts)} questions: "
+                + ", ".join(f"{q}: {'/'.join(v)}" for q, v in sorted(conflicts.items())[:10])
+            )
         
         return answers
     
@@ -724,44 +1234,31 @@ class EnhancedMultimodalQuizAgent:
         
         return cleaned.strip()
     
-    def _extract_by_content_structure(self, content_list: List[Tuple[str, str]]) -> Dict[int, str]:
+    def _extract_by_content_structure(self, content_list: Iterator[Tuple[str, str]]) -> Dict[int, str]:
         """Extract questions based on content structure."""
         questions = {}
         current_question = None
         current_content = []
         
-        question_patterns = [
-            r'^(?:Câu\s*)?(\d+)\s*[\.:\)]',
-            r'^(?:Question\s*)?(\d+)\s*[\.:\)]',
-            r'^(?:Bài\s*)?(\d+)\s*[\.:\)]',
-            r'^\d+\.\s*',
-            r'^Problem\s*(\d+)',
-        ]
-        
         for content_type, text in content_list:
             text = text.strip()
-            if not text:
+            if not text or content_type == "image":
                 continue
             
             # Check for new question
             found_new = False
-            for pattern in question_patterns:
-                match = re.match(pattern, text, re.IGNORECASE)
-                if match:
-                    # Save previous question
-                    if current_question and current_content:
-                        question_text = "\n".join(current_content)
-                        if len(question_text) > 30:
-                            questions[current_question] = question_text
-                    
-                    # Start new question
-                    try:
-                        current_question = int(match.group(1))
-                        current_content = [text]
-                        found_new = True
-                        break
-                    except (ValueError, IndexError):
-                        continue
+            question_num = self._match_structure_question_start(text)
+            if question_num is not None:
+                # Save previous question
+                if current_question and current_content:
+                    question_text = "\n".join(current_content)
+                    if len(question_text) > 30:
+                        questions[current_question] = question_text
+                
+                # Start new question
+                current_question = question_num
+                current_content = [text]
+                found_new = True
             
             # Add to current question
             if not found_new and current_question:
@@ -783,79 +1280,166 @@ class EnhancedMultimodalQuizAgent:
         
         return questions
     
+    def _match_structure_question_start(self, text: str) -> Optional[int]:
+        """Question number if a content block starts a new question, else None."""
+        text = text.strip()
+        for pattern in STRUCTURE_QUESTION_PATTERNS:
+            match = pattern.match(text)
+            if match:
+                try:
+                    return int(match.group(1))
+                except (ValueError, IndexError):
+                    continue
+        return None
+    
     def _extract_vietnamese_question_blocks(self, text: str) -> Dict[int, str]:
-        """Enhanced Vietnamese question extraction."""
-        question_blocks = {}
+        """Enhanced Vietnamese question extraction (single-pass scanner).
         
-        patterns = [
-            r'Câu\s*(\d+)\s*[\.:]',
-            r'Question\s*(\d+)\s*[\.:]',
-            r'^(\d+)\s*[\.:]',
-            r'\n(\d+)\s*[\.:]',
-            r'Bài\s*(\d+)\s*[\.:]',
-            r'(\d+)\s*\)',
-            r'Problem\s*(\d+)',
-        ]
+        Một lần quét tìm mọi header ứng viên và mọi choice marker A-D; mỗi họ header
+        (Câu/Question/đầu dòng/Bài/"n)"/Problem) cho ra cùng blocks như re.split
+        theo pattern tương ứng trước đây, chọn họ tốt nhất theo cùng quy tắc.
+        Choice offsets của từng block được lưu ở self.question_block_layout.
+        """
+        headers_by_family = self._scan_question_headers(text)
+        choice_positions = [m.start() for m in CHOICE_MARKER_PATTERN.finditer(text)]
         
         best_result = {}
+        best_layout = {}
         
-        for pattern in patterns:
-            parts = re.split(pattern, text, flags=re.IGNORECASE | re.MULTILINE)
+        for family, _, _ in QUESTION_HEADER_FAMILIES:
+            headers = headers_by_family[family]
+            if not headers:
+                continue
+            
+            temp_blocks = {}
+            temp_layout = {}
+            
+            for idx, (_, header_end, q_num) in enumerate(headers):
+                block_end = headers[idx + 1][0] if idx + 1 < len(headers) else len(text)
+                block = self._build_question_block(text, header_end, block_end, choice_positions)
+                if block:
+                    temp_blocks[q_num], temp_layout[q_num] = block
             
-            if len(parts) > 2:
-                temp_blocks = {}
+            if temp_blocks and len(temp_blocks) > len(best_result):
+                best_result = temp_blocks
+                best_layout = temp_layout
+                if len(best_result) >= 20:
+                    break
+        
+        self.question_block_layout = best_layout
+        return best_result
+    
+    def _scan_question_headers(self, text: str) -> Dict[str, List[Tuple[int, int, int]]]:
+        """Find question headers for every family in one sweep over digit runs.
+        
+        Returns family -> [(header_start, header_end, so_cau)] in text order.
+        """
+        headers = {family: [] for family, _, _ in QUESTION_HEADER_FAMILIES}
+        length = len(text)
+        
+        for match in DIGIT_RUN_PATTERN.finditer(text):
+            digits_start, digits_end = match.span()
+            q_num = int(match.group())
+            
+            # Separator after optional whitespace
+            sep_pos = digits_end
+            while sep_pos < length and text[sep_pos].isspace():
+                sep_pos += 1
+            sep = text[sep_pos] if sep_pos < length else ""
+            
+            # Keyword before optional whitespace
+            keyword_end = digits_start
+            while keyword_end > 0 and text[keyword_end - 1].isspace():
+                keyword_end -= 1
+            
+            at_line_start = digits_start == 0 or text[digits_start - 1] == "\n"
+            
+            for family, keyword, separators in QUESTION_HEADER_FAMILIES:
+                if separators is not None and (not sep or sep not in separators):
+                    continue
                 
-                for i in range(1, len(parts), 2):
-                    try:
-                        q_num = int(parts[i].strip())
-                        if i + 1 < len(parts):
-                            q_text = parts[i + 1].strip()
-                            
-                            if self._validate_question_block(q_text):
-                                q_text = self._smart_truncate_question(q_text)
-                                temp_blocks[q_num] = q_text
-                                
-                    except ValueError:
+                if keyword:
+                    keyword_start = keyword_end - len(keyword)
+                    if keyword_start < 0 or text[keyword_start:keyword_end].lower() != keyword:
                         continue
+                    start = keyword_start
+                elif family == "paren":
+                    start = digits_start
+                else:
+                    if not at_line_start or (family == "newline" and digits_start == 0):
+                        continue
+                    start = digits_start
                 
-                if temp_blocks and len(temp_blocks) > len(best_result):
-                    best_result = temp_blocks
-                    if len(best_result) >= 20:
-                        break
+                end = digits_end if separators is None else sep_pos + 1
+                headers[family].append((start, end, q_num))
         
-        return best_result
+        return headers
     
-    def _validate_question_block(self, text: str) -> bool:
-        """Validate question block quality."""
-        if len(text) < 30 or len(text) > 3000:
-            return False
-        
-        choice_pattern = r'[A-D][\.:\)]\s*'
-        choices_found = len(re.findall(choice_pattern, text))
+    def _build_question_block(self, text: str, start: int, end: int,
+                              choice_positions: List[int]) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Validate/truncate text[start:end] using precomputed choice marker positions.
         
-        return choices_found >= 2
+        Block hợp lệ: 30-3000 ký tự và có ít nhất 2 choice markers; block dài được
+        cắt bằng _smart_truncate_question, không quét lại text.
+        """
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        
+        if end - start < 30 or end - start > 3000:
+            return None
+        
+        first = bisect_left(choice_positions, start)
+        last = bisect_right(choice_positions, end - 2)
+        if last - first < 2:
+            return None
+        
+        block = text[start:end]
+        
+        if len(block) > 1500:
+            d_line_end = None
+            for idx in range(last - 1, first - 1, -1):
+                if text[choice_positions[idx]] == "D":
+                    newline = text.find("\n", choice_positions[idx], end)
+                    d_line_end = (newline if newline != -1 else end) - start
+                    break
+            block = self._smart_truncate_question(block, d_line_end)
+            if block is None:
+                return None
+        
+        choices = [
+            (text[pos], pos - start) for pos in choice_positions[first:last]
+            if pos - start + 2 <= len(block)
+        ]
+        return block, {"choices": choices}
     
-    def _smart_truncate_question(self, text: str) -> str:
-        """Smart truncation preserving structure."""
+    def _smart_truncate_question(self, text: str, d_line_end: int = None) -> Optional[str]:
+        """Smart truncation preserving structure.
+        
+        d_line_end: end of the line holding the last "D." marker, if already known.
+        None khi có điểm cắt nhưng đều nằm sau 1500 ký tự: block đó bị bỏ qua.
+        """
         if len(text) <= 1500:
             return text
         
         cut_points = []
         
         # Look for choice D
-        d_pattern = r'D[\.:\)][^\n]*'
-        d_matches = list(re.finditer(d_pattern, text))
-        if d_matches:
-            last_d = d_matches[-1]
-            cut_points.append(last_d.end())
+        if d_line_end is None:
+            d_matches = list(re.finditer(r'D[\.:\)][^\n]*', text))
+            if d_matches:
+                d_line_end = d_matches[-1].end()
+        if d_line_end is not None:
+            cut_points.append(d_line_end)
         
         # Look for sentence endings
-        sentence_ends = [m.start() for m in re.finditer(r'[\.!?]\s*(?:\n|$)', text[:1500])]
+        sentence_ends = [m.start() for m in SENTENCE_END_PATTERN.finditer(text[:1500])]
         cut_points.extend(sentence_ends)
         
         if cut_points:
-            best_cut = max([cp for cp in cut_points if cp <= 1500])
-            return text[:best_cut].strip()
+            usable = [cp for cp in cut_points if cp <= 1500]
+            return text[:max(usable)].strip() if usable else None
         
         return text[:1500] + "..."
     
@@ -881,11 +1465,11 @@ class EnhancedMultimodalQuizAgent:
             CHỈ TRẢ VỀ JSON:
             """
             
-            response = self._make_api_request_with_enhanced_recovery(
+            result = self._make_api_request_with_enhanced_recovery(
                 prompt, 
-                metadata={"task": "ai_extract_questions"}
+                metadata={"task": "ai_extract_questions"},
+                parse=self._parse_json_response
             )
-            result = self._parse_json_response(response)
             
             questions = {}
             for k, v in result.items():
@@ -937,30 +1521,15 @@ class EnhancedMultimodalQuizAgent:
         """
         
         try:
-            response_text = self._make_api_request_with_enhanced_recovery(
+            compiled = self._make_api_request_with_enhanced_recovery(
                 prompt, 
-                metadata={"task": "compile_question", "question_num": question_num}
+                metadata={"task": "compile_question", "question_num": question_num},
+                parse=self._parse_compiled_question
             )
-            compiled = self._parse_json_response(response_text)
             
             # Validate and enhance
-            if isinstance(compiled, dict) and "cau_hoi" in compiled and "lua_chon" in compiled:
-                compiled["so_cau"] = question_num
-                compiled["dap_an"] = correct_answer
-                
-                # Add image info
-                if images:
-                    compiled["images"] = images
-                    compiled["has_images"] = True
-                    self.logger.info(f"📷 Added {len(images)} images to question {question_num}")
-                else:
-                    compiled["has_images"] = False
-                
-                # Add metadata
-                compiled["created_by"] = f"{self.agent_info['name']} v{self.agent_info['version']}"
-                compiled["created_time"] = time.strftime("%Y-%m-%d %H:%M:%S")
-                
-                return compiled
+            if self._is_valid_compiled_question(compiled):
+                return self._finalize_compiled_question(compiled, question_num, correct_answer, images)
             else:
                 return self._create_enhanced_fallback_question(question_num, question_text, correct_answer, images)
                 
@@ -970,6 +1539,271 @@ class EnhancedMultimodalQuizAgent:
                 raise e
             return self._create_enhanced_fallback_question(question_num, question_text, correct_answer, images, error=str(e))
     
+    def _parse_compiled_question(self, response_text: str) -> Optional[Dict[str, Any]]:
+        """Parse a compile response; None unless it has the compiled question shape."""
+        compiled = self._parse_json_response(response_text)
+        return compiled if self._is_valid_compiled_question(compiled) else None
+    
+    def _is_valid_compiled_question(self, compiled: Any) -> bool:
+        """Check that a model response has the minimum compiled question shape."""
+        return isinstance(compiled, dict) and "cau_hoi" in compiled and "lua_chon" in compiled
+    
+    def _finalize_compiled_question(self, compiled: Dict[str, Any], question_num: int, 
+                                    correct_answer: str, images: List[Dict] = None) -> Dict[str, Any]:
+        """Attach authoritative number/answer, image info and metadata to a compiled question."""
+        compiled["so_cau"] = question_num
+        compiled["dap_an"] = correct_answer
+        
+        # Add image info
+        if images:
+            compiled["images"] = images
+            compiled["has_images"] = True
+            self.logger.info(f"📷 Added {len(images)} images to question {question_num}")
+        else:
+            compiled["has_images"] = False
+        
+        # Add metadata
+        compiled["created_by"] = f"{self.agent_info['name']} v{self.agent_info['version']}"
+        compiled["created_time"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        
+        return compiled
+    
+    def _create_batch_compile_prompt(self, questions: List[Tuple[int, str, str]]) -> str:
+        """Create one prompt packing several question blocks."""
+        blocks = "\n\n".join(
+            f"=== CÂU so_cau={q_num} | dap_an={correct_answer} ===\n{question_text}"
+            for q_num, question_text, correct_answer in questions
+        )
+        
+        return f"""
+        Bạn là chuyên gia biên soạn đề thi trắc nghiệm hàng đầu tại Việt Nam.
+        
+        NHIỆM VỤ: Phân tích và chuẩn hóa {len(questions)} câu hỏi trắc nghiệm theo tiêu chuẩn giáo dục Việt Nam.
+        
+        FORMAT OUTPUT: một JSON array, mỗi phần tử ứng với một câu, giữ nguyên so_cau:
+        [
+            {{
+                "so_cau": 1,
+                "cau_hoi": "Nội dung câu hỏi được làm sạch",
+                "lua_chon": {{
+                    "A": "Lựa chọn A",
+                    "B": "Lựa chọn B",
+                    "C": "Lựa chọn C",
+                    "D": "Lựa chọn D"
+                }},
+                "dap_an": "A",
+                "do_kho": "trung_binh",
+                "mon_hoc": "auto_detect",
+                "ghi_chu": "Processed by {self.agent_info['name']}"
+            }}
+        ]
+        
+        YÊU CẦU:
+        - Trả về đúng {len(questions)} phần tử, mỗi so_cau một lần
+        - Làm sạch và tách riêng câu hỏi và 4 lựa chọn A, B, C, D
+        - Đảm bảo tiếng Việt chuẩn
+        - Nếu không đủ 4 lựa chọn, tạo lựa chọn hợp lý
+        - Phân loại độ khó và môn học
+        
+        NỘI DUNG:
+        {blocks}
+        
+        CHỈ TRẢ VỀ JSON ARRAY:
+        """
+    
+    def _parse_json_array_response(self, response_text: str) -> List[Dict]:
+        """Parse a JSON array response, salvaging complete objects from truncated output."""
+        if not response_text:
+            return []
+        
+        cleaned = response_text.strip()
+        if cleaned.startswith("```json"):
+            cleaned = cleaned[7:]
+        if cleaned.startswith("```"):
+            cleaned = cleaned[3:]
+        if cleaned.endswith("```"):
+            cleaned = cleaned[:-3]
+        cleaned = cleaned.strip()
+        
+        try:
+            parsed = json.loads(cleaned)
+            if isinstance(parsed, dict):
+                parsed = parsed.get("questions", [parsed])
+            return [item for item in parsed if isinstance(item, dict)] if isinstance(parsed, list) else []
+        except json.JSONDecodeError:
+            pass
+        
+        # Truncated or noisy output: decode objects one by one until the text breaks
+        items = []
+        decoder = json.JSONDecoder()
+        pos = cleaned.find("{", cleaned.find("[") + 1)
+        while 0 <= pos < len(cleaned):
+            try:
+                item, end = decoder.raw_decode(cleaned, pos)
+            except json.JSONDecodeError:
+                break
+            if isinstance(item, dict):
+                items.append(item)
+            pos = cleaned.find("{", end)
+        
+        if items:
+            self.logger.warning(f"⚠️ Batch response malformed, salvaged {len(items)} objects")
+        return items
+    
+    def compile_questions_batch(self, questions: List[Tuple[int, str, str]]) -> Dict[int, Dict[str, Any]]:
+        """Compile several questions per request, splitting adaptively on bad responses.
+        
+        questions: list of (so_cau, question_text, correct_answer).
+        Only questions that still fail as a single-question request fall back.
+        """
+        compiled_by_num = {}
+        pending = [list(questions)]
+        
+        while pending:
+            chunk = pending.pop()
+            
+            if len(chunk) == 1:
+                q_num, question_text, correct_answer = chunk[0]
+                compiled_by_num[q_num], _ = self._compile_single_question(q_num, question_text, correct_answer)
+                continue
+            
+            chunk_nums = [q_num for q_num, _, _ in chunk]
+            self.logger.info(f"📦 Compiling batch of {len(chunk)} questions {chunk_nums[0]}..{chunk_nums[-1]}")
+            
+            try:
+                parsed_items = self._make_api_request_with_enhanced_recovery(
+                    self._create_batch_compile_prompt(chunk),
+                    metadata={"task": "compile_question_batch", "question_nums": chunk_nums},
+                    parse=self._parse_json_array_response
+                )
+                
+            except Exception as e:
+                if self._classify_error(str(e).lower()) == "quota_exceeded":
+                    # Splitting would only spend more quota; fall back for this chunk
+                    self.logger.error(f"❌ Batch compilation hit quota for {chunk_nums}: {e}")
+                    for q_num, question_text, correct_answer in chunk:
+                        compiled_by_num[q_num] = self._create_enhanced_fallback_question(
+                            q_num, question_text, correct_answer,
+                            self._question_images(q_num, question_text), error=str(e)
+                        )
+                    continue
+                self.logger.warning(f"⚠️ Batch request failed for {chunk_nums}: {e}")
+                parsed_items = []
+            
+            returned = {}
+            for item in parsed_items:
+                try:
+                    q_num = int(item.get("so_cau"))
+                except (TypeError, ValueError):
+                    continue
+                if q_num in chunk_nums and self._is_valid_compiled_question(item):
+                    returned[q_num] = item
+            
+            missing = []
+            for q_num, question_text, correct_answer in chunk:
+                if q_num in returned:
+                    compiled_by_num[q_num] = self._finalize_compiled_question(
+                        returned[q_num], q_num, correct_answer,
+                        self._question_images(q_num, question_text)
+                    )
+                else:
+                    missing.append((q_num, question_text, correct_answer))
+            
+            if not missing:
+                continue
+            
+            if returned:
+                # Partial (usually truncated) response: retry the remainder as one smaller batch
+                self.logger.warning(f"⚠️ Batch returned {len(returned)}/{len(chunk)}, re-queuing {len(missing)}")
+                pending.append(missing)
+            else:
+                # Nothing usable: split in halves
+                mid = len(missing) // 2
+                self.logger.warning(f"⚠️ Batch unusable, splitting {len(missing)} → {mid} + {len(missing) - mid}")
+                pending.append(missing[mid:])
+                pending.append(missing[:mid])
+        
+        return compiled_by_num
+    
+    def _parse_question_structure(self, question_text: str,
+                                  layout: Dict[str, Any] = None) -> Tuple[str, Dict[str, str], bool]:
+        """Split a raw block into (stem, {letter: choice}, all_markers_at_line_start).
+        
+        Dùng choice offsets từ question_block_layout nếu còn khớp với text, nếu không
+        thì quét lại. Chọn chuỗi marker A→B→C→D đầu tiên đứng sau đầu dòng/khoảng trắng;
+        gặp "A." hợp lệ trước khi đủ D thì bắt đầu lại (ví dụ "vitamin A." trong đề).
+        """
+        text = question_text.strip()
+        
+        markers = None
+        if layout and layout.get("choices"):
+            # Scanner blocks already exclude the "Câu N." header, so offsets apply as-is
+            markers = list(layout["choices"])
+            if not all(0 <= pos < len(text) - 1 and text[pos] == letter and text[pos + 1] in ".:)"
+                       for letter, pos in markers):
+                markers = None
+        if markers is None:
+            text = QUESTION_HEADER_PREFIX.sub("", text, count=1)
+            markers = [(m.group()[0], m.start()) for m in CHOICE_MARKER_PATTERN.finditer(text)]
+        
+        selected = []
+        for letter, pos in markers:
+            if pos > 0 and not text[pos - 1].isspace():
+                continue
+            if letter == "A":
+                selected = [(letter, pos)]
+            elif selected and letter == "ABCD"[len(selected)]:
+                selected.append((letter, pos))
+            if len(selected) == 4:
+                break
+        
+        if not selected:
+            return " ".join(text.split()), {}, False
+        
+        stem = " ".join(text[:selected[0][1]].split())
+        choices = {}
+        for idx, (letter, pos) in enumerate(selected):
+            end = selected[idx + 1][1] if idx + 1 < len(selected) else len(text)
+            choices[letter] = " ".join(text[pos + 2:end].split())
+        
+        at_line_start = all(pos == 0 or text[pos - 1] == "\n" for _, pos in selected)
+        return stem, choices, at_line_start
+    
+    def _compile_question_locally(self, question_num: int, question_text: str, correct_answer: str,
+                                  layout: Dict[str, Any] = None) -> Tuple[Dict[str, Any], float]:
+        """Deterministic compile of a well-formed block, with a 0-1 confidence score.
+        
+        Câu có confidence >= config["local_compile_threshold"] không cần gửi Gemini.
+        Không có model phân loại nên do_kho/mon_hoc là UNCLASSIFIED_LABEL. Chưa gắn
+        images/metadata: caller chỉ finalize câu vượt ngưỡng.
+        """
+        stem, choices, at_line_start = self._parse_question_structure(question_text, layout)
+        
+        confidence = 0.4 * len(choices) / 4
+        if len(stem) >= 10:
+            confidence += 0.15
+        if choices and all(0 < len(c) <= 300 for c in choices.values()) \
+                and len(set(choices.values())) == len(choices):
+            confidence += 0.15
+        confidence += 0.15 if at_line_start else 0.05
+        if correct_answer and set(correct_answer) <= set(choices):
+            confidence += 0.15
+        if len(choices) < 4:
+            confidence = min(confidence, 0.5)
+        
+        compiled = {
+            "so_cau": question_num,
+            "cau_hoi": stem,
+            "lua_chon": {letter: choices.get(letter, "") for letter in "ABCD"},
+            "dap_an": correct_answer,
+            "do_kho": UNCLASSIFIED_LABEL,
+            "mon_hoc": UNCLASSIFIED_LABEL,
+            "ghi_chu": f"Compiled locally by {self.agent_info['name']}",
+            "compiled_by": "local",
+            "confidence": round(confidence, 2)
+        }
+        return compiled, confidence
+    
     def _create_enhanced_fallback_question(self, question_num: int, question_text: str, 
                                          correct_answer: str, images: List[Dict] = None, 
                                          error: str = None) -> Dict[str, Any]:
@@ -977,26 +1811,12 @@ class EnhancedMultimodalQuizAgent:
         error_msg = f"[AUTO-GENERATED] {error}" if error else "[AUTO-GENERATED] Needs manual review"
         
         # Smart parsing of question content
-        lines = question_text.split('\n')
-        question_content = []
+        main_question, parsed_choices, _ = self._parse_question_structure(question_text)
         choices = {"A": "Option A", "B": "Option B", "C": "Option C", "D": "Option D"}
+        choices.update(parsed_choices)
         
-        current_choice = None
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-                
-            choice_match = re.match(r'^([A-D])[\.:\)]\s*(.+)', line)
-            if choice_match:
-                current_choice = choice_match.group(1)
-                choices[current_choice] = choice_match.group(2)
-            elif current_choice:
-                choices[current_choice] += f" {line}"
-            else:
-                question_content.append(line)
-        
-        main_question = "\n".join(question_content) if question_content else question_text[:200] + "..."
+        if not main_question:
+            main_question = question_text[:200] + "..."
         
         fallback = {
             "so_cau": question_num,
@@ -1018,8 +1838,111 @@ class EnhancedMultimodalQuizAgent:
         
         return fallback
     
-    def process_complete_quiz_enhanced(self, answer_data, docx_file, answer_type="text") -> Dict[str, Any]:
-        """Complete quiz processing with enhanced features."""
+    def process_complete_quiz_enhanced(self, answer_data, docx_file, answer_type="text",
+                                       previous_questions: List[Dict[str, Any]] = None,
+                                       progress_callback: Callable[[Dict[str, Any]], None] = None) -> Dict[str, Any]:
+        """Complete quiz processing with enhanced features.
+        
+        previous_questions: compiled questions của một phiên bản trước; câu nào có
+        cùng source_hash sẽ được dùng lại thay vì gửi lại cho Gemini.
+        progress_callback: nhận event dict theo từng bước/từng câu (xem _emit_progress).
+        Có thể gọi từ worker threads; dùng iter_quiz_processing_events nếu cần
+        nhận event trên thread của caller.
+        """
+        self._progress_callback = progress_callback
+        self._cancel_event.clear()
+        
+        try:
+            results = self._run_quiz_pipeline(answer_data, docx_file, answer_type, previous_questions)
+            self._emit_progress(
+                "cancelled" if results.get("cancelled") else "completed",
+                success=results.get("success", False),
+                results=results
+            )
+            return results
+        finally:
+            self._progress_callback = None
+    
+    def iter_quiz_processing_events(self, answer_data, docx_file, answer_type="text",
+                                    previous_questions: List[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """Generator API: chạy pipeline ở background thread và yield từng event.
+        
+        Event cuối cùng là "completed" hoặc "cancelled" kèm results. Nếu consumer
+        dừng sớm (close/GeneratorExit), run sẽ bị cancel và giữ kết quả một phần.
+        """
+        return self._iter_progress_events(
+            lambda callback: self.process_complete_quiz_enhanced(
+                answer_data, docx_file, answer_type,
+                previous_questions=previous_questions,
+                progress_callback=callback
+            )
+        )
+    
+    def iter_quiz_job_events(self, answer_data=None, docx_file=None, answer_type="text",
+                             job_id: str = None) -> Iterator[Dict[str, Any]]:
+        """Như iter_quiz_processing_events nhưng chạy dưới dạng checkpointed job."""
+        return self._iter_progress_events(
+            lambda callback: self.process_quiz_job(
+                answer_data, docx_file, answer_type,
+                job_id=job_id,
+                progress_callback=callback
+            )
+        )
+    
+    def _iter_progress_events(self, run_pipeline: Callable[[Callable], Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Run `run_pipeline(callback)` in a background thread and yield its events."""
+        events = queue.Queue()
+        finished = object()
+        
+        def run():
+            try:
+                run_pipeline(events.put)
+            except Exception as e:
+                events.put({"event": "failed", "timestamp": time.time(), "error": str(e)})
+            finally:
+                events.put(finished)
+        
+        worker = threading.Thread(target=run, name="quiz-pipeline", daemon=True)
+        worker.start()
+        
+        try:
+            while True:
+                event = events.get()
+                if event is finished:
+                    break
+                yield event
+        finally:
+            if worker.is_alive():
+                self.cancel()
+    
+    @property
+    def job_store(self) -> QuizJobStore:
+        """Job store được tạo lazily để agent không cần ghi đĩa khi không chạy job."""
+        if self._job_store is None:
+            self._job_store = QuizJobStore(self.config["jobs_dir"])
+        return self._job_store
+    
+    def cancel(self) -> None:
+        """Yêu cầu dừng run hiện tại; các câu đã biên dịch vẫn được giữ lại."""
+        self.logger.warning("⏹️ Cancellation requested")
+        self._cancel_event.set()
+    
+    def _emit_progress(self, event: str, **data) -> None:
+        """Send a progress event to the active callback; callback errors never break the run."""
+        callback = self._progress_callback
+        if not callback:
+            return
+        
+        payload = {"event": event, "timestamp": time.time(), **data}
+        try:
+            with self._progress_lock:
+                callback(payload)
+        except Exception as e:
+            self.logger.warning(f"⚠️ Progress callback failed on '{event}': {e}")
+    
+    def _run_quiz_pipeline(self, answer_data, docx_file, answer_type: str,
+                           previous_questions: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Run the 4-step pipeline (answers → blocks → mapping → compile)."""
         self.logger.info("🚀 Starting enhanced quiz processing...")
         
         # Reset state
@@ -1043,36 +1966,55 @@ class EnhancedMultimodalQuizAgent:
             
             # Step 1: Process answers
             self.logger.info("📝 Step 1/4: Processing answers...")
+            self._emit_progress("stage", stage=1, name="parse_answers", progress=5)
+            self.answer_parse_report = {}
             if answer_type == "text":
                 results["parsed_answers"] = self.process_text_answers(answer_data)
             else:
                 results["parsed_answers"] = self.process_image_answers(answer_data)
             
+            if self.answer_parse_report:
+                results["debug_info"]["answer_parse"] = self.answer_parse_report
+                conflicts = self.answer_parse_report["conflicts"]
+                if conflicts:
+                    results["warnings"].append(
+                        f"⚠️ {len(conflicts)} câu có nhiều đáp án khác nhau trong answer key "
+                        f"(dùng đáp án sau cùng): {', '.join(map(str, sorted(conflicts)[:10]))}"
+                    )
+            
             if not results["parsed_answers"]:
                 results["errors"].append("❌ Could not parse answers. Check format: '1. A', '2. B'")
                 return results
             
+            self._emit_progress("answers_parsed", count=len(results["parsed_answers"]),
+                                answers=results["parsed_answers"], progress=15)
+            
             # Step 2: Extract questions
             self.logger.info("📄 Step 2/4: Extracting questions from DOCX...")
+            self._emit_progress("stage", stage=2, name="extract_questions", progress=15)
             results["question_blocks"] = self.extract_questions_from_docx(docx_file)
             
             if not results["question_blocks"]:
                 results["errors"].append("❌ Could not extract questions. DOCX must have format: 'Question 1.' or '1.'")
                 return results
             
+            self._emit_progress("blocks_extracted", count=len(results["question_blocks"]),
+                                question_numbers=sorted(results["question_blocks"].keys()), progress=25)
+            
             # Step 3: Mapping and validation
             self.logger.info("🔍 Step 3/4: Data compatibility check...")
+            self._emit_progress("stage", stage=3, name="match_answers", progress=25)
             
             answer_keys = set(results["parsed_answers"].keys())
             question_keys = set(results["question_blocks"].keys())
             
-            results["debug_info"] = {
+            results["debug_info"].update({
                 "answer_keys": sorted(list(answer_keys)),
                 "question_keys": sorted(list(question_keys)),
                 "answer_count": len(answer_keys),
                 "question_count": len(question_keys),
                 "processing_mode": "enhanced_multimodal_v4"
-            }
+            })
             
             matching_keys = answer_keys & question_keys
             
@@ -1093,31 +2035,13 @@ class EnhancedMultimodalQuizAgent:
             
             # Step 4: Enhanced compilation
             self.logger.info("⚙️ Step 4/4: Compiling quiz with enhanced processing...")
+            self._emit_progress("stage", stage=4, name="compile_questions", progress=30,
+                                total_questions=len(matching_keys))
             
             matching_list = sorted(list(matching_keys))
             total_questions = len(matching_list)
             
-            compiled_count = 0
-            for i, q_num in enumerate(matching_list):
-                question_text = results["question_blocks"][q_num]
-                correct_answer = results["parsed_answers"][q_num]
-                
-                self.logger.info(f"⚙️ Processing question {i+1}/{total_questions} (ID: {q_num})")
-                
-                try:
-                    images = self._detect_question_images(question_text)
-                    compiled = self.compile_question_with_image_support(
-                        q_num, question_text, correct_answer, images
-                    )
-                    results["compiled_questions"].append(compiled)
-                    compiled_count += 1
-                    
-                except Exception as e:
-                    self.logger.error(f"❌ Failed to compile question {q_num}: {e}")
-                    fallback = self._create_enhanced_fallback_question(
-                        q_num, question_text, correct_answer, error=str(e)
-                    )
-                    results["compiled_questions"].append(fallback)
+            compiled_count = self._compile_matching_questions(matching_list, results, previous_questions)
             
             # Statistics
             processing_time = time.time() - start_time
@@ -1125,12 +2049,25 @@ class EnhancedMultimodalQuizAgent:
                 "total_questions": total_questions,
                 "successful_compilations": compiled_count,
                 "success_rate": f"{(compiled_count/total_questions*100):.1f}%",
+                "completed_questions": len(results["compiled_questions"]),
                 "processing_time": f"{processing_time:.2f}s",
-                "api_requests_used": self.config["requests_count"]
+                "api_requests_used": self.config["requests_count"],
+                "quota_wait_time": f"{self.processing_stats['quota_wait_seconds']:.1f}s",
+                "cache_hits": self.processing_stats["cache_hits"],
+                "compile_workers": self.config.get("compile_workers", 1),
+                "compile_mode": self.config.get("compile_mode", "single"),
+                "reused_questions": results["debug_info"].get("reused_questions", 0),
+                "local_compiled": results["debug_info"].get("local_compiled", 0)
             }
             
             results["success"] = True
             
+            if self._cancel_event.is_set():
+                results["cancelled"] = True
+                results["warnings"].append(
+                    f"⏹️ Run cancelled: kept {len(results['compiled_questions'])}/{total_questions} compiled questions"
+                )
+            
             self.logger.info(f"🎉 Enhanced processing complete!")
             self.logger.info(f"✅ Success: {compiled_count}/{total_questions} questions")
             
@@ -1140,6 +2077,310 @@ class EnhancedMultimodalQuizAgent:
         
         return results
     
+    def _get_compile_workers(self, total_questions: int) -> int:
+        """Resolve the effective worker count for question compilation."""
+        try:
+            workers = int(self.config.get("compile_workers", 1))
+        except (TypeError, ValueError):
+            workers = 1
+        return max(1, min(workers, total_questions or 1))
+    
+    def _compile_single_question(self, q_num: int, question_text: str, 
+                                 correct_answer: str) -> Tuple[Dict[str, Any], bool]:
+        """Compile one question, returning (question, compiled_ok) with fallback on failure."""
+        try:
+            images = self._question_images(q_num, question_text)
+            compiled = self.compile_question_with_image_support(
+                q_num, question_text, correct_answer, images
+            )
+            return compiled, not compiled.get("is_fallback", False)
+            
+        except Exception as e:
+            self.logger.error(f"❌ Failed to compile question {q_num}: {e}")
+            fallback = self._create_enhanced_fallback_question(
+                q_num, question_text, correct_answer, error=str(e)
+            )
+            return fallback, False
+    
+    def _compile_question_chunk(self, chunk: List[Tuple[int, str, str]]) -> Dict[int, Dict[str, Any]]:
+        """Compile one unit of work: a single question or a multi-question batch."""
+        if len(chunk) == 1:
+            q_num, question_text, correct_answer = chunk[0]
+            compiled, _ = self._compile_single_question(q_num, question_text, correct_answer)
+            return {q_num: compiled}
+        return self.compile_questions_batch(chunk)
+    
+    def _get_compile_batch_size(self) -> int:
+        """Questions per request: batch_size in batch mode, otherwise 1."""
+        if self.config.get("compile_mode") != "batch":
+            return 1
+        try:
+            return max(1, int(self.config.get("batch_size", 1)))
+        except (TypeError, ValueError):
+            return 1
+    
+    def _question_source_hash(self, question_text: str, correct_answer: str) -> str:
+        """Content hash of a question block + answer, independent of its number and spacing."""
+        body = QUESTION_HEADER_PREFIX.sub("", question_text.strip(), count=1)
+        normalized = " ".join(body.split())
+        return hashlib.sha256(f"{normalized}\x00{correct_answer}".encode("utf-8")).hexdigest()[:32]
+    
+    def _index_reusable_questions(self, previous_questions: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Index previously compiled (non-fallback) questions by source_hash."""
+        reusable = {}
+        for question in previous_questions or []:
+            source_hash = question.get("source_hash")
+            if source_hash and not question.get("is_fallback"):
+                reusable[source_hash] = question
+        return reusable
+    
+    def _compile_matching_questions(self, matching_list: List[int], results: Dict[str, Any],
+                                    previous_questions: List[Dict[str, Any]] = None) -> int:
+        """Compile matched questions serially or với bounded thread pool, giữ thứ tự so_cau."""
+        total_questions = len(matching_list)
+        reusable = self._index_reusable_questions(previous_questions)
+        source_hashes = {}
+        compiled_by_num = {}
+        items = []
+        
+        for q_num in matching_list:
+            question_text = results["question_blocks"][q_num]
+            correct_answer = results["parsed_answers"][q_num]
+            source_hash = self._question_source_hash(question_text, correct_answer)
+            source_hashes[q_num] = source_hash
+            
+            if source_hash in reusable:
+                reused = dict(reusable[source_hash])
+                reused["so_cau"] = q_num
+                compiled_by_num[q_num] = reused
+            else:
+                items.append((q_num, question_text, correct_answer))
+        
+        if reusable:
+            results["debug_info"]["reused_questions"] = len(compiled_by_num)
+            self.logger.info(f"♻️ Incremental: reused {len(compiled_by_num)}, compiling {len(items)} new/changed")
+        
+        for q_num, reused in compiled_by_num.items():
+            reused["source_hash"] = source_hashes[q_num]
+        self._emit_compiled_questions(compiled_by_num, compiled_by_num, total_questions, reused=True)
+        
+        # Well-formed blocks are compiled locally; only low-confidence ones go to the LLM
+        if self.config.get("local_compile") and items:
+            local_results = {}
+            remaining = []
+            threshold = self.config.get("local_compile_threshold", 0.9)
+            
+            for q_num, question_text, correct_answer in items:
+                compiled, confidence = self._compile_question_locally(
+                    q_num, question_text, correct_answer, self.question_block_layout.get(q_num)
+                )
+                if confidence >= threshold:
+                    # Images are only built for questions that stay local; the LLM path builds its own
+                    compiled = self._finalize_compiled_question(
+                        compiled, q_num, correct_answer, self._question_images(q_num, question_text)
+                    )
+                    compiled["source_hash"] = source_hashes[q_num]
+                    local_results[q_num] = compiled
+                else:
+                    remaining.append((q_num, question_text, correct_answer))
+            
+            compiled_by_num.update(local_results)
+            self._emit_compiled_questions(local_results, compiled_by_num, total_questions)
+            results["debug_info"]["local_compiled"] = len(local_results)
+            self.logger.info(f"🧩 Local compile: {len(local_results)} questions, {len(remaining)} sent to LLM")
+            items = remaining
+        
+        batch_size = self._get_compile_batch_size()
+        chunks = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+        workers = self._get_compile_workers(len(chunks))
+        
+        if batch_size > 1:
+            self.logger.info(f"📦 Batch mode: {len(chunks)} requests for {len(items)} questions")
+        
+        if workers == 1:
+            for i, chunk in enumerate(chunks):
+                if self._cancel_event.is_set():
+                    break
+                self.logger.info(f"⚙️ Processing question {i*batch_size+1}/{len(items)} (ID: {chunk[0][0]})")
+                chunk_result = self._compile_question_chunk(chunk)
+                self._attach_source_hashes(chunk_result, source_hashes)
+                compiled_by_num.update(chunk_result)
+                self._emit_compiled_questions(chunk_result, compiled_by_num, total_questions)
+        elif chunks:
+            self.logger.info(f"🧵 Compiling {len(chunks)} units with {workers} workers")
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="quiz-compile") as executor:
+                futures = {
+                    executor.submit(self._compile_question_chunk_unless_cancelled, chunk): chunk
+                    for chunk in chunks
+                }
+                
+                for done, future in enumerate(as_completed(futures), start=1):
+                    chunk_result = future.result()
+                    self._attach_source_hashes(chunk_result, source_hashes)
+                    compiled_by_num.update(chunk_result)
+                    self._emit_compiled_questions(chunk_result, compiled_by_num, total_questions)
+                    self.logger.info(f"⚙️ Compiled unit {done}/{len(chunks)} (ID: {futures[future][0][0]})")
+        
+        # Output in so_cau order regardless of completion order; a cancelled run keeps what finished
+        results["compiled_questions"].extend(
+            compiled_by_num[q_num] for q_num in matching_list if q_num in compiled_by_num
+        )
+        
+        return sum(1 for q in compiled_by_num.values() if not q.get("is_fallback"))
+    
+    def _compile_question_chunk_unless_cancelled(self, chunk: List[Tuple[int, str, str]]) -> Dict[int, Dict[str, Any]]:
+        """Thread-pool entry point: skip queued chunks once the run is cancelled."""
+        if self._cancel_event.is_set():
+            return {}
+        return self._compile_question_chunk(chunk)
+    
+    def _attach_source_hashes(self, chunk_result: Dict[int, Dict[str, Any]], source_hashes: Dict[int, str]) -> None:
+        """Tag compiled questions with the source hash used for incremental reuse."""
+        for q_num, compiled in chunk_result.items():
+            compiled["source_hash"] = source_hashes[q_num]
+    
+    def _emit_compiled_questions(self, chunk_result: Dict[int, Dict[str, Any]], 
+                                 compiled_by_num: Dict[int, Dict[str, Any]], total: int,
+                                 reused: bool = False) -> None:
+        """Emit one event per finished question (compiled, fallback or reused)."""
+        for q_num in sorted(chunk_result):
+            question = chunk_result[q_num]
+            if reused:
+                event = "question_reused"
+            elif question.get("is_fallback"):
+                event = "question_fallback"
+            else:
+                event = "question_compiled"
+            
+            self._emit_progress(
+                event,
+                so_cau=q_num,
+                question=question,
+                reason=question.get("fallback_reason", ""),
+                completed=len(compiled_by_num),
+                total=total,
+                progress=30 + int(65 * len(compiled_by_num) / max(total, 1))
+            )
+    
+    def process_incremental_quiz(self, answer_data, docx_file, quiz_engine, quiz_name: str,
+                                 answer_type: str = "text",
+                                 progress_callback: Callable[[Dict[str, Any]], None] = None) -> Dict[str, Any]:
+        """Re-process a DOCX against a stored quiz, compiling only new/changed blocks.
+        
+        Kết quả được lưu thành phiên bản mới của quiz qua quiz_engine.save_quiz_version
+        (run bị cancel sẽ không ghi đè phiên bản đang có).
+        """
+        previous_questions = quiz_engine.get_quiz_source_questions(quiz_name)
+        self.logger.info(f"♻️ Incremental mode against '{quiz_name}' ({len(previous_questions)} stored questions)")
+        
+        results = self.process_complete_quiz_enhanced(
+            answer_data, docx_file, answer_type, previous_questions=previous_questions,
+            progress_callback=progress_callback
+        )
+        
+        if results.get("success") and results.get("compiled_questions") and not results.get("cancelled"):
+            saved_name = quiz_engine.save_quiz_version(quiz_name, results["compiled_questions"])
+            if saved_name:
+                results["saved_quiz_name"] = saved_name
+            else:
+                results["warnings"].append(f"⚠️ Could not save new version of '{quiz_name}'")
+        
+        return results
+    
+    def process_quiz_job(self, answer_data=None, docx_file=None, answer_type: str = "text",
+                         job_id: str = None, job_store: QuizJobStore = None,
+                         progress_callback: Callable[[Dict[str, Any]], None] = None,
+                         claim_token: str = None) -> Dict[str, Any]:
+        """Run generation as a checkpointed job.
+        
+        Job mới: lưu input vào job store rồi xử lý (docx_file là path, bytes hoặc
+        upload). Nếu job_id đã tồn tại, input được đọc lại từ đĩa và các câu đã
+        checkpoint (khớp source_hash) được dùng lại, chỉ biên dịch phần còn thiếu.
+        Job đang chạy ở nơi khác (heartbeat còn mới) không được chạy song song.
+        
+        claim_token: token claim của queue worker; checkpoint chỉ được ghi khi token
+        còn hiệu lực, mất claim thì run bị cancel và results có claim_lost=True.
+        """
+        job_store = job_store or self.job_store
+        meta = job_store.get_job(job_id) if job_id else None
+        claim_lost = False
+        
+        if meta:
+            # A queue claim already arbitrated ownership; otherwise trust the heartbeat
+            if claim_token is None and meta.get("status") == JOB_STATUS_RUNNING and not job_store.is_stale(meta):
+                raise ValueError(f"Job {job_id} đang được xử lý ở nơi khác")
+            answer_data, docx_file, answer_type = job_store.load_inputs(job_id)
+            checkpointed = job_store.load_questions(job_id)
+            self.logger.info(f"🔁 Resuming job {job_id} with {len(checkpointed)} checkpointed questions")
+        else:
+            if answer_data is None or docx_file is None:
+                raise ValueError(f"Job not found and no inputs given: {job_id}")
+            job_id = job_store.create_job(answer_data, docx_file, answer_type, job_id=job_id)
+            checkpointed = []
+        
+        checkpointed_hashes = {q.get("source_hash") for q in checkpointed}
+        job_store.update_job(job_id, status=JOB_STATUS_RUNNING, error="", heartbeat_at=time.time())
+        
+        def checkpoint(event: Dict[str, Any]) -> None:
+            nonlocal claim_lost
+            if event["event"] == "question_compiled" and not claim_lost:
+                question = event["question"]
+                if question.get("source_hash") not in checkpointed_hashes:
+                    if job_store.append_question(job_id, question, claim_token):
+                        checkpointed_hashes.add(question.get("source_hash"))
+                    else:
+                        claim_lost = True
+                        self.cancel()
+            if progress_callback:
+                progress_callback({**event, "job_id": job_id})
+        
+        try:
+            with JobHeartbeat(lambda: job_store.heartbeat(job_id)):
+                results = self.process_complete_quiz_enhanced(
+                    answer_data, docx_file, answer_type,
+                    previous_questions=checkpointed,
+                    progress_callback=checkpoint
+                )
+        except Exception as e:
+            if not claim_lost:
+                job_store.update_job(job_id, status=JOB_STATUS_FAILED, error=str(e))
+            raise
+        
+        if claim_lost:
+            self.logger.warning(f"⚠️ Job {job_id} was claimed by another worker; leaving its state alone")
+            results.update(job_id=job_id, claim_lost=True)
+            return results
+        
+        if results.get("cancelled"):
+            status = JOB_STATUS_CANCELLED
+        elif results.get("success"):
+            status = JOB_STATUS_COMPLETED
+        else:
+            status = JOB_STATUS_FAILED
+        
+        job_store.update_job(
+            job_id,
+            status=status,
+            error="; ".join(results.get("errors", [])),
+            checkpointed_questions=len(checkpointed_hashes),
+            statistics=results.get("statistics", {})
+        )
+        if status == JOB_STATUS_COMPLETED:
+            # The DOCX handle points at the job's copy; close it before deleting the inputs
+            self._close_docx_source()
+            job_store.release_inputs(job_id)
+        
+        results["job_id"] = job_id
+        return results
+    
+    def resume_job(self, job_id: str, job_store: QuizJobStore = None,
+                   progress_callback: Callable[[Dict[str, Any]], None] = None) -> Dict[str, Any]:
+        """Resume một job từ checkpoint cuối cùng."""
+        job_store = job_store or self.job_store
+        if not job_store.get_job(job_id):
+            raise ValueError(f"Job not found: {job_id}")
+        return self.process_quiz_job(job_id=job_id, job_store=job_store, progress_callback=progress_callback)
+    
     def _enhanced_question_mapping(self, answer_keys: set, question_keys: set) -> Dict[int, int]:
         """Enhanced mapping with multiple strategies."""
         mapping = {}
@@ -0,0 +1,549 @@
+"""
+Lịch sử bài kiểm tra dạng append-only (JSONL segments).
+Mỗi bài hoàn thành là một dòng JSON ghi nối vào segment hiện tại, nên chi phí
+lưu không phụ thuộc độ dài lịch sử. Segment đầy thì được đóng lại; khi có đủ
+segment nhỏ đã đóng, chúng được compact thành file lớn hơn (bỏ dòng hỏng/trùng).
+Đọc lịch sử là stream từng dòng, không parse cả file một lần.
+
+Song song với segments là summaries.jsonl: mỗi kết quả một dòng nhỏ (mọi field
+trừ detailed_results) kèm vị trí của bản đầy đủ trong segment. Danh sách,
+phân trang chỉ đọc index này; detailed_results được đọc (seek thẳng tới dòng
+đó) khi mở một kết quả cụ thể. Thống kê là các aggregate cộng dồn trong
+stats.json, cập nhật O(1) mỗi lần ghi thêm kết quả.
+
+    quiz_storage/test_history/history_000001.jsonl
+    quiz_storage/test_history/history_000002.jsonl  <- segment đang ghi
+    quiz_storage/test_history/summaries.jsonl
+    quiz_storage/test_history/stats.json
+"""
+
+import heapq
+import json
+import os
+import re
+import threading
+import logging
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PATTERN = re.compile(r"^history_(\d{6})\.jsonl$")
+SUMMARIES_FILE = "summaries.jsonl"
+SUMMARY_EXCLUDED_FIELDS = ("detailed_results",)
+STATS_FILE = "stats.json"
+LEGACY_MIGRATED_MARKER = "legacy_migrated"
+PASS_SCORE = 5
+RECENT_TESTS_LIMIT = 15
+
+def summarize_record(record: Dict[str, Any], segment: int, offset: int, length: int) -> Dict[str, Any]:
+    """Bản tóm tắt của một kết quả + vị trí bản đầy đủ trong segment."""
+    summary = {key: value for key, value in record.items() if key not in SUMMARY_EXCLUDED_FIELDS}
+    summary["location"] = {"segment": segment, "offset": offset, "length": length}
+    return summary
+
+class HistoryStatistics:
+    """Aggregate cộng dồn của lịch sử, thêm một kết quả là O(1).
+    
+    Giữ tổng/đếm thay cho danh sách điểm, và min-heap theo finish_time cho
+    RECENT_TESTS_LIMIT bài gần nhất (bài cũ nhất trong heap bị đẩy ra trước).
+    summaries_inode/summaries_bytes ghi lại phần summaries.jsonl đã cộng vào.
+    """
+    
+    def __init__(self, data: Dict[str, Any] = None):
+        data = data or {}
+        self.count = data.get("count", 0)
+        self.total_score = data.get("total_score", 0.0)
+        self.total_percentage = data.get("total_percentage", 0.0)
+        self.highest_score = data.get("highest_score")
+        self.lowest_score = data.get("lowest_score")
+        self.passed = data.get("passed", 0)
+        self.mode_distribution = data.get("mode_distribution", {"exam": 0, "practice": 0})
+        self.difficulty = data.get("difficulty", {})
+        self.subject = data.get("subject", {})
+        self.monthly = data.get("monthly", {})
+        self.recent = data.get("recent", [])
+        self.summaries_inode = data.get("summaries_inode")
+        self.summaries_bytes = data.get("summaries_bytes", 0)
+        
+    def add(self, summary: Dict[str, Any]) -> None:
+        score = summary.get("score", 0)
+        self.count += 1
+        self.total_score += score
+        self.total_percentage += summary.get("percentage", 0)
+        self.highest_score = score if self.highest_score is None else max(self.highest_score, score)
+        self.lowest_score = score if self.lowest_score is None else min(self.lowest_score, score)
+        if score >= PASS_SCORE:
+            self.passed += 1
+            
+        mode = summary.get("test_mode", "exam")
+        self.mode_distribution[mode] = self.mode_distribution.get(mode, 0) + 1
+        
+        finish_time = str(summary.get("finish_time", ""))
+        month = self.monthly.setdefault(finish_time[:7], {"count": 0, "total_score": 0})
+        month["count"] += 1
+        month["total_score"] += score
+        
+        question_stats = summary.get("question_stats") or {}
+        for totals, breakdown in ((self.difficulty, question_stats.get("by_difficulty", {})),
+                                  (self.subject, question_stats.get("by_subject", {}))):
+            for key, stats in breakdown.items():
+                entry = totals.setdefault(key, {"correct": 0, "total": 0})
+                entry["correct"] += stats.get("correct", 0)
+                entry["total"] += stats.get("total", 0)
+                
+        recent_entry = [finish_time, summary.get("session_id", ""), {
+            key: summary.get(key) for key in (
+                "session_id", "student_name", "test_title", "score", "percentage",
+                "test_mode", "finish_time", "total_questions", "time_taken"
+            )
+        }]
+        if len(self.recent) < RECENT_TESTS_LIMIT:
+            heapq.heappush(self.recent, recent_entry)
+        elif recent_entry[:2] > self.recent[0][:2]:
+            heapq.heapreplace(self.recent, recent_entry)
+            
+    def recent_tests(self) -> List[Dict[str, Any]]:
+        """Các bài gần nhất, mới nhất trước."""
+        return [entry[2] for entry in sorted(self.recent, key=lambda entry: entry[:2], reverse=True)]
+        
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(vars(self))
+
+class TestHistoryStore:
+    """Append-only store cho các TestResult đã serialize (dict JSON-safe)."""
+    
+    def __init__(self, history_dir: str = "quiz_storage/test_history",
+                 segment_max_bytes: int = 1024 * 1024, compacted_max_bytes: int = 32 * 1024 * 1024,
+                 compact_min_segments: int = 8):
+        self.history_dir = Path(history_dir)
+        self.history_dir.mkdir(parents=True, exist_ok=True)
+        self.segment_max_bytes = segment_max_bytes
+        self.compacted_max_bytes = max(compacted_max_bytes, segment_max_bytes)
+        self.compact_min_segments = compact_min_segments
+        self._lock = threading.Lock()
+        
+        # Summary index, read lazily and then only the newly appended tail
+        self.summaries_path = self.history_dir / SUMMARIES_FILE
+        self._summaries: Optional[List[Dict[str, Any]]] = None
+        self._summary_positions: Dict[str, int] = {}  # session_id -> index in _summaries
+        self._summaries_read_bytes = 0
+        self._summaries_inode = None
+        
+        # Running statistics, persisted next to the segments
+        self.stats_path = self.history_dir / STATS_FILE
+        self._stats: Optional[HistoryStatistics] = None
+        
+    # ----- Segments -----
+    
+    def _segment_path(self, number: int) -> Path:
+        return self.history_dir / f"history_{number:06d}.jsonl"
+        
+    def _segment_numbers(self) -> List[int]:
+        numbers = []
+        for path in self.history_dir.iterdir():
+            match = SEGMENT_PATTERN.match(path.name)
+            if match:
+                numbers.append(int(match.group(1)))
+        return sorted(numbers)
+        
+    def segments(self) -> List[Path]:
+        """Các segment theo thứ tự ghi (segment cuối là segment đang ghi)."""
+        return [self._segment_path(number) for number in self._segment_numbers()]
+        
+    # ----- Writes -----
+    
+    def append(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """Ghi nối một kết quả; O(1) theo kích thước lịch sử. Trả về bản tóm tắt."""
+        return self.append_many([record])[0]
+        
+    def append_many(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not records:
+            return []
+        lines = [(json.dumps(record, ensure_ascii=False, default=str) + "\n").encode('utf-8') for record in records]
+        
+        with self._lock:
+            # Validate the index against the segments before extending it
+            if self._summaries is None:
+                self._refresh_summaries_locked()
+                
+            numbers = self._segment_numbers()
+            number = numbers[-1] if numbers else 1
+            active = self._segment_path(number)
+            prefix = b""
+            if active.exists() and active.stat().st_size >= self.segment_max_bytes:
+                # Seal the full segment and start a new one
+                number += 1
+                active = self._segment_path(number)
+                if len(self._compactable(numbers)) >= self.compact_min_segments:
+                    self._compact_locked(numbers)
+            elif self._has_torn_tail(active):
+                # Never glue a new record onto a line cut short by a crash
+                prefix = b"\n"
+                
+            offset = (active.stat().st_size if active.exists() else 0) + len(prefix)
+            summaries = []
+            for record, line in zip(records, lines):
+                summaries.append(summarize_record(record, number, offset, len(line)))
+                offset += len(line)
+                
+            # One write per batch with O_APPEND, so a crash can only tear the last line
+            with open(active, 'ab') as f:
+                f.write(prefix + b"".join(lines))
+                f.flush()
+            self._append_summaries(summaries)
+            self._sync_statistics_locked()
+            return summaries
+            
+    def _has_torn_tail(self, path: Path) -> bool:
+        if not path.exists() or path.stat().st_size == 0:
+            return False
+        with open(path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) != b"\n"
+            
+    # ----- Reads -----
+    
+    def _iter_segment(self, path: Path) -> Iterator[Dict[str, Any]]:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line_number, line in enumerate(f, start=1):
+                    if not line.strip():
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        logger.warning(f"⚠️ Bỏ qua dòng hỏng {path.name}:{line_number}")
+        except FileNotFoundError:
+            # Removed by a concurrent compaction; its records live in an earlier segment now
+            return
+            
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        """Stream mọi kết quả theo thứ tự ghi, mỗi session_id một lần."""
+        seen = set()
+        for path in self.segments():
+            for record in self._iter_segment(path):
+                session_id = record.get("session_id")
+                if session_id in seen:
+                    continue
+                seen.add(session_id)
+                yield record
+                
+    def read_record(self, location: Dict[str, int]) -> Optional[Dict[str, Any]]:
+        """Đọc đúng một dòng theo location trong summary (seek, không quét segment)."""
+        try:
+            with open(self._segment_path(location["segment"]), 'rb') as f:
+                f.seek(location["offset"])
+                return json.loads(f.read(location["length"]))
+        except (OSError, ValueError, KeyError):
+            return None
+            
+    def get_record(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Bản đầy đủ (kèm detailed_results) của một kết quả."""
+        def lookup():
+            with self._lock:
+                self._refresh_summaries_locked()
+                position = self._summary_positions.get(session_id)
+                return self._summaries[position] if position is not None else None
+                
+        return self._read_summarized_record(lookup)
+        
+    def record_at(self, index: int) -> Optional[Dict[str, Any]]:
+        """Bản đầy đủ của kết quả thứ `index` theo thứ tự ghi (IndexError nếu ngoài phạm vi)."""
+        return self._read_summarized_record(lambda: self.summary_at(index))
+        
+    def _read_summarized_record(self, lookup) -> Optional[Dict[str, Any]]:
+        """Đọc record mà `lookup()` trỏ tới, re-index một lần nếu location đã lỗi thời."""
+        for attempt in range(2):
+            summary = lookup()
+            if summary is None:
+                return None
+            record = self.read_record(summary["location"])
+            if record is not None and record.get("session_id") == summary.get("session_id"):
+                return record
+            # Locations moved under us (compaction by another engine): re-index once
+            self.rebuild_summaries()
+        return None
+        
+    def count(self) -> int:
+        with self._lock:
+            self._refresh_summaries_locked()
+            return len(self._summaries)
+            
+    def summary_at(self, index: int) -> Dict[str, Any]:
+        """Tóm tắt thứ `index` (hỗ trợ index âm) mà không copy cả danh sách."""
+        with self._lock:
+            self._refresh_summaries_locked()
+            return dict(self._summaries[index])
+        
+    def is_empty(self) -> bool:
+        return not any(path.stat().st_size for path in self.segments() if path.exists())
+        
+    # ----- Summary index -----
+    
+    def summaries(self) -> List[Dict[str, Any]]:
+        """Tóm tắt mọi kết quả theo thứ tự ghi (không có detailed_results).
+        
+        Lần đầu đọc cả summaries.jsonl, các lần sau chỉ đọc phần được ghi thêm.
+        """
+        with self._lock:
+            self._refresh_summaries_locked()
+            return list(self._summaries)
+            
+    def rebuild_summaries(self) -> int:
+        """Dựng lại summaries.jsonl từ segments; trả về số kết quả."""
+        with self._lock:
+            self._rebuild_summaries_locked()
+            return len(self._summaries)
+            
+    def _refresh_summaries_locked(self) -> None:
+        stat = self.summaries_path.stat() if self.summaries_path.exists() else None
+        size, inode = (stat.st_size, stat.st_ino) if stat else (0, None)
+        if self._summaries is None or inode != self._summaries_inode or size < self._summaries_read_bytes:
+            # First read, or the index was replaced (rebuild/compaction by another engine)
+            self._summaries, self._summaries_read_bytes, self._summaries_inode = [], 0, inode
+            self._summary_positions = {}
+            if not self._summaries_cover_segments():
+                self._rebuild_summaries_locked()
+                return
+        if size > self._summaries_read_bytes:
+            entries, read_bytes = self._read_summaries_from(self._summaries_read_bytes)
+            self._add_summaries(entries)
+            self._summaries_read_bytes += read_bytes
+            
+    def _add_summaries(self, entries: List[Dict[str, Any]]) -> None:
+        # Same first-wins rule as iter_records for a session_id written twice
+        for entry in entries:
+            if entry.get("session_id") not in self._summary_positions:
+                self._summary_positions[entry.get("session_id")] = len(self._summaries)
+                self._summaries.append(entry)
+                
+    def _read_summaries_from(self, offset: int, end: Optional[int] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """Các dòng hoàn chỉnh từ offset (tới end); dòng cuối chưa có newline để lần sau đọc."""
+        with open(self.summaries_path, 'rb') as f:
+            f.seek(offset)
+            data = f.read() if end is None else f.read(end - offset)
+        complete = data[:data.rfind(b"\n") + 1]
+        
+        entries = []
+        for line in complete.splitlines():
+            if line.strip():
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    logger.warning("⚠️ Bỏ qua dòng hỏng trong summaries.jsonl")
+        return entries, len(complete)
+        
+    def _summaries_cover_segments(self) -> bool:
+        """Index có tồn tại và trỏ tới cuối segment đang ghi (không thiếu append nào)."""
+        numbers = self._segment_numbers()
+        if not numbers:
+            return True
+        active = self._segment_path(numbers[-1])
+        if not self.summaries_path.exists():
+            return active.stat().st_size == 0
+            
+        last = self._last_summary()
+        if last is None:
+            return False
+        location = last.get("location", {})
+        end = location.get("offset", 0) + location.get("length", 0)
+        return location.get("segment") == numbers[-1] and end >= active.stat().st_size
+        
+    def _last_summary(self) -> Optional[Dict[str, Any]]:
+        with open(self.summaries_path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(0, size - 64 * 1024))
+            lines = [line for line in f.read().splitlines() if line.strip()]
+        try:
+            return json.loads(lines[-1]) if lines else None
+        except ValueError:
+            return None
+            
+    def _append_summaries(self, summaries: List[Dict[str, Any]]) -> None:
+        if self._has_torn_tail(self.summaries_path):
+            self._rebuild_summaries_locked()
+            return
+        with open(self.summaries_path, 'ab') as f:
+            f.write(b"".join(
+                (json.dumps(summary, ensure_ascii=False, default=str) + "\n").encode('utf-8')
+                for summary in summaries
+            ))
+        if self._summaries is not None:
+            self._refresh_summaries_locked()
+            
+    def _rebuild_summaries_locked(self) -> None:
+        summaries = []
+        seen = set()
+        for number in self._segment_numbers():
+            for record, offset, length in self._scan_segment(number):
+                if record.get("session_id") in seen:
+                    continue
+                seen.add(record.get("session_id"))
+                summaries.append(summarize_record(record, number, offset, length))
+                
+        tmp_path = self.summaries_path.with_suffix(".tmp")
+        data = b"".join(
+            (json.dumps(summary, ensure_ascii=False, default=str) + "\n").encode('utf-8') for summary in summaries
+        )
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, self.summaries_path)
+        
+        self._summaries = summaries
+        self._summary_positions = {summary.get("session_id"): position for position, summary in enumerate(summaries)}
+        self._summaries_read_bytes = len(data)
+        self._summaries_inode = self.summaries_path.stat().st_ino
+        logger.info(f"🗂️ Rebuilt history summaries ({len(summaries)} results)")
+        
+    def _scan_segment(self, number: int) -> Iterator[Tuple[Dict[str, Any], int, int]]:
+        """(record, offset, length) cho mỗi dòng hợp lệ của segment."""
+        try:
+            with open(self._segment_path(number), 'rb') as f:
+                offset = 0
+                for line in f:
+                    if line.strip():
+                        try:
+                            yield json.loads(line), offset, len(line)
+                        except ValueError:
+                            pass
+                    offset += len(line)
+        except FileNotFoundError:
+            return
+            
+    # ----- Statistics -----
+    
+    def statistics(self) -> HistoryStatistics:
+        """Aggregate hiện tại; chỉ cộng thêm các summary mới kể từ lần trước."""
+        with self._lock:
+            self._sync_statistics_locked()
+            return HistoryStatistics(json.loads(json.dumps(self._stats.to_dict())))
+            
+    def _sync_statistics_locked(self) -> None:
+        if self._stats is None:
+            self._stats = self._load_statistics()
+            
+        stat = self.summaries_path.stat() if self.summaries_path.exists() else None
+        size, inode = (stat.st_size, stat.st_ino) if stat else (0, None)
+        stats = self._stats
+        if inode == stats.summaries_inode and size == stats.summaries_bytes:
+            return
+            
+        # New lines are only counted if the (first-wins) index keeps them, as count() does,
+        # so aggregate exactly the part of summaries.jsonl the refreshed index has read
+        self._refresh_summaries_locked()
+        size, inode = self._summaries_read_bytes, self._summaries_inode
+        if inode != stats.summaries_inode or size < stats.summaries_bytes:
+            # Index was rebuilt (compaction, repair, migration): aggregate it from scratch
+            stats = HistoryStatistics({"summaries_inode": inode})
+        if size > stats.summaries_bytes:
+            entries, read_bytes = self._read_summaries_from(stats.summaries_bytes, size)
+            for entry in entries:
+                if self._is_indexed(entry):
+                    stats.add(entry)
+            stats.summaries_bytes += read_bytes
+            
+        self._stats = stats
+        self._save_statistics()
+        
+    def _is_indexed(self, entry: Dict[str, Any]) -> bool:
+        position = self._summary_positions.get(entry.get("session_id"))
+        return position is not None and self._summaries[position].get("location") == entry.get("location")
+        
+    def _load_statistics(self) -> HistoryStatistics:
+        try:
+            with open(self.stats_path, 'r', encoding='utf-8') as f:
+                return HistoryStatistics(json.load(f))
+        except (OSError, ValueError):
+            return HistoryStatistics()
+            
+    def _save_statistics(self) -> None:
+        tmp_path = self.stats_path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._stats.to_dict(), f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, self.stats_path)
+        
+    # ----- Compaction -----
+    
+    def compact(self) -> int:
+        """Gộp các segment nhỏ đã đóng thành file lớn; trả về số segment bị thay thế."""
+        with self._lock:
+            numbers = self._segment_numbers()
+            return self._compact_locked(numbers)
+            
+    def _compactable(self, numbers: List[int]) -> List[int]:
+        """Sealed segments from the first one that is not already a full compacted file.
+        
+        The newest segment may still be receiving appends and is left alone. Full
+        compacted files always precede the rest, so the result is a contiguous suffix.
+        """
+        sealed = numbers[:-1]
+        for index, number in enumerate(sealed):
+            if self._segment_path(number).stat().st_size < self.compacted_max_bytes:
+                return sealed[index:]
+        return []
+        
+    def _compact_locked(self, numbers: List[int]) -> int:
+        sealed = self._compactable(numbers)
+        if len(sealed) < 2:
+            return 0
+            
+        # Rewrite sealed records into large segments, dropping torn lines and duplicates
+        outputs: List[Path] = []
+        seen = set()
+        out = None
+        try:
+            for number in sealed:
+                for record in self._iter_segment(self._segment_path(number)):
+                    session_id = record.get("session_id")
+                    if session_id in seen:
+                        continue
+                    seen.add(session_id)
+                    
+                    if out is None or out.tell() >= self.compacted_max_bytes:
+                        if out is not None:
+                            out.close()
+                        outputs.append(self.history_dir / f"compact_{len(outputs):06d}.tmp")
+                        out = open(outputs[-1], 'w', encoding='utf-8')
+                    out.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        finally:
+            if out is not None:
+                out.close()
+                
+        # Outputs take over the lowest sealed numbers, so ordering is preserved; a crash
+        # part-way leaves duplicates that iter_records skips by session_id
+        for index, tmp_path in enumerate(outputs):
+            os.replace(tmp_path, self._segment_path(sealed[index]))
+        for number in sealed[len(outputs):]:
+            self._segment_path(number).unlink()
+        self._rebuild_summaries_locked()
+        
+        logger.info(f"🗜️ Compacted {len(sealed)} history segments into {len(outputs)}")
+        return len(sealed)
+        
+    # ----- Migration -----
+    
+    def migrate_legacy_file(self, legacy_file: Path) -> int:
+        """Import test_history.json (một JSON array) một lần.
+        
+        File cũ được giữ nguyên (có thể đang được git track); việc đã migrate được
+        đánh dấu bằng file LEGACY_MIGRATED_MARKER trong history dir.
+        """
+        legacy_file = Path(legacy_file)
+        marker_file = self.history_dir / LEGACY_MIGRATED_MARKER
+        if marker_file.exists() or not legacy_file.exists():
+            return 0
+            
+        with open(legacy_file, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+            
+        if self.is_empty():
+            self.append_many(records)
+        else:
+            # Partially migrated before (e.g. crash before the marker): only add what is missing
+            known = {record.get("session_id") for record in self.iter_records()}
+            self.append_many([record for record in records if record.get("session_id") not in known])
+            
+        marker_file.write_text(str(legacy_file), encoding='utf-8')
+        logger.info(f"📦 Migrated {len(records)} test results to {self.history_dir}")
+        return len(records)
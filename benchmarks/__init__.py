@@ -0,0 +1,3 @@
+"""
+Benchmark suite cho pipeline tạo quiz (synthetic DOCX + fake LLM backend).
+"""
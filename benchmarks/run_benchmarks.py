@@ -0,0 +1,204 @@
+"""
+End-to-end benchmark cho pipeline tạo quiz, chạy với FakeLLMBackend (không tốn quota).
+
+Với mỗi kích thước đề, đo riêng từng stage:
+  - extract_questions_from_docx
+  - process_text_answers
+  - process_complete_quiz_enhanced (toàn bộ pipeline)
+và ghi timings, số request, peak memory (tracemalloc) ra JSON để theo dõi theo thời gian.
+
+    python -m benchmarks.run_benchmarks --sizes 10,100,500,2000 --workers 4 --batch
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from backend.llm_backends import FakeLLMBackend
+from backend.rate_limiter import TokenBucketRateLimiter
+from benchmarks.synthetic_docx import generate_synthetic_quiz
+
+class UploadedBytes(io.BytesIO):
+    """Giống Streamlit UploadedFile ở mức agent cần: getvalue() + name."""
+    
+    def __init__(self, data: bytes, name: str):
+        super().__init__(data)
+        self.name = name
+
+def measure(func: Callable[[], Any]) -> Tuple[Any, Dict[str, float]]:
+    """Run `func`, returning its result plus wall time and tracemalloc peak."""
+    tracemalloc.reset_peak()
+    start_current, _ = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+    
+    result = func()
+    
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    return result, {
+        "seconds": round(elapsed, 4),
+        "peak_memory_mb": round(max(0, peak - start_current) / 1024 / 1024, 2)
+    }
+
+def create_agent(args, backend: FakeLLMBackend):
+    """Agent dùng fake backend, limiter in-process và không dùng response cache."""
+    from backend.simple_agent import EnhancedMultimodalQuizAgent
+    
+    agent = EnhancedMultimodalQuizAgent(
+        enable_logging=args.verbose,
+        backend=backend,
+        rate_limiter=TokenBucketRateLimiter(
+            requests_per_minute=args.rpm, tokens_per_minute=args.tpm, burst=args.burst
+        )
+    )
+    if not args.cache:
+        agent.response_cache = None
+        
+    agent.config["compile_workers"] = args.workers
+    agent.config["compile_mode"] = "batch" if args.batch else "single"
+    agent.config["batch_size"] = args.batch_size
+    agent.config["retry_base_delay"] = args.retry_base_delay
+    return agent
+
+def request_delta(before: Dict[str, int], after: Dict[str, int]) -> Dict[str, int]:
+    return {key: value - before.get(key, 0) for key, value in after.items() if value - before.get(key, 0)}
+
+def run_size(args, num_questions: int) -> Dict[str, Any]:
+    """Benchmark một kích thước đề."""
+    quiz, generate_stats = measure(lambda: generate_synthetic_quiz(num_questions, seed=args.seed))
+    docx_name = f"synthetic_{num_questions}.docx"
+    
+    backend = FakeLLMBackend(
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_delay=args.retry_delay,
+        malformed_rate=args.malformed_rate,
+        seed=args.seed
+    )
+    agent = create_agent(args, backend)
+    report = {
+        "num_questions": num_questions,
+        "num_tables": quiz.num_tables,
+        "num_images": quiz.num_images,
+        "docx_kb": round(len(quiz.docx_bytes) / 1024, 1),
+        "stages": {"generate_corpus": generate_stats}
+    }
+    
+    before = backend.get_stats()
+    blocks, stats = measure(lambda: agent.extract_questions_from_docx(UploadedBytes(quiz.docx_bytes, docx_name)))
+    stats.update(questions_found=len(blocks), requests=request_delta(before, backend.get_stats()))
+    report["stages"]["extract_questions_from_docx"] = stats
+    
+    before = backend.get_stats()
+    answers, stats = measure(lambda: agent.process_text_answers(quiz.answer_text))
+    stats.update(
+        answers_found=len(answers),
+        answers_correct=sum(1 for num, ans in quiz.answers.items() if answers.get(num) == ans),
+        requests=request_delta(before, backend.get_stats())
+    )
+    report["stages"]["process_text_answers"] = stats
+    
+    before = backend.get_stats()
+    results, stats = measure(lambda: agent.process_complete_quiz_enhanced(
+        quiz.answer_text, UploadedBytes(quiz.docx_bytes, docx_name), "text"
+    ))
+    statistics = results.get("statistics", {})
+    stats.update(
+        success=results.get("success", False),
+        compiled_questions=len(results.get("compiled_questions", [])),
+        fallback_questions=sum(1 for q in results.get("compiled_questions", []) if q.get("is_fallback")),
+        requests=request_delta(before, backend.get_stats()),
+        quota_wait_seconds=round(agent.processing_stats.get("quota_wait_seconds", 0.0), 2),
+        rate_limit_wait_seconds=round(agent.processing_stats.get("rate_limit_wait_seconds", 0.0), 2),
+        questions_per_second=round(
+            len(results.get("compiled_questions", [])) / stats["seconds"], 2
+        ) if stats["seconds"] else None,
+        errors=results.get("errors", []),
+        statistics={key: statistics.get(key) for key in ("api_requests_used", "compile_workers", "compile_mode")}
+    )
+    report["stages"]["full_pipeline"] = stats
+    
+    return report
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def main():
+    parser = argparse.ArgumentParser(description="QuizForce pipeline benchmarks (fake LLM backend)")
+    parser.add_argument("--sizes", default="10,100,500,2000", help="Số câu mỗi đề, phân tách bởi dấu phẩy")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=1, help="compile_workers")
+    parser.add_argument("--batch", action="store_true", help="Dùng batch compile mode")
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.0, help="Latency giả lập mỗi request (giây)")
+    parser.add_argument("--latency-jitter", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Tỉ lệ inject 429")
+    parser.add_argument("--retry-delay", type=int, default=1, help="retry_delay trong lỗi 429 giả lập")
+    parser.add_argument("--retry-base-delay", type=float, default=0.1)
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Tỉ lệ output JSON hỏng")
+    parser.add_argument("--rpm", type=float, default=100_000, help="Requests/phút của limiter")
+    parser.add_argument("--tpm", type=float, default=1_000_000_000)
+    parser.add_argument("--burst", type=int, default=1000)
+    parser.add_argument("--cache", action="store_true", help="Giữ response cache (mặc định tắt)")
+    parser.add_argument("--output", default=None, help="File JSON kết quả")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    
+    # Keep benchmark side effects (cache/jobs DBs) out of the real quiz_storage
+    scratch_dir = tempfile.mkdtemp(prefix="quiz_bench_")
+    os.environ.setdefault("QUIZ_RESPONSE_CACHE", str(Path(scratch_dir) / "response_cache.db"))
+    os.environ.setdefault("QUIZ_JOBS_DIR", str(Path(scratch_dir) / "jobs"))
+    
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    tracemalloc.start()
+    
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "verbose")},
+        "runs": []
+    }
+    
+    for size in sizes:
+        print(f"🏁 Benchmark {size} câu...")
+        run = run_size(args, size)
+        report["runs"].append(run)
+        pipeline = run["stages"]["full_pipeline"]
+        print(f"   ⏱️ extract {run['stages']['extract_questions_from_docx']['seconds']}s | "
+              f"answers {run['stages']['process_text_answers']['seconds']}s | "
+              f"pipeline {pipeline['seconds']}s ({pipeline['compiled_questions']} câu, "
+              f"{pipeline['requests'].get('requests', 0)} requests, {pipeline['peak_memory_mb']} MB peak)")
+              
+    tracemalloc.stop()
+    
+    output = Path(args.output or PROJECT_ROOT / "benchmarks" / "results" /
+                  f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+        
+    print(f"✅ Đã ghi kết quả: {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Sinh bộ đề DOCX tiếng Việt tổng hợp (kèm đáp án) cho benchmark.
+Deterministic theo seed: cùng (num_questions, seed) luôn cho cùng file.
+Một phần câu hỏi có bảng và hình ảnh nhúng để mô phỏng đề thật.
+"""
+
+import io
+import random
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+import docx
+from docx.shared import Inches
+from PIL import Image, ImageDraw
+
+SUBJECTS = {
+    "Toán": [
+        "Cho hàm số y = {a}x² + {b}x - {c}. Giá trị nhỏ nhất của hàm số trên đoạn [0; {d}] là bao nhiêu?",
+        "Tính tích phân của f(x) = {a}x + {b} trên đoạn từ 0 đến {c}.",
+        "Trong không gian Oxyz, khoảng cách từ điểm M({a}; {b}; {c}) đến mặt phẳng (Oxy) bằng bao nhiêu?",
+    ],
+    "Vật lý": [
+        "Một vật dao động điều hòa với biên độ {a} cm và chu kỳ {b} s. Tốc độ cực đại của vật là bao nhiêu?",
+        "Một dòng điện {a} A chạy qua điện trở {b} Ω trong {c} phút. Nhiệt lượng tỏa ra là bao nhiêu?",
+    ],
+    "Lịch sử": [
+        "Sự kiện nào sau đây diễn ra vào năm 19{a}{b} trong lịch sử Việt Nam?",
+        "Nguyên nhân chủ yếu dẫn đến thắng lợi của cuộc kháng chiến giai đoạn {a}{b}{c}{d} là gì?",
+    ],
+    "Địa lý": [
+        "Vùng nào của nước ta có diện tích trồng cây công nghiệp lâu năm lớn thứ {a}?",
+        "Dựa vào bảng số liệu, nhận xét nào đúng về sản lượng lúa của vùng {b} giai đoạn 20{c}{d}?",
+    ],
+    "Sinh học": [
+        "Ở một loài thực vật, gen A quy định tính trạng trội hoàn toàn. Phép lai Aa × Aa cho tỉ lệ kiểu hình {a}:{b} ở F{c}?",
+    ],
+}
+
+CHOICE_PHRASES = [
+    "{v}", "{v} đơn vị", "Khoảng {v}", "Bằng {v}", "Không xác định được", "Lớn hơn {v}",
+    "Đồng bằng sông Hồng", "Tây Nguyên", "Cách mạng tháng Tám", "Hiệp định Giơ-ne-vơ",
+]
+
+@dataclass
+class SyntheticQuiz:
+    """Một bộ đề tổng hợp: DOCX bytes + đáp án (dict và dạng text như giáo viên nhập)."""
+    docx_bytes: bytes
+    answers: Dict[int, str]
+    answer_text: str
+    num_questions: int
+    num_tables: int = 0
+    num_images: int = 0
+    subjects: List[str] = field(default_factory=list)
+
+def _make_image(rng: random.Random, index: int) -> bytes:
+    """Hình minh họa nhỏ (đồ thị giả) dạng PNG."""
+    image = Image.new("RGB", (320, 200), "white")
+    draw = ImageDraw.Draw(image)
+    draw.line([(20, 180), (300, 180)], fill="black", width=2)
+    draw.line([(20, 20), (20, 180)], fill="black", width=2)
+    points = [(20 + i * 28, 180 - rng.randint(10, 150)) for i in range(11)]
+    draw.line(points, fill=(200, 30, 30), width=3)
+    draw.text((30, 25), f"Hinh {index}", fill="black")
+    
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def _answer_line(rng: random.Random, num: int, answer: str) -> str:
+    """Đáp án với vài định dạng giáo viên hay dùng."""
+    style = rng.random()
+    if style < 0.7:
+        return f"{num}. {answer}"
+    if style < 0.85:
+        return f"Câu {num}: {answer}"
+    return f"{num}) {answer}"
+
+def generate_synthetic_quiz(num_questions: int, seed: int = 42, table_every: int = 15,
+                            image_every: int = 20) -> SyntheticQuiz:
+    """Sinh đề `num_questions` câu; mỗi `table_every` câu có bảng, mỗi `image_every` câu có hình."""
+    rng = random.Random(seed + num_questions)
+    document = docx.Document()
+    document.add_heading("ĐỀ KIỂM TRA TỔNG HỢP", level=1)
+    document.add_paragraph(f"Thời gian làm bài: {max(15, num_questions)} phút. Số câu: {num_questions}.")
+    
+    answers = {}
+    subjects = []
+    num_tables = 0
+    num_images = 0
+    
+    for num in range(1, num_questions + 1):
+        subject = rng.choice(list(SUBJECTS))
+        subjects.append(subject)
+        values = {key: rng.randint(1, 9) for key in "abcd"}
+        stem = rng.choice(SUBJECTS[subject]).format(**values)
+        
+        document.add_paragraph(f"Câu {num}. {stem}")
+        
+        if table_every and num % table_every == 0:
+            table = document.add_table(rows=3, cols=3)
+            for row_idx, row in enumerate(table.rows):
+                for col_idx, cell in enumerate(row.cells):
+                    cell.text = "Năm" if row_idx == 0 and col_idx == 0 else str(rng.randint(100, 999))
+            num_tables += 1
+            
+        if image_every and num % image_every == 0:
+            document.add_picture(io.BytesIO(_make_image(rng, num)), width=Inches(2.5))
+            num_images += 1
+            
+        for letter in "ABCD":
+            phrase = rng.choice(CHOICE_PHRASES).format(v=rng.randint(1, 500))
+            document.add_paragraph(f"{letter}. {phrase}")
+            
+        # ~5% câu nhiều đáp án, phần còn lại một đáp án
+        if rng.random() < 0.05:
+            answers[num] = "".join(sorted(rng.sample("ABCD", 2)))
+        else:
+            answers[num] = rng.choice("ABCD")
+            
+    buffer = io.BytesIO()
+    document.save(buffer)
+    
+    answer_text = "\n".join(_answer_line(rng, num, answer) for num, answer in answers.items())
+    
+    return SyntheticQuiz(
+        docx_bytes=buffer.getvalue(),
+        answers=answers,
+        answer_text=answer_text,
+        num_questions=num_questions,
+        num_tables=num_tables,
+        num_images=num_images,
+        subjects=subjects
+    )
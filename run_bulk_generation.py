@@ -0,0 +1,21 @@
+"""
+Runner script for bulk quiz generation.
+Tạo quiz cho cả thư mục đề (hoặc manifest) mà không cần mở UI.
+
+    python run_bulk_generation.py de_thi/ --concurrency 3
+    python run_bulk_generation.py manifest.csv --batch --report bulk_report.json
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from backend.bulk_generation import main
+
+if __name__ == "__main__":
+    sys.exit(main())
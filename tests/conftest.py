@@ -0,0 +1,42 @@
+"""Shared pytest fixtures; tests chạy offline (FakeLLMBackend, storage trong tmp_path)."""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Chạy test trong thư mục tạm để quiz_storage/ không rơi vào repo."""
+    monkeypatch.chdir(tmp_path)
+    for name in ("QUIZ_RATE_LIMIT_DB", "QUIZ_RESPONSE_CACHE", "QUIZ_JOBS_DIR"):
+        monkeypatch.delenv(name, raising=False)
+    return tmp_path
+
+
+@pytest.fixture
+def make_agent(workdir):
+    """Factory: agent offline với limiter in-process không giới hạn thực tế."""
+    from backend.llm_backends import FakeLLMBackend
+    from backend.rate_limiter import TokenBucketRateLimiter
+    from backend.simple_agent import SimpleQuizAgent
+
+    def factory(backend=None, **kwargs):
+        kwargs.setdefault("rate_limiter", TokenBucketRateLimiter(requests_per_minute=60_000, burst=1000))
+        return SimpleQuizAgent(backend=backend or FakeLLMBackend(), enable_logging=False, **kwargs)
+
+    return factory
+
+
+@pytest.fixture
+def agent(make_agent):
+    """Agent dùng FakeLLMBackend, không cần API key, không cache."""
+    quiz_agent = make_agent()
+    quiz_agent.config["cache_enabled"] = False
+    quiz_agent.response_cache = None
+    return quiz_agent
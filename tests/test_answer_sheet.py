@@ -0,0 +1,60 @@
+"""Answer-sheet preprocessing: deskew, row bands and merging band answers."""
+
+from PIL import Image, ImageDraw
+
+from backend.answer_sheet import merge_band_answers, preprocess_answer_sheet, split_into_row_bands
+
+
+def test_merge_band_answers_votes_and_flags_conflicts():
+    merged, conflicts = merge_band_answers([{1: "A", 2: "B"}, {2: "C", 3: "D"}, {2: "C"}])
+
+    assert merged == {1: "A", 2: "C", 3: "D"}
+    assert conflicts == [2]
+
+
+def test_merge_band_answers_tie_prefers_upper_band():
+    merged, conflicts = merge_band_answers([{4: "B"}, {4: "D"}])
+
+    assert merged == {4: "B"} and conflicts == [4]
+
+
+def _lined_sheet(height=2000, line_every=50):
+    image = Image.new("L", (400, height), 255)
+    draw = ImageDraw.Draw(image)
+    for y in range(20, height, line_every):
+        draw.rectangle([20, y, 380, y + 15], fill=0)
+    return image
+
+
+def test_split_into_row_bands_cuts_on_white_rows():
+    image = _lined_sheet()
+
+    bands = split_into_row_bands(image, band_height=500, overlap=10)
+
+    assert bands[0][0] == 0 and bands[-1][1] == image.height
+    for (_, bottom), (next_top, _) in zip(bands, bands[1:]):
+        assert bottom == next_top + 10
+        # Cut rows fall in the gaps between text lines
+        assert (next_top - 20) % 50 >= 16
+
+
+def test_split_into_row_bands_small_image_is_one_band():
+    assert split_into_row_bands(_lined_sheet(height=600), band_height=500) == [(0, 600)]
+    assert split_into_row_bands(_lined_sheet(), band_height=0) == [(0, 2000)]
+
+
+def test_split_into_row_bands_thin_bands_fall_back_to_one_band():
+    image = _lined_sheet(height=40)
+
+    for band_height in (1, 2, 3):
+        assert split_into_row_bands(image, band_height=band_height) == [(0, 40)]
+    assert split_into_row_bands(image, band_height=4)[-1][1] == 40
+
+
+def test_preprocess_straightens_rotated_sheet():
+    sheet = _lined_sheet(height=800).convert("RGB").rotate(3, fillcolor="white", expand=True)
+
+    gray, angle = preprocess_answer_sheet(sheet)
+
+    assert gray.mode == "L"
+    assert abs(angle + 3) <= 0.5
@@ -0,0 +1,25 @@
+"""Single-pass answer-key tokenizer (ANSWER_TOKEN_PATTERN via _parse_answers_with_regex)."""
+
+
+def test_regex_reads_mixed_formats(agent):
+    text = "1. A\nCâu 2) bd\n3: C\n4 - D\nQuestion 5 A\n6\tCA"
+
+    answers = agent._parse_answers_with_regex(text)
+
+    assert answers == {1: "A", 2: "BD", 3: "C", 4: "D", 5: "A", 6: "AC"}
+    assert agent.answer_parse_report["tokens"] == 6
+
+
+def test_regex_ignores_decimals_and_words(agent):
+    answers = agent._parse_answers_with_regex("Điểm 3.5 A\nCó 2 cách làm\n7. B")
+
+    assert answers == {7: "B"}
+
+
+def test_regex_reports_conflicts_and_keeps_last(agent):
+    answers = agent._parse_answers_with_regex("1. A\n2. B\n1. C\n2. B")
+
+    assert answers == {1: "C", 2: "B"}
+    assert agent.answer_parse_report["conflicts"] == {1: ["A", "C"]}
+    assert agent.answer_parse_report["duplicates"] == 2
+    assert agent.answer_parse_report["format"] == "N. X"
@@ -0,0 +1,71 @@
+"""Batched compile mode: batch_size questions per request, salvage and adaptive splitting."""
+
+import json
+
+from backend.llm_backends import FakeLLMBackend
+from benchmarks.synthetic_docx import generate_synthetic_quiz
+
+
+class FlakyBatchBackend(FakeLLMBackend):
+    """Drops the last question of each batch once, and answers junk to batches above max_batch."""
+
+    def __init__(self, drop_last=False, max_batch=None, **kwargs):
+        super().__init__(**kwargs)
+        self.drop_last = drop_last
+        self.max_batch = max_batch
+        self.batch_sizes = []
+
+    def generate(self, content, metadata=None):
+        metadata = metadata or {}
+        nums = metadata.get("question_nums")
+        if metadata.get("task") != "compile_question_batch":
+            return super().generate(content, metadata)
+
+        self.batch_sizes.append(len(nums))
+        if self.max_batch and len(nums) > self.max_batch:
+            return "Xin lỗi, tôi không thể xử lý yêu cầu này."
+        response = super().generate(content, metadata)
+        if self.drop_last and len(nums) > 1:
+            self.drop_last = False
+            items = json.loads(response.strip("`").removeprefix("json"))
+            return json.dumps(items[:-1], ensure_ascii=False)
+        return response
+
+
+def _compile(make_agent, backend, num_questions=12, batch_size=5):
+    quiz = generate_synthetic_quiz(num_questions, table_every=0, image_every=0)
+    quiz_agent = make_agent(backend=backend)
+    quiz_agent.response_cache = None
+    quiz_agent.config.update(compile_mode="batch", batch_size=batch_size)
+    results = quiz_agent.process_complete_quiz_enhanced(quiz.answer_text, quiz.docx_bytes)
+    assert [q["so_cau"] for q in results["compiled_questions"]] == list(range(1, num_questions + 1))
+    assert not any(q.get("is_fallback") for q in results["compiled_questions"])
+    return results
+
+
+def test_batches_of_batch_size(make_agent):
+    backend = FlakyBatchBackend()
+
+    results = _compile(make_agent, backend)
+
+    assert backend.batch_sizes == [5, 5, 2]
+    assert backend.get_stats().get("task:compile_question", 0) == 0
+    assert results["compiled_questions"][0]["dap_an"]
+
+
+def test_partial_response_requeues_only_missing(make_agent):
+    backend = FlakyBatchBackend(drop_last=True)
+
+    _compile(make_agent, backend)
+
+    # The question dropped from the first batch is compiled on its own
+    assert backend.batch_sizes == [5, 5, 2]
+    assert backend.get_stats()["task:compile_question"] == 1
+
+
+def test_unusable_batch_is_split_in_halves(make_agent):
+    backend = FlakyBatchBackend(max_batch=2)
+
+    _compile(make_agent, backend, num_questions=8, batch_size=8)
+
+    assert backend.batch_sizes == [8, 4, 2, 2, 4, 2, 2]
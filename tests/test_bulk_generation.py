@@ -0,0 +1,80 @@
+"""Bulk generation: pairing DOCX with answer files, manifests, and the shared-backend run."""
+
+import json
+
+import pytest
+
+from backend.bulk_generation import BulkQuizGenerator, BulkQuizItem, discover_bulk_items, load_manifest
+from backend.llm_backends import FakeLLMBackend
+from backend.quiz_test_engine import QuizTestEngine
+from benchmarks.synthetic_docx import generate_synthetic_quiz
+
+
+@pytest.fixture
+def bulk_env(workdir, monkeypatch):
+    """Per-test limiter/cache stores, and a limiter loose enough not to throttle."""
+    monkeypatch.setenv("QUIZ_RATE_LIMIT_DB", str(workdir / "rate_limit.db"))
+    monkeypatch.setenv("QUIZ_RESPONSE_CACHE", str(workdir / "response_cache.db"))
+    monkeypatch.setenv("QUIZ_REQUESTS_PER_MINUTE", "60000")
+    return workdir
+
+
+def _write_quiz(directory, stem, num_questions, answer_suffix="_dap_an.txt"):
+    quiz = generate_synthetic_quiz(num_questions, table_every=0, image_every=0)
+    (directory / f"{stem}.docx").write_bytes(quiz.docx_bytes)
+    (directory / f"{stem}{answer_suffix}").write_text(quiz.answer_text, encoding="utf-8")
+    return quiz
+
+
+def test_discover_pairs_docx_with_answer_files(tmp_path):
+    (tmp_path / "toan.docx").write_bytes(b"docx")
+    (tmp_path / "toan_dap_an.txt").write_text("1. A", encoding="utf-8")
+    (tmp_path / "ly.docx").write_bytes(b"docx")
+    (tmp_path / "ly.png").write_bytes(b"png")
+    (tmp_path / "hoa.docx").write_bytes(b"docx")
+    (tmp_path / "~$toan.docx").write_bytes(b"lock")
+
+    items = discover_bulk_items(str(tmp_path))
+
+    assert [(item.quiz_name, item.answer_type) for item in items] == [("ly", "image"), ("toan", "text")]
+    assert items[1].answer_path.endswith("toan_dap_an.txt")
+
+
+def test_manifest_json_and_csv_resolve_relative_paths(tmp_path):
+    (tmp_path / "m.json").write_text(json.dumps([{"docx": "a.docx", "answers": "a.jpg", "name": "Đề A"}]), encoding="utf-8")
+    (tmp_path / "m.csv").write_text("docx,answers\nsub/b.docx,b.txt\n", encoding="utf-8")
+
+    json_item, = load_manifest(str(tmp_path / "m.json"))
+    csv_item, = load_manifest(str(tmp_path / "m.csv"))
+
+    assert (json_item.quiz_name, json_item.answer_type) == ("Đề A", "image")
+    assert json_item.docx_path == str(tmp_path / "a.docx")
+    assert (csv_item.quiz_name, csv_item.answer_type) == ("b", "text")
+
+
+def test_manifest_row_without_answers_is_rejected(tmp_path):
+    (tmp_path / "m.json").write_text(json.dumps([{"docx": "a.docx"}]), encoding="utf-8")
+
+    with pytest.raises(ValueError, match="dòng 1"):
+        load_manifest(str(tmp_path / "m.json"))
+
+
+def test_run_shares_backend_and_keeps_input_order(bulk_env):
+    _write_quiz(bulk_env, "de_1", 6)
+    _write_quiz(bulk_env, "de_2", 4)
+    items = discover_bulk_items(str(bulk_env))
+    items.append(BulkQuizItem(str(bulk_env / "thieu.docx"), str(bulk_env / "thieu.txt"), "thieu"))
+    backend = FakeLLMBackend(latency_jitter=0.01)
+    engine = QuizTestEngine()
+    progress = []
+
+    generator = BulkQuizGenerator(quiz_engine=engine, max_concurrent_files=2, backend=backend)
+    summaries = generator.run(items, progress_callback=lambda summary, done, total: progress.append((done, total)))
+
+    assert [summary["quiz_name"] for summary in summaries] == ["de_1", "de_2", "thieu"]
+    assert [summary["questions"] for summary in summaries] == [6, 4, 0]
+    assert summaries[0]["success"] and summaries[0]["saved_as"] == "de_1"
+    assert not summaries[2]["success"] and summaries[2]["errors"]
+    assert backend.get_stats()["task:compile_question"] == 10
+    assert sorted(progress) == [(1, 3), (2, 3), (3, 3)]
+    assert engine.quiz_store.get_quiz_info("de_2")["questions_count"] == 4
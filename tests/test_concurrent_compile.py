@@ -0,0 +1,66 @@
+"""Bounded-concurrency compilation (compile_workers): so_cau order and per-question fallback."""
+
+import threading
+
+from backend.llm_backends import FakeLLMBackend
+from benchmarks.synthetic_docx import generate_synthetic_quiz
+
+
+class TrackingBackend(FakeLLMBackend):
+    """FakeLLMBackend that records peak concurrency; questions in `failing` get a 400."""
+
+    def __init__(self, failing=(), **kwargs):
+        super().__init__(**kwargs)
+        self.failing = set(failing)
+        self.active = 0
+        self.peak = 0
+        self._tracking_lock = threading.Lock()
+
+    def generate(self, content, metadata=None):
+        with self._tracking_lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            if (metadata or {}).get("question_num") in self.failing:
+                raise Exception("400 Request contains an invalid argument.")
+            return super().generate(content, metadata)
+        finally:
+            with self._tracking_lock:
+                self.active -= 1
+
+
+def _compile(make_agent, backend, workers, num_questions=16):
+    quiz = generate_synthetic_quiz(num_questions, table_every=0, image_every=0)
+    quiz_agent = make_agent(backend=backend)
+    quiz_agent.response_cache = None
+    quiz_agent.config["compile_workers"] = workers
+    return quiz_agent.process_complete_quiz_enhanced(quiz.answer_text, quiz.docx_bytes)
+
+
+def test_parallel_output_keeps_so_cau_order(make_agent):
+    backend = TrackingBackend(latency=0.01, latency_jitter=0.03)
+
+    results = _compile(make_agent, backend, workers=4)
+
+    assert results["success"]
+    assert [q["so_cau"] for q in results["compiled_questions"]] == list(range(1, 17))
+    assert 1 < backend.peak <= 4
+
+
+def test_parallel_matches_serial(make_agent):
+    serial = _compile(make_agent, TrackingBackend(), workers=1)
+    parallel = _compile(make_agent, TrackingBackend(latency_jitter=0.02), workers=4)
+
+    fields = ("so_cau", "cau_hoi", "lua_chon", "dap_an")
+    assert [{key: q[key] for key in fields} for q in parallel["compiled_questions"]] == \
+           [{key: q[key] for key in fields} for q in serial["compiled_questions"]]
+
+
+def test_worker_error_falls_back_for_that_question_only(make_agent):
+    backend = TrackingBackend(failing={3, 7}, latency_jitter=0.02)
+
+    results = _compile(make_agent, backend, workers=4)
+
+    questions = results["compiled_questions"]
+    assert [q["so_cau"] for q in questions] == list(range(1, 17))
+    assert [q["so_cau"] for q in questions if q.get("is_fallback")] == [3, 7]
@@ -0,0 +1,82 @@
+"""DOCX extraction: image anchoring for inline, VML and table-cell images."""
+
+import io
+
+import docx
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
+from PIL import Image
+
+VML_NS = "urn:schemas-microsoft-com:vml"
+
+
+def _png(color):
+    buffer = io.BytesIO()
+    Image.new("RGB", (40, 30), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _add_choices(document):
+    for letter in "ABCD":
+        document.add_paragraph(f"{letter}. Phương án {letter} của câu hỏi")
+
+
+def _build_docx():
+    """12 câu; câu 2 có ảnh inline, câu 5 có ảnh VML, câu 8 nằm trong bảng kèm ảnh."""
+    document = docx.Document()
+    document.add_paragraph("ĐỀ KIỂM TRA")
+
+    for num in range(1, 13):
+        if num == 8:
+            table = document.add_table(rows=1, cols=2)
+            table.rows[0].cells[0].text = f"Câu {num}. Quan sát hình bên và cho biết đáp án đúng nhất?"
+            run = table.rows[0].cells[1].paragraphs[0].add_run()
+            run.add_picture(io.BytesIO(_png("blue")))
+            _add_choices(document)
+            continue
+
+        document.add_paragraph(f"Câu {num}. Nội dung câu hỏi số {num} dùng để kiểm tra trích xuất?")
+        if num == 2:
+            document.add_picture(io.BytesIO(_png("red")))
+        if num == 5:
+            # Ảnh kiểu cũ (Word 2003): w:pict/v:shape/v:imagedata r:id
+            rel_id, _ = document.part.get_or_add_image(io.BytesIO(_png("green")))
+            paragraph = document.add_paragraph()
+            paragraph._p.append(parse_xml(
+                f'<w:r {nsdecls("w", "r")} xmlns:v="{VML_NS}">'
+                f'<w:pict><v:shape style="width:40pt;height:30pt">'
+                f'<v:imagedata r:id="{rel_id}"/></v:shape></w:pict></w:r>'
+            ))
+        _add_choices(document)
+
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def test_module_imports_with_vml_tag():
+    from backend import simple_agent
+
+    assert simple_agent.DOCX_VML_IMAGEDATA_TAG == f"{{{VML_NS}}}imagedata"
+
+
+def test_images_anchor_to_their_questions(agent):
+    questions = agent.extract_questions_from_docx(_build_docx())
+
+    assert set(range(1, 13)) <= set(questions)
+    assert sorted(agent.docx_image_anchors) == [2, 5, 8]
+    assert all(len(ids) == 1 for ids in agent.docx_image_anchors.values())
+
+    vml_images = agent._question_docx_images(5)
+    assert vml_images[0]["source"] == "docx"
+    assert vml_images[0]["type"] == "image/png"
+    assert agent._question_docx_images(8)[0]["rel_id"] == agent.docx_image_anchors[8][0]
+
+
+def test_table_rows_yield_text_then_images(agent):
+    source = agent._open_docx_source(_build_docx())
+    blocks = list(agent._iter_docx_blocks(source))
+
+    row_index = next(i for i, (kind, text) in enumerate(blocks) if kind == "table")
+    assert blocks[row_index][1].startswith("Câu 8.")
+    assert blocks[row_index + 1][0] == "image"
@@ -0,0 +1,63 @@
+"""Incremental re-compilation: unchanged blocks are reused by source_hash, edits are recompiled."""
+
+from backend.llm_backends import FakeLLMBackend
+from backend.quiz_test_engine import QuizTestEngine
+from benchmarks.synthetic_docx import generate_synthetic_quiz
+
+
+def _agent(make_agent, backend):
+    quiz_agent = make_agent(backend=backend)
+    quiz_agent.response_cache = None
+    return quiz_agent
+
+
+def _answer_text(answers):
+    return "\n".join(f"{num}. {answer}" for num, answer in sorted(answers.items()))
+
+
+def test_unchanged_quiz_is_fully_reused(make_agent):
+    quiz = generate_synthetic_quiz(10, table_every=0, image_every=0)
+    first = _agent(make_agent, FakeLLMBackend()).process_complete_quiz_enhanced(quiz.answer_text, quiz.docx_bytes)
+    assert all(q.get("source_hash") for q in first["compiled_questions"])
+
+    backend = FakeLLMBackend()
+    events = []
+    second = _agent(make_agent, backend).process_complete_quiz_enhanced(
+        quiz.answer_text, quiz.docx_bytes, previous_questions=first["compiled_questions"],
+        progress_callback=events.append
+    )
+
+    assert backend.get_stats().get("task:compile_question", 0) == 0
+    assert second["debug_info"]["reused_questions"] == 10
+    assert [q["cau_hoi"] for q in second["compiled_questions"]] == [q["cau_hoi"] for q in first["compiled_questions"]]
+    assert sum(event["event"] == "question_reused" for event in events) == 10
+
+
+def test_changed_answer_recompiles_only_that_question(make_agent):
+    quiz = generate_synthetic_quiz(10, table_every=0, image_every=0)
+    first = _agent(make_agent, FakeLLMBackend()).process_complete_quiz_enhanced(quiz.answer_text, quiz.docx_bytes)
+
+    answers = dict(quiz.answers)
+    answers[4] = "A" if answers[4] != "A" else "B"
+    backend = FakeLLMBackend()
+    second = _agent(make_agent, backend).process_complete_quiz_enhanced(
+        _answer_text(answers), quiz.docx_bytes, previous_questions=first["compiled_questions"]
+    )
+
+    assert backend.get_stats()["task:compile_question"] == 1
+    assert second["debug_info"]["reused_questions"] == 9
+    assert second["compiled_questions"][3]["dap_an"] == answers[4]
+
+
+def test_process_incremental_quiz_saves_a_new_version(make_agent):
+    quiz = generate_synthetic_quiz(6, table_every=0, image_every=0)
+    engine = QuizTestEngine()
+    first = _agent(make_agent, FakeLLMBackend()).process_complete_quiz_enhanced(quiz.answer_text, quiz.docx_bytes)
+    engine.save_quiz_version("Đề 1", first["compiled_questions"])
+
+    backend = FakeLLMBackend()
+    results = _agent(make_agent, backend).process_incremental_quiz(quiz.answer_text, quiz.docx_bytes, engine, "Đề 1")
+
+    assert results["saved_quiz_name"] == "Đề 1"
+    assert backend.get_stats().get("task:compile_question", 0) == 0
+    assert engine.saved_quizzes["Đề 1"]["revision"] == 2
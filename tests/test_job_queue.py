@@ -0,0 +1,145 @@
+"""QuizJobQueue: atomic claims, stale re-claims and claim-token fencing."""
+
+import sqlite3
+import time
+
+import pytest
+
+from backend.job_queue import (
+    QUEUE_STALE_AFTER,
+    QUEUE_STATUS_CANCELLED,
+    QUEUE_STATUS_COMPLETED,
+    QUEUE_STATUS_QUEUED,
+    QUEUE_STATUS_RUNNING,
+    QuizJobQueue,
+)
+
+
+@pytest.fixture
+def job_queue(tmp_path):
+    return QuizJobQueue(str(tmp_path / "queue.db"), str(tmp_path / "jobs"))
+
+
+def _expire_heartbeat(job_queue, job_id):
+    job_queue._update(job_id, heartbeat_at=time.time() - job_queue.stale_after - 1)
+
+
+def test_default_stale_after_exceeds_retry_deadline():
+    assert QUEUE_STALE_AFTER > 2 * 300
+
+
+def test_claim_is_exclusive_until_heartbeat_is_stale(job_queue):
+    job_id = job_queue.submit("1. A", b"docx", source_name="de.docx")
+    assert job_queue.get_status(job_id)["status"] == QUEUE_STATUS_QUEUED
+
+    first = job_queue.claim("worker-1")
+    assert first["job_id"] == job_id and first["attempts"] == 1
+    assert job_queue.claim("worker-2") is None
+
+    _expire_heartbeat(job_queue, job_id)
+    second = job_queue.claim("worker-2")
+    assert second["job_id"] == job_id and second["attempts"] == 2
+    assert second["claim_token"] != first["claim_token"]
+    assert job_queue.get_status(job_id)["status"] == QUEUE_STATUS_RUNNING
+
+
+def test_stale_claim_token_is_fenced_out(job_queue):
+    job_id = job_queue.submit("1. A", b"docx")
+    first = job_queue.claim("worker-1")
+    store = job_queue.job_store
+    assert store.append_question(job_id, {"so_cau": 1}, first["claim_token"])
+
+    _expire_heartbeat(job_queue, job_id)
+    second = job_queue.claim("worker-2")
+
+    assert not job_queue.heartbeat(job_id, first["claim_token"])
+    assert not store.append_question(job_id, {"so_cau": 2}, first["claim_token"])
+    assert not job_queue.finish(job_id, QUEUE_STATUS_COMPLETED, claim_token=first["claim_token"])
+    assert job_queue.get_status(job_id)["status"] == QUEUE_STATUS_RUNNING
+
+    assert job_queue.heartbeat(job_id, second["claim_token"])
+    assert store.append_question(job_id, {"so_cau": 2}, second["claim_token"])
+    assert job_queue.finish(job_id, QUEUE_STATUS_COMPLETED, claim_token=second["claim_token"])
+    assert [q["so_cau"] for q in store.load_questions(job_id)] == [1, 2]
+    assert job_queue.get_status(job_id)["status"] == QUEUE_STATUS_COMPLETED
+
+
+def test_cancelled_job_stays_cancelled(job_queue):
+    job_id = job_queue.submit("1. A", b"docx")
+    claimed = job_queue.claim("worker-1")
+    assert job_queue.cancel(job_id)
+
+    assert not job_queue.heartbeat(job_id, claimed["claim_token"])
+    assert not job_queue.report_progress(job_id, 1, 2, "Câu 1", claimed["claim_token"])
+    assert not job_queue.finish(job_id, QUEUE_STATUS_COMPLETED, claim_token=claimed["claim_token"])
+    assert job_queue.get_status(job_id)["status"] == QUEUE_STATUS_CANCELLED
+
+
+def test_claim_fence_blocks_reclaim_until_append_is_done(job_queue):
+    job_id = job_queue.submit("1. A", b"docx")
+    claimed = job_queue.claim("worker-1")
+    assert "claim_token" not in job_queue.job_store.get_job(job_id)
+
+    with job_queue._claim_fence(job_id, claimed["claim_token"]) as valid:
+        assert valid
+        other = sqlite3.connect(str(job_queue.db_path), timeout=0.1, isolation_level=None)
+        with pytest.raises(sqlite3.OperationalError):
+            other.execute("BEGIN IMMEDIATE")
+        other.close()
+
+    with job_queue._claim_fence(job_id, "stale-token") as valid:
+        assert not valid
+
+
+def test_claim_token_requires_fence(tmp_path):
+    from backend.quiz_jobs import QuizJobStore
+
+    store = QuizJobStore(str(tmp_path / "jobs"), max_age_days=0)
+    job_id = store.create_job("1. A", b"docx", "text")
+    with pytest.raises(ValueError):
+        store.append_question(job_id, {"so_cau": 1}, "token")
+
+
+def test_results_round_trip_with_int_keys(job_queue):
+    job_id = job_queue.submit("1. A", b"docx")
+    job_queue.save_results(job_id, {"parsed_answers": {1: "A"}, "success": True})
+    assert job_queue.load_results(job_id)["parsed_answers"] == {1: "A"}
+
+
+def test_existing_database_gains_claim_token_column(tmp_path):
+    db_path = tmp_path / "queue.db"
+    conn = sqlite3.connect(str(db_path))
+    conn.execute("""
+        CREATE TABLE queue (
+            job_id TEXT PRIMARY KEY, status TEXT NOT NULL, config TEXT NOT NULL DEFAULT '{}',
+            options TEXT NOT NULL DEFAULT '{}', submitted_at REAL NOT NULL, started_at REAL,
+            finished_at REAL, heartbeat_at REAL, worker TEXT, attempts INTEGER NOT NULL DEFAULT 0,
+            completed INTEGER NOT NULL DEFAULT 0, total INTEGER NOT NULL DEFAULT 0,
+            message TEXT NOT NULL DEFAULT '', error TEXT NOT NULL DEFAULT ''
+        )
+    """)
+    conn.commit()
+    conn.close()
+
+    job_queue = QuizJobQueue(str(db_path), str(tmp_path / "jobs"))
+    job_id = job_queue.submit("1. A", b"docx")
+    assert job_queue.claim("worker-1")["claim_token"]
+    assert job_queue.get_status(job_id)["claim_token"]
+
+
+def test_process_quiz_job_stops_after_losing_claim(job_queue, make_agent):
+    from benchmarks.synthetic_docx import generate_synthetic_quiz
+
+    quiz = generate_synthetic_quiz(12, table_every=0, image_every=0)
+    job_id = job_queue.submit(quiz.answer_text, quiz.docx_bytes)
+    stale = job_queue.claim("worker-1")
+    _expire_heartbeat(job_queue, job_id)
+    job_queue.claim("worker-2")
+
+    quiz_agent = make_agent(job_store=job_queue.job_store)
+    quiz_agent.response_cache = None
+    results = quiz_agent.process_quiz_job(job_id=job_id, claim_token=stale["claim_token"])
+
+    assert results["claim_lost"]
+    assert job_queue.job_store.load_questions(job_id) == []
+    assert job_queue.job_store.get_job(job_id)["status"] == "running"
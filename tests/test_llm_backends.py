@@ -0,0 +1,68 @@
+"""LLMBackend interface and FakeLLMBackend fault injection (benchmarks depend on it)."""
+
+import json
+import re
+
+import pytest
+
+from backend.llm_backends import FakeLLMBackend, LLMBackend
+
+PARSE = {"task": "parse_text_answers"}
+PROMPT = "VĂN BẢN PHÂN TÍCH:\n1. A\n2. C\nVÍ DỤ CHUẨN:"
+
+
+def test_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        LLMBackend("base")
+
+
+def test_clean_response_is_task_json():
+    backend = FakeLLMBackend()
+
+    assert json.loads(backend.generate(PROMPT, PARSE)) == {"1": "A", "2": "C"}
+    assert backend.get_stats()["task:parse_text_answers"] == 1
+
+
+def test_injects_429_with_retry_delay():
+    backend = FakeLLMBackend(rate_limit_rate=1.0, retry_delay=7)
+
+    with pytest.raises(Exception) as error:
+        backend.generate(PROMPT, PARSE)
+
+    assert str(error.value).startswith("429")
+    assert re.search(r"retry_delay \{ seconds: 7 \}", str(error.value))
+    assert backend.get_stats()["injected_429"] == 1
+
+
+def test_injects_503():
+    backend = FakeLLMBackend(server_error_rate=1.0)
+
+    with pytest.raises(Exception, match="^503"):
+        backend.generate(PROMPT, PARSE)
+    assert backend.get_stats()["injected_503"] == 1
+
+
+def test_injects_truncated_json(agent):
+    backend = FakeLLMBackend(malformed_rate=1.0)
+
+    response = backend.generate(PROMPT, PARSE)
+
+    assert not agent._is_complete_json(response)
+    assert backend.get_stats()["injected_malformed"] == 1
+
+
+def test_injection_is_deterministic_and_retries_can_succeed():
+    outcomes = []
+    for _ in range(2):
+        backend = FakeLLMBackend(rate_limit_rate=0.5, seed=3)
+        run = []
+        for _ in range(12):
+            try:
+                backend.generate(PROMPT, PARSE)
+                run.append("ok")
+            except Exception:
+                run.append("429")
+        outcomes.append(run)
+
+    assert outcomes[0] == outcomes[1]
+    assert {"ok", "429"} <= set(outcomes[0])
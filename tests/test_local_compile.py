@@ -0,0 +1,47 @@
+"""Local (LLM-free) compile of well-formed question blocks."""
+
+from backend.simple_agent import UNCLASSIFIED_LABEL
+
+BLOCK = "Câu 1. Thủ đô của Việt Nam là thành phố nào?\nA. Hà Nội\nB. Huế\nC. Đà Nẵng\nD. Sài Gòn"
+
+
+def test_local_compile_is_opt_in(agent):
+    assert agent.config["local_compile"] is False
+
+
+def test_well_formed_block_compiles_without_classification(agent):
+    compiled, confidence = agent._compile_question_locally(1, BLOCK, "A")
+
+    assert confidence >= agent.config["local_compile_threshold"]
+    assert compiled["lua_chon"]["A"] == "Hà Nội"
+    assert compiled["dap_an"] == "A"
+    assert compiled["compiled_by"] == "local"
+    assert compiled["do_kho"] == UNCLASSIFIED_LABEL
+    assert compiled["mon_hoc"] == UNCLASSIFIED_LABEL
+
+
+def test_incomplete_block_stays_below_threshold(agent):
+    _, confidence = agent._compile_question_locally(2, "Câu 2. Chọn đáp án đúng\nA. 1\nB. 2", "A")
+
+    assert confidence < agent.config["local_compile_threshold"]
+
+
+def test_images_are_built_once_per_question(agent, monkeypatch):
+    from collections import Counter
+
+    from benchmarks.synthetic_docx import generate_synthetic_quiz
+
+    quiz = generate_synthetic_quiz(8, table_every=0, image_every=0)
+    calls = Counter()
+    build_images = agent._question_images
+    monkeypatch.setattr(agent, "_question_images",
+                        lambda num, text: calls.update([num]) or build_images(num, text))
+    agent.config["local_compile"] = True
+    # Nothing passes the threshold, so every question also goes through the LLM path
+    agent.config["local_compile_threshold"] = 1.01
+
+    results = agent.process_complete_quiz_enhanced(quiz.answer_text, quiz.docx_bytes)
+
+    assert results["debug_info"]["local_compiled"] == 0
+    assert len(results["compiled_questions"]) == 8
+    assert set(calls.values()) == {1}
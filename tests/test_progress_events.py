@@ -0,0 +1,79 @@
+"""Progress events from the pipeline, cancellation and the generator API."""
+
+from backend.llm_backends import FakeLLMBackend
+from benchmarks.synthetic_docx import generate_synthetic_quiz
+
+
+def _agent(make_agent, **backend_kwargs):
+    quiz_agent = make_agent(backend=FakeLLMBackend(**backend_kwargs))
+    quiz_agent.response_cache = None
+    return quiz_agent
+
+
+def test_events_cover_every_stage_and_question(make_agent):
+    quiz = generate_synthetic_quiz(8, table_every=0, image_every=0)
+    events = []
+
+    results = _agent(make_agent).process_complete_quiz_enhanced(
+        quiz.answer_text, quiz.docx_bytes, progress_callback=events.append
+    )
+
+    names = [event["event"] for event in events]
+    assert [event["stage"] for event in events if event["event"] == "stage"] == [1, 2, 3, 4]
+    assert names.index("answers_parsed") < names.index("blocks_extracted") < names.index("question_compiled")
+    compiled = [event for event in events if event["event"] == "question_compiled"]
+    assert sorted(event["so_cau"] for event in compiled) == list(range(1, 9))
+    assert [event["completed"] for event in compiled] == list(range(1, 9))
+    assert names[-1] == "completed" and events[-1]["results"] is results
+
+
+def test_callback_errors_do_not_break_the_run(make_agent):
+    quiz = generate_synthetic_quiz(4, table_every=0, image_every=0)
+
+    def callback(event):
+        raise RuntimeError("UI went away")
+
+    results = _agent(make_agent).process_complete_quiz_enhanced(
+        quiz.answer_text, quiz.docx_bytes, progress_callback=callback
+    )
+
+    assert results["success"] and len(results["compiled_questions"]) == 4
+
+
+def test_cancel_keeps_finished_questions(make_agent):
+    quiz = generate_synthetic_quiz(12, table_every=0, image_every=0)
+    quiz_agent = _agent(make_agent)
+    events = []
+
+    def callback(event):
+        events.append(event)
+        if event["event"] == "question_compiled" and event["completed"] == 3:
+            quiz_agent.cancel()
+
+    results = quiz_agent.process_complete_quiz_enhanced(quiz.answer_text, quiz.docx_bytes, progress_callback=callback)
+
+    assert results["cancelled"]
+    assert [q["so_cau"] for q in results["compiled_questions"]] == [1, 2, 3]
+    assert events[-1]["event"] == "cancelled"
+
+
+def test_generator_yields_until_completed(make_agent):
+    quiz = generate_synthetic_quiz(5, table_every=0, image_every=0)
+
+    events = list(_agent(make_agent).iter_quiz_processing_events(quiz.answer_text, quiz.docx_bytes))
+
+    assert events[-1]["event"] == "completed"
+    assert len(events[-1]["results"]["compiled_questions"]) == 5
+
+
+def test_closing_the_generator_cancels_the_run(make_agent):
+    quiz = generate_synthetic_quiz(20, table_every=0, image_every=0)
+    quiz_agent = _agent(make_agent, latency=0.02)
+
+    events = quiz_agent.iter_quiz_processing_events(quiz.answer_text, quiz.docx_bytes)
+    for event in events:
+        if event["event"] == "question_compiled":
+            break
+    events.close()
+
+    assert quiz_agent._cancel_event.is_set()
@@ -0,0 +1,92 @@
+"""Single-pass question block scanner vs. the former per-pattern re.split."""
+
+import random
+import re
+
+import pytest
+
+OLD_PATTERNS = [
+    r'Câu\s*(\d+)\s*[\.:]',
+    r'Question\s*(\d+)\s*[\.:]',
+    r'^(\d+)\s*[\.:]',
+    r'\n(\d+)\s*[\.:]',
+    r'Bài\s*(\d+)\s*[\.:]',
+    r'(\d+)\s*\)',
+    r'Problem\s*(\d+)',
+]
+
+
+def _old_truncate(text):
+    if len(text) <= 1500:
+        return text
+    cut_points = []
+    d_matches = list(re.finditer(r'D[\.:\)][^\n]*', text))
+    if d_matches:
+        cut_points.append(d_matches[-1].end())
+    cut_points.extend(m.start() for m in re.finditer(r'[\.!?]\s*(?:\n|$)', text[:1500]))
+    if cut_points:
+        return text[:max([cp for cp in cut_points if cp <= 1500])].strip()
+    return text[:1500] + "..."
+
+
+def _old_extract(text):
+    """The pre-scanner implementation, kept verbatim as the reference."""
+    best_result = {}
+    for pattern in OLD_PATTERNS:
+        parts = re.split(pattern, text, flags=re.IGNORECASE | re.MULTILINE)
+        if len(parts) > 2:
+            temp_blocks = {}
+            for i in range(1, len(parts), 2):
+                try:
+                    q_num = int(parts[i].strip())
+                    if i + 1 < len(parts):
+                        q_text = parts[i + 1].strip()
+                        if 30 <= len(q_text) <= 3000 and len(re.findall(r'[A-D][\.:\)]\s*', q_text)) >= 2:
+                            temp_blocks[q_num] = _old_truncate(q_text)
+                except ValueError:
+                    continue
+            if temp_blocks and len(temp_blocks) > len(best_result):
+                best_result = temp_blocks
+                if len(best_result) >= 20:
+                    break
+    return best_result
+
+
+def _random_quiz_text(rng):
+    headers = ["Câu {n}.", "Câu {n}:", "Question {n}.", "{n}.", "Bài {n}:", "{n})", "Problem {n}"]
+    lines = ["ĐỀ KIỂM TRA"]
+    for num in range(1, rng.randint(2, 25)):
+        header = rng.choice(headers).format(n=num)
+        stem_words = rng.randint(3, 400 if rng.random() < 0.15 else 30)
+        stem = " ".join(rng.choice(["hàm", "số", "giá", "trị", "bao", "nhiêu"]) for _ in range(stem_words))
+        if rng.random() < 0.5:
+            stem += rng.choice(["?", ".", ""])
+        lines.append(f"{header} {stem}")
+        for letter in "ABCD"[:rng.randint(0, 4)]:
+            filler = " dài" * (rng.randint(0, 120) if rng.random() < 0.1 else rng.randint(0, 3))
+            lines.append(f"{letter}{rng.choice('.:)')} đáp án {letter}{filler}")
+    return "\n".join(lines)
+
+
+def test_scanner_matches_former_implementation(agent):
+    rng = random.Random(13)
+    long_blocks = 0
+    for _ in range(400):
+        text = _random_quiz_text(rng)
+        expected = _old_extract(text)
+        assert agent._extract_vietnamese_question_blocks(text) == expected
+        long_blocks += any(len(block) > 1000 for block in expected.values())
+    assert long_blocks  # the corpus exercises truncation
+
+
+def test_block_with_every_cut_point_past_1500_is_dropped(agent):
+    # No sentence end before 1500 chars, the last "D." line ends after it
+    long_stem = "chữ " * 500
+    text = (
+        f"Câu 1. {long_stem}\nA. một\nB. hai\nC. ba\nD. bốn\n"
+        "Câu 2. Câu hỏi ngắn thứ hai có đủ độ dài?\nA. một\nB. hai\nC. ba\nD. bốn\n"
+    )
+    blocks = agent._extract_vietnamese_question_blocks(text)
+    assert 1 not in blocks and 2 in blocks
+    assert blocks == _old_extract(text)
+    assert agent._smart_truncate_question("x" * 1600 + "\nD. cuối") is None
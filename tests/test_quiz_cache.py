@@ -0,0 +1,58 @@
+"""SharedQuizCache: parsed quizzes are shared read-only between engines and sessions."""
+
+import pytest
+
+from backend.quiz_test_engine import QuizTestEngine
+
+
+def _questions(count=3):
+    return [{
+        "so_cau": num,
+        "cau_hoi": f"Câu hỏi {num}?",
+        "lua_chon": {"A": f"{num}a", "B": f"{num}b", "C": f"{num}c", "D": f"{num}d"},
+        "dap_an": "A",
+    } for num in range(1, count + 1)]
+
+
+@pytest.fixture
+def engine(workdir):
+    quiz_engine = QuizTestEngine()
+    quiz_engine.save_quiz_to_storage(_questions(), "Đề 1")
+    quiz_engine._load_saved_quizzes()
+    return quiz_engine
+
+
+def test_hits_share_the_parsed_questions(engine, monkeypatch):
+    first = engine.load_quiz_from_storage("Đề 1")
+    monkeypatch.setattr(engine.quiz_store, "load_questions", lambda name: pytest.fail("cache miss"))
+
+    other = QuizTestEngine()
+    second = other.load_quiz_from_storage("Đề 1")
+
+    assert second is not first
+    assert all(a is b for a, b in zip(first, second))
+
+
+def test_new_version_invalidates(engine, monkeypatch):
+    first = engine.load_quiz_from_storage("Đề 1")
+    monkeypatch.setattr(engine.quiz_store, "get_quiz_version", lambda name: "changed")
+
+    reloaded = engine.load_quiz_from_storage("Đề 1")
+
+    assert reloaded[0] is not first[0]
+    assert reloaded[0].cau_hoi == first[0].cau_hoi
+
+
+def test_sessions_do_not_alias_cached_questions(engine):
+    cached = engine.load_quiz_from_storage("Đề 1")
+    originals = [dict(q.lua_chon) for q in cached]
+
+    sessions = [
+        engine.active_sessions[engine.create_test_session("An", "Đề 1", engine.load_quiz_from_storage("Đề 1"))]
+        for _ in range(2)
+    ]
+
+    assert [q.lua_chon for q in cached] == originals
+    assert not any(q is c for session in sessions for q in session.questions for c in cached)
+    assert sessions[0].questions[0] is not sessions[1].questions[0]
+    assert engine.load_quiz_from_storage("Đề 1")[0] is cached[0]
@@ -0,0 +1,125 @@
+"""QuizJobStore: inputs, checkpoints, resumability, listing and cleanup."""
+
+import io
+import os
+import time
+
+import pytest
+
+from backend.quiz_jobs import (
+    JOB_STATUS_COMPLETED,
+    JOB_STATUS_FAILED,
+    JOB_STATUS_RUNNING,
+    JobHeartbeat,
+    QuizJobStore,
+)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return QuizJobStore(str(tmp_path / "jobs"), max_age_days=0)
+
+
+@pytest.mark.parametrize("kind", ["path", "bytes", "memoryview", "upload"])
+def test_create_job_accepts_any_docx_input(store, tmp_path, kind):
+    payload = b"PK\x03\x04 fake docx"
+    docx_path = tmp_path / "de_thi.docx"
+    docx_path.write_bytes(payload)
+    upload = io.BytesIO(payload)
+    upload.name = "upload.docx"
+    docx_file = {"path": docx_path, "bytes": payload, "memoryview": memoryview(payload), "upload": upload}[kind]
+
+    job_id = store.create_job("1. A", docx_file)
+
+    answer_data, source_path, answer_type = store.load_inputs(job_id)
+    assert (answer_data, answer_type) == ("1. A", "text")
+    assert source_path.read_bytes() == payload
+    expected_name = {"path": "de_thi.docx", "upload": "upload.docx"}.get(kind, "")
+    assert store.get_job(job_id)["source_name"] == expected_name
+
+
+def test_checkpoints_survive_torn_last_line(store):
+    job_id = store.create_job("1. A", b"docx")
+    store.append_question(job_id, {"so_cau": 1})
+    with open(store.jobs_dir / job_id / "questions.jsonl", "a", encoding="utf-8") as f:
+        f.write('{"so_cau": 2, "cau_h')
+    store.append_question(job_id, {"so_cau": 3})
+
+    assert [q["so_cau"] for q in store.load_questions(job_id)] == [1, 3]
+
+
+def test_running_job_is_resumable_only_when_heartbeat_is_stale(store):
+    job_id = store.create_job("1. A", b"docx")
+    store.update_job(job_id, status=JOB_STATUS_RUNNING, heartbeat_at=time.time())
+    assert not store.is_resumable(store.get_job(job_id))
+    assert store.list_resumable_jobs() == []
+
+    store.update_job(job_id, heartbeat_at=time.time() - 600)
+    assert store.is_resumable(store.get_job(job_id))
+    assert [job["job_id"] for job in store.list_resumable_jobs()] == [job_id]
+
+
+def test_heartbeat_thread_refreshes_meta(store):
+    job_id = store.create_job("1. A", b"docx")
+    with JobHeartbeat(lambda: store.heartbeat(job_id), interval=0.01):
+        time.sleep(0.1)
+    assert time.time() - store.get_job(job_id)["heartbeat_at"] < 1
+
+
+def test_list_jobs_is_capped_to_most_recent(store):
+    job_ids = [store.create_job("1. A", b"docx", job_id=f"job_{i}") for i in range(5)]
+    for offset, job_id in enumerate(job_ids):
+        meta_file = store.jobs_dir / job_id / "meta.json"
+        os.utime(meta_file, (time.time() - 100 + offset, time.time() - 100 + offset))
+    store.update_job("job_1", status=JOB_STATUS_FAILED)
+
+    assert {job["job_id"] for job in store.list_jobs(limit=2)} == {"job_1", "job_4"}
+    assert [job["job_id"] for job in store.list_jobs((JOB_STATUS_FAILED,), limit=2)] == ["job_1"]
+
+
+def test_release_inputs_and_prune(store):
+    job_id = store.create_job("1. A", b"docx")
+    store.update_job(job_id, status=JOB_STATUS_COMPLETED)
+    store.release_inputs(job_id)
+
+    assert not (store.jobs_dir / job_id / "source.docx").exists()
+    with pytest.raises(FileNotFoundError):
+        store.load_inputs(job_id)
+
+    old_meta = store.jobs_dir / job_id / "meta.json"
+    os.utime(old_meta, (time.time() - 10 * 86400, time.time() - 10 * 86400))
+    fresh_id = store.create_job("1. A", b"docx")
+
+    assert store.prune_jobs(7 * 86400) == 1
+    assert store.get_job(job_id) is None
+    assert store.get_job(fresh_id) is not None
+
+
+def test_store_construction_does_not_prune(store):
+    job_id = store.create_job("1. A", b"docx")
+    old_meta = store.jobs_dir / job_id / "meta.json"
+    os.utime(old_meta, (time.time() - 10 * 86400, time.time() - 10 * 86400))
+
+    reopened = QuizJobStore(str(store.jobs_dir), max_age_days=7)
+    assert reopened.get_job(job_id) is not None
+    assert reopened.prune_expired() == 1
+    assert reopened.get_job(job_id) is None
+
+
+def test_process_quiz_job_from_path_releases_inputs(make_agent, store, tmp_path):
+    from benchmarks.synthetic_docx import generate_synthetic_quiz
+
+    quiz = generate_synthetic_quiz(12, table_every=0, image_every=0)
+    docx_path = tmp_path / "de.docx"
+    docx_path.write_bytes(quiz.docx_bytes)
+    quiz_agent = make_agent()
+    quiz_agent.response_cache = None
+
+    results = quiz_agent.process_quiz_job(quiz.answer_text, docx_path, job_store=store)
+
+    assert results["success"]
+    meta = store.get_job(results["job_id"])
+    assert meta["status"] == JOB_STATUS_COMPLETED and meta["source_name"] == "de.docx"
+    assert meta["inputs_released"]
+    assert not (store.jobs_dir / results["job_id"] / "source.docx").exists()
+    assert len(store.load_questions(results["job_id"])) == 12
@@ -0,0 +1,88 @@
+"""QuizStore persistence and the one-shot legacy JSON migration."""
+
+import json
+
+import pytest
+
+from backend.quiz_store import QuizStore, migrate_legacy_storage
+
+
+def _question(num, images=None, **fields):
+    question = {
+        "so_cau": num,
+        "cau_hoi": f"Câu hỏi {num}?",
+        "lua_chon": {"A": "1", "B": "2", "C": "3", "D": "4"},
+        "dap_an": "A",
+        **fields
+    }
+    if images:
+        question["images"] = images
+    return question
+
+
+@pytest.fixture
+def store(tmp_path):
+    return QuizStore(str(tmp_path / "quizzes.db"))
+
+
+def test_save_and_load_round_trip(store):
+    questions = [
+        _question(1, do_kho="de", mon_hoc="Toán", custom="giữ lại"),
+        _question(2, images=[{"name": "h.png", "path": "images/h.png", "type": "image/png", "rel_id": "rId5"}]),
+    ]
+    store.save_quiz("Đề 1", questions, version="2.0")
+
+    assert store.load_questions("Đề 1") == questions
+    assert store.get_question("Đề 1", 0)["custom"] == "giữ lại"
+    assert [q["so_cau"] for q in store.find_questions(mon_hoc="Toán")] == [1]
+
+    info = store.get_quiz_info("Đề 1")
+    assert info["questions_count"] == 2 and info["version"] == "2.0"
+
+
+def test_images_without_path_count(store):
+    embedded = {"name": "image1.png", "type": "image/png", "source": "docx", "data": "aGVsbG8="}
+    store.save_quiz("Đề DOCX", [_question(1, images=[embedded])])
+
+    info = store.get_quiz_info("Đề DOCX")
+    assert info["images_count"] == 1
+    assert info["has_images"]
+
+
+def _write_legacy_layout(storage_dir, quizzes):
+    index = {}
+    for name, questions in quizzes.items():
+        quiz_file = storage_dir / f"{name}.json"
+        quiz_file.write_text(json.dumps(questions, ensure_ascii=False), encoding="utf-8")
+        index[name] = {
+            "file_path": f"quiz_storage\\{name}.json",  # Windows-style path from the old engine
+            "created_time": "2024-01-01T00:00:00",
+            "version": "1.0",
+        }
+    (storage_dir / "index.json").write_text(json.dumps(index, ensure_ascii=False), encoding="utf-8")
+
+
+def test_migration_runs_once_and_leaves_legacy_files(tmp_path, store):
+    _write_legacy_layout(tmp_path, {"de_a": [_question(1), _question(2)], "de_b": [_question(1)]})
+
+    index_bytes = (tmp_path / "index.json").read_bytes()
+    assert migrate_legacy_storage(str(tmp_path), store) == 2
+    assert (tmp_path / "index.json").read_bytes() == index_bytes
+    assert store.get_meta("legacy_json_migrated")
+    assert store.get_quiz_info("de_a")["questions_count"] == 2
+    assert store.get_quiz_info("de_a")["created_time"].year == 2024
+
+    assert migrate_legacy_storage(str(tmp_path), store) == 0
+
+    store.delete_quiz("de_b")
+    assert migrate_legacy_storage(str(tmp_path), store, force=True) == 2
+    assert set(store.list_quizzes()) == {"de_a", "de_b"}
+    assert (tmp_path / "index.json").read_bytes() == index_bytes
+
+
+def test_migration_skips_missing_files(tmp_path, store):
+    _write_legacy_layout(tmp_path, {"de_a": [_question(1)]})
+    (tmp_path / "de_a.json").unlink()
+
+    assert migrate_legacy_storage(str(tmp_path), store) == 0
+    assert store.list_quizzes() == {}
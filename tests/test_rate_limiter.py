@@ -0,0 +1,103 @@
+"""Token-bucket limiter: pacing, server blocks and the shared SQLite bucket."""
+
+import pytest
+
+from backend import rate_limiter as rate_limiter_module
+from backend.rate_limiter import RateLimiter, SQLiteTokenBucketRateLimiter, TokenBucketRateLimiter
+
+
+class FakeClock:
+    """time.time/time.sleep thay thế: sleep chỉ tua đồng hồ."""
+
+    def __init__(self, start=1000.0):
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(rate_limiter_module, "time", fake)
+    return fake
+
+
+def _start_times(limiter, clock, count):
+    starts = []
+    for _ in range(count):
+        limiter.acquire()
+        starts.append(round(clock.now - 1000.0, 6))
+    return starts
+
+
+def test_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        RateLimiter()
+
+
+def test_burst_then_steady_rate(clock):
+    limiter = TokenBucketRateLimiter(requests_per_minute=60, burst=3)
+    assert _start_times(limiter, clock, 5) == [0, 0, 0, 1, 2]
+
+
+def test_waiters_are_serialised_after_a_block(clock):
+    limiter = TokenBucketRateLimiter(requests_per_minute=60, burst=3)
+    limiter.block_for(10)
+
+    assert limiter.estimated_wait() == pytest.approx(10)
+    assert _start_times(limiter, clock, 3) == [10, 11, 12]
+
+
+def test_deficits_queue_behind_the_block(clock):
+    limiter = TokenBucketRateLimiter(requests_per_minute=60, burst=1)
+    limiter.acquire()
+    with limiter._lock:
+        limiter._state, wait = limiter._reserve(limiter._state, clock.now, 0)
+    assert wait == pytest.approx(1)
+
+    limiter.block_for(5)
+    # The outstanding reservation owns the first slot after the block
+    assert limiter.estimated_wait() == pytest.approx(7)
+
+
+def test_sleepers_honour_a_block_set_while_sleeping(clock, monkeypatch):
+    limiter = TokenBucketRateLimiter(requests_per_minute=60, burst=1)
+    limiter.acquire()
+    real_sleep = clock.sleep
+
+    def sleep_and_block(seconds):
+        monkeypatch.setattr(clock, "sleep", real_sleep)
+        limiter.block_for(30)
+        real_sleep(seconds)
+
+    monkeypatch.setattr(clock, "sleep", sleep_and_block)
+    limiter.acquire()
+    assert clock.now - 1000.0 == pytest.approx(30)
+
+
+def test_sqlite_bucket_is_shared_between_instances(tmp_path, clock):
+    db_path = str(tmp_path / "limits.db")
+    first = SQLiteTokenBucketRateLimiter(db_path, "key", requests_per_minute=60, burst=2)
+    second = SQLiteTokenBucketRateLimiter(db_path, "key", requests_per_minute=60, burst=2)
+    other_key = SQLiteTokenBucketRateLimiter(db_path, "other", requests_per_minute=60, burst=2)
+
+    assert first.acquire() == 0
+    assert second.acquire() == 0
+    assert first.estimated_wait() == pytest.approx(1)
+    assert other_key.estimated_wait() == 0
+
+    # The bucket was empty and does not refill during the block
+    second.block_for(20)
+    assert first.estimated_wait() == pytest.approx(21)
+    assert _start_times(first, clock, 2) == [21, 22]
+
+
+def test_shared_limiter_is_reused(tmp_path):
+    kwargs = dict(requests_per_minute=42, db_path=str(tmp_path / "limits.db"))
+    limiter = rate_limiter_module.get_shared_rate_limiter("shared-test", **kwargs)
+    assert rate_limiter_module.get_shared_rate_limiter("shared-test", **kwargs) is limiter
+    assert isinstance(limiter, SQLiteTokenBucketRateLimiter)
@@ -0,0 +1,80 @@
+"""ResponseCache storage and the agent's cache-only-valid-payloads rule."""
+
+import time
+
+from backend.llm_backends import LLMBackend
+from backend.response_cache import ResponseCache
+
+
+class ScriptedBackend(LLMBackend):
+    """Trả lần lượt các response cho sẵn."""
+
+    def __init__(self, responses):
+        super().__init__("scripted")
+        self.responses = list(responses)
+        self.calls = 0
+
+    def generate(self, content, metadata=None):
+        self.calls += 1
+        return self.responses.pop(0)
+
+
+def test_key_depends_on_model_and_content():
+    key = ResponseCache.make_key("m", ["prompt", b"\x00\x01"])
+    assert key == ResponseCache.make_key("m", ["prompt", b"\x00\x01"])
+    assert key != ResponseCache.make_key("other", ["prompt", b"\x00\x01"])
+    assert key != ResponseCache.make_key("m", ["prompt", b"\x00\x02"])
+
+
+def test_get_set_delete_and_ttl(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.db"), ttl_seconds=60)
+    cache.set("k", "value")
+    assert cache.get("k") == "value"
+
+    cache.delete("k")
+    assert cache.get("k") is None
+
+    expired = ResponseCache(str(tmp_path / "cache.db"), ttl_seconds=0)
+    expired.set("old", "value")
+    time.sleep(0.01)
+    assert expired.get("old") is None
+
+
+def test_lru_eviction_respects_max_bytes(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.db"), max_bytes=250)
+    for index in range(5):
+        cache.set(f"k{index}", "x" * 100)
+        time.sleep(0.01)
+    assert cache.get("k4") == "x" * 100
+    assert cache.get("k0") is None
+
+
+def test_malformed_response_is_not_cached(workdir, make_agent):
+    cache = ResponseCache(str(workdir / "cache.db"))
+    backend = ScriptedBackend(['Đây là kết quả: {"1": "A", "2"', '{"1": "A", "2": "B"}'])
+    quiz_agent = make_agent(backend, response_cache=cache)
+
+    prompt = "parse answers"
+    first = quiz_agent._make_api_request_with_enhanced_recovery(prompt, parse=quiz_agent._parse_json_response)
+    assert first["1"] == "A"  # salvaged, still returned to the caller
+    assert cache.get(ResponseCache.make_key("scripted", prompt)) is None
+
+    second = quiz_agent._make_api_request_with_enhanced_recovery(prompt, parse=quiz_agent._parse_json_response)
+    third = quiz_agent._make_api_request_with_enhanced_recovery(prompt, parse=quiz_agent._parse_json_response)
+    assert second == third == {"1": "A", "2": "B"}
+    assert backend.calls == 2
+
+
+def test_invalid_cached_entry_is_dropped(workdir, make_agent):
+    cache = ResponseCache(str(workdir / "cache.db"))
+    key = ResponseCache.make_key("scripted", "compile")
+    cache.set(key, '{"so_cau": 1')
+    backend = ScriptedBackend(['{"cau_hoi": "Q", "lua_chon": {"A": "1"}}'])
+    quiz_agent = make_agent(backend, response_cache=cache)
+
+    compiled = quiz_agent._make_api_request_with_enhanced_recovery(
+        "compile", parse=quiz_agent._parse_compiled_question
+    )
+    assert compiled["cau_hoi"] == "Q"
+    assert backend.calls == 1
+    assert cache.get(key) == '{"cau_hoi": "Q", "lua_chon": {"A": "1"}}'
@@ -0,0 +1,93 @@
+"""Quota recovery: server retry_delay, shared back-off, deadline and retry caps (no recursion)."""
+
+import pytest
+
+from backend import simple_agent as simple_agent_module
+from backend.llm_backends import FakeLLMBackend
+from backend.rate_limiter import RateLimiter
+
+PARSE = {"task": "parse_text_answers"}
+PROMPT = "VĂN BẢN PHÂN TÍCH:\n1. A\nVÍ DỤ CHUẨN:"
+QUOTA_429 = "429 Resource has been exhausted. [retry_delay { seconds: 7 }]"
+
+
+class ScriptedErrorBackend(FakeLLMBackend):
+    """Raises the scripted errors in order, then answers like FakeLLMBackend."""
+
+    def __init__(self, errors):
+        super().__init__()
+        self.errors = list(errors)
+
+    def generate(self, content, metadata=None):
+        if self.errors:
+            raise Exception(self.errors.pop(0))
+        return super().generate(content, metadata)
+
+
+class RecordingLimiter(RateLimiter):
+    def __init__(self):
+        self.blocks = []
+
+    def acquire(self, tokens=0):
+        return 0.0
+
+    def block_for(self, seconds):
+        self.blocks.append(seconds)
+
+    def estimated_wait(self, tokens=0):
+        return 0.0
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    calls = []
+    monkeypatch.setattr(simple_agent_module.time, "sleep", calls.append)
+    return calls
+
+
+def _request(make_agent, errors, **config):
+    limiter = RecordingLimiter()
+    quiz_agent = make_agent(backend=ScriptedErrorBackend(errors), rate_limiter=limiter)
+    quiz_agent.response_cache = None
+    quiz_agent.config.update(config)
+    call = lambda: quiz_agent._make_api_request_with_enhanced_recovery(
+        PROMPT, metadata=PARSE, parse=quiz_agent._parse_json_response
+    )
+    return quiz_agent, limiter, call
+
+
+@pytest.mark.parametrize("error, seconds", [
+    ("retry_delay { seconds: 7 nanos: 500000000 }", 7.5),
+    ('{"retryDelay": "12s"}', 12.0),
+    ("Please retry in 3.25s.", 3.25),
+    ("429 quota exceeded", None),
+])
+def test_parse_retry_delay(agent, error, seconds):
+    assert agent._parse_retry_delay(error) == seconds
+
+
+def test_server_retry_delay_is_waited_and_shared(make_agent, sleeps):
+    quiz_agent, limiter, call = _request(make_agent, [QUOTA_429])
+
+    assert call() == {"1": "A"}
+    assert len(sleeps) == 1 and 7.2 <= sleeps[0] <= 8.0
+    assert limiter.blocks == sleeps
+    assert quiz_agent.processing_stats["quota_events"] == 1
+
+
+def test_deadline_stops_before_a_wait_that_cannot_fit(make_agent, sleeps):
+    _, limiter, call = _request(make_agent, [QUOTA_429.replace("7", "60")], retry_deadline=30)
+
+    with pytest.raises(Exception, match="QUOTA_EXCEEDED_AFTER_RETRIES"):
+        call()
+    assert sleeps == [] and limiter.blocks == []
+
+
+def test_retries_are_capped_without_recursion(make_agent, sleeps):
+    _, limiter, call = _request(make_agent, ["503 unavailable"] * 10, max_retries=3, retry_base_delay=1)
+
+    with pytest.raises(Exception, match="Max retries exceeded"):
+        call()
+    assert len(sleeps) == 3
+    # Plain server errors back off locally; only quota errors block the shared limiter
+    assert limiter.blocks == []
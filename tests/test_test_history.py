@@ -0,0 +1,127 @@
+"""TestHistoryStore (segments + summary index) and the lazy TestHistoryView."""
+
+import json
+
+import pytest
+
+from backend.test_history import TestHistoryStore as HistoryStore  # alias: not a pytest class
+
+
+def _record(num, score=8.0, mode="exam"):
+    return {
+        "session_id": f"s{num}",
+        "student_name": "An",
+        "test_title": "Đề 1",
+        "total_questions": 10,
+        "correct_answers": int(score),
+        "wrong_answers": 10 - int(score),
+        "unanswered": 0,
+        "score": score,
+        "percentage": score * 10,
+        "time_taken": "5 phút",
+        "detailed_results": [{"question": num, "correct": True}],
+        "finish_time": f"2026-01-{num:02d}T10:00:00",
+        "test_mode": mode,
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    return HistoryStore(str(tmp_path / "history"), segment_max_bytes=512)
+
+
+def test_append_and_read_by_position(store):
+    store.append(_record(1))
+    store.append_many([_record(2), _record(3)])
+
+    assert store.count() == 3
+    assert store.summary_at(0)["session_id"] == "s1"
+    assert "detailed_results" not in store.summary_at(-1)
+    assert store.record_at(-1)["detailed_results"] == [{"question": 3, "correct": True}]
+    assert store.get_record("s2")["session_id"] == "s2"
+    assert store.get_record("missing") is None
+    with pytest.raises(IndexError):
+        store.summary_at(3)
+
+
+def test_duplicate_session_keeps_first(store):
+    store.append(_record(1, score=3.0))
+    store.append(_record(1, score=9.0))
+
+    assert store.count() == 1
+    assert store.get_record("s1")["score"] == 3.0
+    stats = store.statistics()
+    assert stats.count == 1
+    assert stats.total_score == 3.0
+    assert len(stats.recent_tests()) == 1
+
+
+def test_index_picks_up_appends_from_another_store(store):
+    store.append(_record(1))
+    other = HistoryStore(str(store.history_dir), segment_max_bytes=512)
+    other.append(_record(2))
+
+    assert store.count() == 2
+    assert store.get_record("s2")["session_id"] == "s2"
+
+
+def test_torn_tail_is_skipped_and_not_glued(store):
+    store.append(_record(1))
+    segment = store.segments()[-1]
+    with open(segment, "ab") as f:
+        f.write(b'{"session_id": "torn"')
+
+    reopened = HistoryStore(str(store.history_dir), segment_max_bytes=512)
+    reopened.append(_record(2))
+
+    assert [summary["session_id"] for summary in reopened.summaries()] == ["s1", "s2"]
+    assert reopened.get_record("s2")["session_id"] == "s2"
+
+
+def test_rebuild_after_compaction_keeps_order(tmp_path):
+    store = HistoryStore(str(tmp_path / "history"), segment_max_bytes=200, compact_min_segments=2)
+    for num in range(1, 13):
+        store.append(_record(num))
+    store.compact()
+
+    assert [summary["session_id"] for summary in store.summaries()] == [f"s{num}" for num in range(1, 13)]
+    assert store.record_at(11)["session_id"] == "s12"
+    assert store.rebuild_summaries() == 12
+
+
+def test_statistics_accumulate(store):
+    store.append_many([_record(1, score=4.0, mode="practice"), _record(2, score=8.0)])
+    stats = store.statistics()
+
+    assert stats.count == 2
+    assert stats.passed == 1
+    assert stats.mode_distribution == {"exam": 1, "practice": 1}
+    assert stats.highest_score == 8.0 and stats.lowest_score == 4.0
+
+
+def test_migrate_legacy_file(store, tmp_path):
+    legacy = tmp_path / "test_history.json"
+    legacy.write_text(json.dumps([_record(1), _record(2)]), encoding="utf-8")
+
+    assert store.migrate_legacy_file(legacy) == 2
+    assert legacy.exists()
+    assert store.count() == 2
+
+    assert store.migrate_legacy_file(legacy) == 0
+    assert store.count() == 2
+
+
+def test_history_view_indexes_without_copying(workdir, monkeypatch):
+    from backend.quiz_test_engine import QuizTestEngine
+
+    engine = QuizTestEngine()
+    engine.history_store.append_many([_record(num) for num in range(1, 6)])
+    monkeypatch.setattr(engine.history_store, "summaries", lambda: pytest.fail("full summary copy"))
+
+    view = engine.completed_tests
+    assert len(view) == 5
+    assert view[0].session_id == "s1"
+    assert view[-1].detailed_results == [{"question": 5, "correct": True}]
+    assert [result.session_id for result in view[1:4]] == ["s2", "s3", "s4"]
+    with pytest.raises(IndexError):
+        view[5]
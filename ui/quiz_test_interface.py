@@ -12,7 +12,7 @@ from pathlib import Path
 
 # Import engine
 sys.path.append(str(Path(__file__).parent.parent))
-from backend.quiz_test_engine import QuizTestEngine
+from backend.quiz_test_engine import get_shared_quiz_engine
 
 def render_quiz_test_page():
     """Render trang làm bài kiểm tra."""
@@ -26,7 +26,7 @@ def render_quiz_test_page():
     
     # Initialize engine
     if 'quiz_engine' not in st.session_state:
-        st.session_state.quiz_engine = QuizTestEngine()
+        st.session_state.quiz_engine = get_shared_quiz_engine()
     
     # Header
     st.markdown("""
@@ -412,7 +412,7 @@ def render_question_interface(session_id: str, current_q: dict):
             'de': '🟢',
             'trung_binh': '🟡', 
             'kho': '🔴'
-        }.get(do_kho, '🟡')
+        }.get(do_kho, '⚪')
         st.caption(f"{difficulty_color} Độ khó: {do_kho}")
     
     with col2:
@@ -25,11 +25,13 @@ sys.path.append(str(test_dir))
 
 try:
     from backend.simple_agent import SimpleQuizAgent
-    from backend.quiz_test_engine import QuizTestEngine
+    from backend.quiz_test_engine import QuizTestEngine, get_shared_quiz_engine
+    from backend.job_queue import QuizJobQueue, ensure_local_workers
 except ImportError:
     try:
         from backend.simple_agent import SimpleQuizAgent
-        from backend.quiz_test_engine import QuizTestEngine
+        from backend.quiz_test_engine import QuizTestEngine, get_shared_quiz_engine
+        from backend.job_queue import QuizJobQueue, ensure_local_workers
     except ImportError as e:
         st.error(f"❌ Lỗi import module: {e}")
         st.info("""
@@ -59,6 +61,13 @@ except ImportError:
         """)
         st.stop()
 
+@st.cache_resource
+def get_job_queue() -> QuizJobQueue:
+    """Queue + job store dùng chung cho mọi rerun; jobs cũ chỉ được dọn một lần khi app khởi động."""
+    job_queue = QuizJobQueue()
+    job_queue.job_store.prune_expired()
+    return job_queue
+
 def main():
     """Ứng dụng chính enhanced."""
     st.set_page_config(
@@ -94,7 +103,7 @@ def init_enhanced_session_state():
     """Khởi tạo enhanced session state."""
     # Initialize quiz engine
     if 'quiz_engine' not in st.session_state:
-        st.session_state.quiz_engine = QuizTestEngine()
+        st.session_state.quiz_engine = get_shared_quiz_engine()
     
     # Enhanced settings
     if 'app_settings' not in st.session_state:
@@ -184,6 +193,19 @@ def render_enhanced_professional_sidebar():
     with st.expander("⚙️ Cấu Hình Xử Lý", expanded=False):
         st.markdown("**Batch Processing:**")
         
+        batch_compile = st.checkbox(
+            "Gộp nhiều câu vào một request",
+            value=True,
+            help="Giảm số request Gemini (tránh lỗi quota 429)"
+        )
+        
+        local_compile = st.checkbox(
+            "Biên dịch cục bộ câu đúng chuẩn",
+            value=False,
+            help="Câu dạng 'Câu N. ... A. ... B. ... C. ... D. ...' được tách trực tiếp, chỉ câu khó mới gửi Gemini. "
+                 "Câu tách cục bộ không được phân loại độ khó/môn học (chua_phan_loai)"
+        )
+        
         batch_size = st.slider(
             "Kích thước batch:",
             min_value=5,
@@ -208,10 +230,21 @@ def render_enhanced_professional_sidebar():
             help="Thời gian đợi khi gặp quota limit"
         )
         
+        compile_workers = st.slider(
+            "Số luồng biên dịch:",
+            min_value=1,
+            max_value=8,
+            value=1,
+            help="Biên dịch nhiều câu song song (1 = tuần tự)"
+        )
+        
         st.session_state.processing_config = {
             "batch_size": batch_size,
             "batch_delay": batch_delay,
-            "quota_delay": quota_delay
+            "quota_delay": quota_delay,
+            "compile_workers": compile_workers,
+            "batch_compile": batch_compile,
+            "local_compile": local_compile
         }
         
         st.info(f"🔧 Cấu hình: {batch_size} câu/batch, đợi {batch_delay}s giữa batch")
@@ -397,14 +430,15 @@ def render_enhanced_input_section():
         
         with col1:
             st.success(f"✅ Đã upload file: {docx_file.name}")
-            st.info(f"📊 Kích thước file: {len(docx_file.getvalue())/1024:.1f} KB")
+            st.info(f"📊 Kích thước file: {docx_file.size/1024:.1f} KB")
         
         with col2:
             if st.button("🔍 Preview DOCX", use_container_width=True):
                 try:
                     # Quick preview of DOCX content
                     import docx
-                    doc = docx.Document(io.BytesIO(docx_file.getvalue()))
+                    docx_file.seek(0)
+                    doc = docx.Document(docx_file)
                     
                     preview_text = ""
                     for i, para in enumerate(doc.paragraphs[:10]):
@@ -452,6 +486,29 @@ def render_enhanced_input_section():
         else:
             st.error("❌ File DOCX")
     
+    # Unfinished checkpointed jobs
+    if has_api_key:
+        unfinished_jobs = [
+            job for job in get_job_queue().job_store.list_resumable_jobs() if not job.get("queued")
+        ]
+        if unfinished_jobs:
+            with st.expander(f"🔁 Job chưa hoàn tất ({len(unfinished_jobs)})", expanded=False):
+                job_labels = {
+                    f"{job['job_id']} - {job.get('source_name') or 'DOCX'} "
+                    f"({job.get('checkpointed_questions', 0)} câu đã lưu, {job['status']})": job["job_id"]
+                    for job in unfinished_jobs
+                }
+                selected_job = st.selectbox("Chọn job:", list(job_labels.keys()))
+                
+                if st.button("🔁 Tiếp tục job", use_container_width=True):
+                    process_enhanced_quiz_with_progress(
+                        api_key=st.session_state.api_key,
+                        answer_data=None,
+                        docx_file=None,
+                        answer_method=None,
+                        options={"resume_job_id": job_labels[selected_job]}
+                    )
+    
     # Processing options
     if can_process:
         st.success("✅ Đã sẵn sàng tạo quiz!")
@@ -471,6 +528,19 @@ def render_enhanced_input_section():
                     value=True,
                     help="Lưu quiz vào storage sau khi tạo"
                 )
+                
+                run_in_background = st.checkbox(
+                    "⏳ Chạy nền (hàng đợi)",
+                    value=False,
+                    help="Gửi job cho worker process xử lý; giao diện không bị khóa trong lúc tạo quiz"
+                )
+                
+                if run_in_background:
+                    background_workers = st.slider(
+                        "👷 Số worker nền:",
+                        min_value=1, max_value=4, value=1,
+                        help="Mỗi worker xử lý một job; các worker dùng chung rate limit của API key"
+                    )
             
             with col2:
                 processing_mode = st.selectbox(
@@ -485,6 +555,14 @@ def render_enhanced_input_section():
                         value=f"Quiz_{datetime.now().strftime('%d%m%Y_%H%M')}",
                         help="Tên để lưu quiz vào thư viện"
                     )
+                
+                saved_quiz_names = list(st.session_state.quiz_engine.get_saved_quizzes().keys())
+                incremental_choice = st.selectbox(
+                    "♻️ Cập nhật quiz đã lưu:",
+                    ["-- Tạo quiz mới --"] + saved_quiz_names,
+                    help="Chỉ biên dịch lại các câu mới/đã sửa và lưu thành phiên bản mới của quiz này"
+                )
+                incremental_quiz_name = None if incremental_choice == "-- Tạo quiz mới --" else incremental_choice
     
     # Enhanced Processing Button
     if st.button(
@@ -501,9 +579,21 @@ def render_enhanced_input_section():
                 "enable_image_detection": enable_image_detection if can_process else True,
                 "save_to_storage": save_to_storage if can_process else False,
                 "processing_mode": processing_mode if can_process else "Standard",
-                "auto_quiz_name": auto_quiz_name if can_process and save_to_storage else None
+                "auto_quiz_name": auto_quiz_name if can_process and save_to_storage else None,
+                "incremental_quiz_name": incremental_quiz_name if can_process else None
             }
             
+            if run_in_background and not incremental_quiz_name:
+                submit_quiz_job_to_queue(
+                    api_key=st.session_state.api_key,
+                    answer_data=answer_data,
+                    docx_file=docx_file,
+                    answer_method=answer_method,
+                    options=processing_options,
+                    workers=background_workers
+                )
+                return
+            
             process_enhanced_quiz_with_progress(
                 api_key=st.session_state.api_key,
                 answer_data=answer_data,
@@ -548,12 +638,16 @@ def process_enhanced_quiz_with_progress(api_key: str, answer_data, docx_file,
             agent = SimpleQuizAgent(api_key=api_key)
             
             if config:
-                agent.batch_size = config.get('batch_size', 10)
-                agent.batch_delay = config.get('batch_delay', 5)
-                agent.quota_exceeded_delay = config.get('quota_delay', 30)
+                agent.config["batch_size"] = config.get('batch_size', 10)
+                agent.config["batch_delay"] = config.get('batch_delay', 5)
+                agent.config["quota_exceeded_delay"] = config.get('quota_delay', 30)
+                agent.config["compile_workers"] = config.get('compile_workers', 1)
+                agent.config["compile_mode"] = "batch" if config.get('batch_compile') else "single"
+                agent.config["local_compile"] = config.get('local_compile', False)
             
             with detail_container:
-                st.info(f"🔧 Cấu hình: {agent.batch_size} câu/batch, {agent.batch_delay}s delay, {agent.quota_exceeded_delay}s recovery")
+                batch_label = f"{agent.config['batch_size']} câu/request" if agent.config["compile_mode"] == "batch" else "1 câu/request"
+                st.info(f"🔧 Cấu hình: {batch_label}, {agent.config['quota_exceeded_delay']}s recovery, {agent.config['compile_workers']} luồng biên dịch")
             
             # Data preparation
             status_text.success("📋 Chuẩn bị dữ liệu đầu vào...")
@@ -566,11 +660,71 @@ def process_enhanced_quiz_with_progress(api_key: str, answer_data, docx_file,
             progress_bar.progress(25)
             
             # Call enhanced agent
-            results = agent.process_complete_quiz_enhanced(
-                answer_data=answer_data.getvalue() if answer_method == "image" else answer_data,
-                docx_file=docx_file,
-                answer_type=answer_method
-            )
+            incremental_quiz_name = options.get('incremental_quiz_name') if options else None
+            if incremental_quiz_name:
+                results = agent.process_incremental_quiz(
+                    answer_data=answer_data.getvalue() if answer_method == "image" else answer_data,
+                    docx_file=docx_file,
+                    quiz_engine=st.session_state.quiz_engine,
+                    quiz_name=incremental_quiz_name,
+                    answer_type=answer_method
+                )
+            else:
+                results = None
+                stage_names = {
+                    1: "📝 Phân tích đáp án...",
+                    2: "📄 Trích xuất câu hỏi từ DOCX...",
+                    3: "🔍 Kiểm tra khớp dữ liệu...",
+                    4: "⚙️ Biên dịch câu hỏi..."
+                }
+                with detail_container:
+                    event_text = st.empty()
+                st.session_state.quiz_partial_questions = []
+                
+                # Events arrive on this thread, so Streamlit widgets can be updated per question
+                # Runs as a checkpointed job so a refresh/crash can resume from the last compiled question
+                resume_job_id = options.get('resume_job_id') if options else None
+                if resume_job_id:
+                    job_events = agent.iter_quiz_job_events(job_id=resume_job_id)
+                else:
+                    job_events = agent.iter_quiz_job_events(
+                        answer_data=answer_data.getvalue() if answer_method == "image" else answer_data,
+                        docx_file=docx_file,
+                        answer_type=answer_method
+                    )
+                
+                for event in job_events:
+                    kind = event["event"]
+                    if event.get("job_id") and st.session_state.get("current_job_id") != event["job_id"]:
+                        st.session_state.current_job_id = event["job_id"]
+                        with detail_container:
+                            st.caption(f"🗂️ Job ID: {event['job_id']} (có thể tiếp tục nếu bị gián đoạn)")
+                    time_text.info(f"⏱️ {time.time() - start_time:.1f}s")
+                    if "progress" in event:
+                        progress_bar.progress(min(event["progress"], 95))
+                    
+                    if kind == "stage":
+                        status_text.success(stage_names.get(event["stage"], "⚙️ Đang xử lý..."))
+                    elif kind == "answers_parsed":
+                        event_text.info(f"📝 Tìm thấy {event['count']} đáp án")
+                    elif kind == "blocks_extracted":
+                        event_text.info(f"📄 Tìm thấy {event['count']} câu hỏi")
+                    elif kind in ("question_compiled", "question_fallback", "question_reused"):
+                        st.session_state.quiz_partial_questions.append(event["question"])
+                        status_text.success(f"⚙️ Câu {event['so_cau']} ({event['completed']}/{event['total']})")
+                        if kind == "question_fallback":
+                            event_text.warning(f"⚠️ Câu {event['so_cau']} dùng dữ liệu dự phòng: {event['reason']}")
+                    elif kind == "quota_wait":
+                        event_text.warning(f"⏳ Hết quota, chờ {event['seconds']:.0f}s trước khi thử lại...")
+                    elif kind == "rate_limit_wait":
+                        event_text.info(f"⏳ Rate limit, đã chờ {event['seconds']:.0f}s")
+                    elif kind in ("completed", "cancelled"):
+                        results = event["results"]
+                    elif kind == "failed":
+                        raise Exception(event["error"])
+                
+                if results is None:
+                    raise Exception("Processing stopped without results")
             
             progress_bar.progress(90)
             
@@ -579,8 +733,13 @@ def process_enhanced_quiz_with_progress(api_key: str, answer_data, docx_file,
             time_text.success(f"🎉 Tổng thời gian: {time.time() - start_time:.1f}s")
             progress_bar.progress(100)
             
+            if results.get('saved_quiz_name'):
+                with detail_container:
+                    reused = results.get('statistics', {}).get('reused_questions', 0)
+                    st.success(f"♻️ Đã lưu phiên bản mới của '{results['saved_quiz_name']}' (dùng lại {reused} câu)")
+            
             # Auto-save to storage if requested
-            if options and options.get('save_to_storage') and results.get('success'):
+            elif options and options.get('save_to_storage') and results.get('success'):
                 quiz_name = options.get('auto_quiz_name')
                 if quiz_name and results.get('compiled_questions'):
                     engine = st.session_state.quiz_engine
@@ -608,10 +767,102 @@ def process_enhanced_quiz_with_progress(api_key: str, answer_data, docx_file,
                 4. Kiểm tra API key còn quota
                 """)
 
+def submit_quiz_job_to_queue(api_key: str, answer_data, docx_file, answer_method: str,
+                             options: dict, workers: int = 1):
+    """Gửi job vào hàng đợi nền và đảm bảo có worker đang chạy."""
+    config = st.session_state.get('processing_config', {})
+    agent_config = {
+        "batch_size": config.get('batch_size', 10),
+        "batch_delay": config.get('batch_delay', 5),
+        "quota_exceeded_delay": config.get('quota_delay', 30),
+        "compile_workers": config.get('compile_workers', 1),
+        "compile_mode": "batch" if config.get('batch_compile') else "single",
+        "local_compile": config.get('local_compile', False)
+    }
+    
+    try:
+        job_queue = get_job_queue()
+        job_id = job_queue.submit(
+            answer_data.getvalue() if answer_method == "image" else answer_data,
+            docx_file.getvalue(),
+            answer_type=answer_method,
+            config=agent_config,
+            options=options,
+            source_name=docx_file.name
+        )
+        running = ensure_local_workers(api_key, workers)
+        
+        st.session_state.setdefault('queued_job_ids', []).append(job_id)
+        st.success(f"📥 Đã gửi job {job_id} vào hàng đợi ({running} worker đang chạy)")
+        st.info("💡 Theo dõi tiến độ ở mục Hàng Đợi bên phải, có thể tiếp tục thao tác khác.")
+    except Exception as e:
+        st.error(f"❌ Không gửi được job: {e}")
+
+def render_job_queue_status():
+    """Hiển thị trạng thái các job nền của session này."""
+    job_ids = st.session_state.get('queued_job_ids', [])
+    if not job_ids:
+        return
+    
+    job_queue = get_job_queue()
+    status_icons = {
+        "queued": "🕒", "running": "⚙️", "completed": "✅", "failed": "❌", "cancelled": "⏹️"
+    }
+    
+    with st.expander(f"⏳ Hàng Đợi ({len(job_ids)} job)", expanded=True):
+        for job_id in reversed(job_ids):
+            job = job_queue.get_status(job_id)
+            if not job:
+                continue
+            
+            col1, col2 = st.columns([3, 1])
+            with col1:
+                st.markdown(f"{status_icons.get(job['status'], '❔')} **{job_id}** - {job['status']}")
+                if job["total"]:
+                    st.progress(min(job["completed"] / job["total"], 1.0))
+                if job["message"] and job["status"] == "running":
+                    st.caption(job["message"])
+                if job["error"]:
+                    st.caption(f"❌ {job['error']}")
+            
+            with col2:
+                if job["status"] == "completed":
+                    if st.button("📊 Xem", key=f"view_job_{job_id}"):
+                        load_queued_job_results(job_queue, job)
+                elif job["status"] in ("queued", "running"):
+                    if st.button("⏹️ Hủy", key=f"cancel_job_{job_id}"):
+                        job_queue.cancel(job_id)
+                        st.rerun()
+        
+        if st.button("🔄 Cập nhật trạng thái", use_container_width=True):
+            st.rerun()
+
+def load_queued_job_results(job_queue: QuizJobQueue, job: dict):
+    """Nạp kết quả job nền vào session và auto-save nếu job yêu cầu."""
+    results = job_queue.load_results(job["job_id"])
+    if not results:
+        st.error("❌ Không tìm thấy kết quả của job")
+        return
+    
+    options = job.get("options", {})
+    saved_jobs = st.session_state.setdefault('auto_saved_job_ids', set())
+    if options.get('save_to_storage') and results.get('success') and job["job_id"] not in saved_jobs:
+        quiz_name = options.get('auto_quiz_name')
+        if quiz_name and results.get('compiled_questions'):
+            saved_name = st.session_state.quiz_engine.save_quiz_to_storage(results['compiled_questions'], quiz_name)
+            if saved_name:
+                saved_jobs.add(job["job_id"])
+                st.success(f"💾 Đã tự động lưu quiz '{saved_name}' vào thư viện!")
+    
+    st.session_state.quiz_results = results
+    st.rerun()
+
 def render_enhanced_results_section():
     """Render enhanced results section với quiz management."""
     st.markdown("### 📊 Kết Quả Xử Lý")
     
+    render_job_queue_status()
+    
     # Display results if available
     if 'quiz_results' in st.session_state and st.session_state.quiz_results:
         display_enhanced_professional_results(st.session_state.quiz_results)
@@ -734,6 +985,18 @@ D. Lựa chọn D
         total_batches = batch_info.get("total_batches", 0)
         st.metric("📦 Batch", f"{total_batches}")
     
+    # Request usage: API calls, cache hits, quota waits
+    if stats:
+        usage_cols = st.columns(4)
+        with usage_cols[0]:
+            st.metric("🌐 API Requests", stats.get("api_requests_used", 0))
+        with usage_cols[1]:
+            st.metric("💾 Cache Hits", stats.get("cache_hits", 0))
+        with usage_cols[2]:
+            st.metric("⏳ Chờ Quota", stats.get("quota_wait_time", "0.0s"))
+        with usage_cols[3]:
+            st.metric("⏱️ Thời Gian", stats.get("processing_time", "N/A"))
+    
     # Enhanced processing info
     if batch_info:
         st.markdown("**🔄 Enhanced Batch Processing Info:**")
@@ -912,7 +1175,7 @@ def render_enhanced_quiz_editor(questions: list):
     # Question options cho selectbox
     question_options = []
     for i, q in enumerate(filtered_questions):
-        difficulty_emoji = {'de': '🟢', 'trung_binh': '🟡', 'kho': '🔴'}.get(q.get('do_kho', 'trung_binh'), '🟡')
+        difficulty_emoji = {'de': '🟢', 'trung_binh': '🟡', 'kho': '🔴'}.get(q.get('do_kho', 'trung_binh'), '⚪')
         image_emoji = '📷' if q.get('has_images', False) else ''
         option_text = f"Câu {q.get('so_cau', i+1)}: {q.get('cau_hoi', '')[:50]}... {difficulty_emoji} {image_emoji}"
         question_options.append(option_text)
@@ -1217,7 +1480,7 @@ def render_enhanced_quiz_preview(questions: list):
             with col1:
                 st.markdown("**Độ khó:**")
                 for diff, count in difficulty_count.items():
-                    emoji = {'de': '🟢', 'trung_binh': '🟡', 'kho': '🔴'}.get(diff, '🟡')
+                    emoji = {'de': '🟢', 'trung_binh': '🟡', 'kho': '🔴'}.get(diff, '⚪')
                     st.write(f"{emoji} {diff}: {count} câu")
             
             with col2:
@@ -1244,7 +1507,7 @@ def render_list_preview(questions: list, show_answers: bool):
             col1, col2, col3 = st.columns([6, 2, 1])
             
             with col1:
-                difficulty_emoji = {'de': '🟢', 'trung_binh': '🟡', 'kho': '🔴'}.get(q.get('do_kho', 'trung_binh'), '🟡')
+                difficulty_emoji = {'de': '🟢', 'trung_binh': '🟡', 'kho': '🔴'}.get(q.get('do_kho', 'trung_binh'), '⚪')
                 image_emoji = '📷' if q.get('has_images', False) else ''
                 
                 st.write(f"**{i+1}.** {q.get('cau_hoi', '')[:100]}...")
@@ -1455,7 +1718,7 @@ def render_enhanced_test_setup():
                     # Enhanced preview
                     with st.expander("👀 Xem trước câu hỏi", expanded=False):
                         for i, q in enumerate(questions_data[:3]):
-                            difficulty_emoji = {'de': '🟢', 'trung_binh': '🟡', 'kho': '🔴'}.get(q.get('do_kho', 'trung_binh'), '🟡')
+                            difficulty_emoji = {'de': '🟢', 'trung_binh': '🟡', 'kho': '🔴'}.get(q.get('do_kho', 'trung_binh'), '⚪')
                             image_emoji = '📷' if q.get('has_images', False) else ''
                             
                             st.markdown(f"**Câu {q.get('so_cau', i+1)}:** {q.get('cau_hoi', '')[:100]}... {difficulty_emoji} {image_emoji}")
@@ -1639,7 +1902,7 @@ def render_enhanced_test_setup():
             if difficulty_stats:
                 st.markdown("**Phân bố độ khó:**")
                 for diff, count in difficulty_stats.items():
-                    emoji = {'de': '🟢', 'trung_binh': '🟡', 'kho': '🔴'}.get(diff, '🟡')
+                    emoji = {'de': '🟢', 'trung_binh': '🟡', 'kho': '🔴'}.get(diff, '⚪')
                     percentage = (count / total_questions) * 100
                     st.write(f"{emoji} {diff}: {count} câu ({percentage:.1f}%)")
     
@@ -1900,7 +2163,7 @@ def render_quiz_library_selector():
                 preview_questions = st.session_state.preview_quiz
                 
                 for i, q in enumerate(preview_questions[:5]):
-                    difficulty_emoji = {'de': '🟢', 'trung_binh': '🟡', 'kho': '🔴'}.get(q.do_kho, '🟡')
+                    difficulty_emoji = {'de': '🟢', 'trung_binh': '🟡', 'kho': '🔴'}.get(q.do_kho, '⚪')
                     image_emoji = '📷' if q.has_images else ''
                     st.markdown(f"**Câu {q.so_cau}:** {q.cau_hoi[:100]}... {difficulty_emoji} {image_emoji}")
                 
@@ -2608,7 +2871,7 @@ def render_enhanced_test_completed():
             for diff, data in difficulty_data.items():
                 if data['total'] > 0:
                     percentage = (data['correct'] / data['total']) * 100
-                    emoji = {'de': '🟢', 'trung_binh': '🟡', 'kho': '🔴'}.get(diff, '🟡')
+                    emoji = {'de': '🟢', 'trung_binh': '🟡', 'kho': '🔴'}.get(diff, '⚪')
                     
                     col1, col2 = st.columns([1, 3])
                     with col1:
@@ -2674,7 +2937,7 @@ def render_enhanced_test_completed():
         for i, item in enumerate(detailed):
             # Enhanced question card
             result_emoji = "✅" if item['ket_qua'] == 'Đúng' else "❌" if item['ket_qua'] == 'Sai' else "⏳"
-            difficulty_emoji = {'de': '🟢', 'trung_binh': '🟡', 'kho': '🔴'}.get(item.get('do_kho', 'trung_binh'), '🟡')
+            difficulty_emoji = {'de': '🟢', 'trung_binh': '🟡', 'kho': '🔴'}.get(item.get('do_kho', 'trung_binh'), '⚪')
             
             with st.expander(f"Câu {item['so_cau']}: {result_emoji} {item['ket_qua']} {difficulty_emoji}", expanded=False):
                 
@@ -2876,16 +3139,16 @@ def render_enhanced_statistics_page():
     # Initialize engine if needed
     if 'quiz_engine' not in st.session_state:
         try:
-            from backend.quiz_test_engine import QuizTestEngine
+            from backend.quiz_test_engine import get_shared_quiz_engine
         except ImportError:
             try:
-                from test.backend.quiz_test_engine import QuizTestEngine
+                from test.backend.quiz_test_engine import get_shared_quiz_engine
             except ImportError as e:
                 st.error(f"❌ Lỗi import QuizTestEngine: {e}")
                 st.info("Module quiz_test_engine chưa được tạo. Tính năng này sẽ khả dụng sau.")
                 return
         
-        st.session_state.quiz_engine = QuizTestEngine()
+        st.session_state.quiz_engine = get_shared_quiz_engine()
     
     engine = st.session_state.quiz_engine
     stats = engine.get_test_statistics()
@@ -3054,9 +3317,25 @@ def render_overview_analytics(stats: dict):
                     st.write(f"🕒 {test['time']}")
                     st.caption(f"⏱️ {test['time_taken']}")
                 
+                # Chi tiết từng câu chỉ được đọc từ lịch sử khi mở
+                if test.get('session_id') and st.checkbox("🔍 Xem chi tiết", key=f"history_detail_{test['session_id']}"):
+                    render_history_result_details(test['session_id'])
+                
                 if i < len(recent_tests) - 1:
                     st.divider()
 
+def render_history_result_details(session_id: str):
+    """Render detailed results of one finished test, loaded on demand."""
+    result = st.session_state.quiz_engine.get_test_result(session_id)
+    if not result:
+        st.warning("⚠️ Không tìm thấy chi tiết bài kiểm tra này")
+        return
+    
+    for item in result.detailed_results:
+        status_emoji = "✅" if item.get('is_correct') else "⭕" if item.get('ket_qua') == "Không trả lời" else "❌"
+        st.write(f"{status_emoji} **Câu {item.get('so_cau')}:** {item.get('cau_hoi', '')[:120]}")
+        st.caption(f"Chọn: {item.get('dap_an_chon')} | Đáp án: {item.get('dap_an_dung')} | Độ khó: {item.get('do_kho')}")
+
 def render_performance_analytics(stats: dict):
     """Render performance analytics."""
     
@@ -3072,7 +3351,7 @@ def render_performance_analytics(stats: dict):
                 col1, col2, col3 = st.columns([1, 2, 1])
                 
                 with col1:
-                    emoji = {'de': '🟢', 'trung_binh': '🟡', 'kho': '🔴'}.get(difficulty, '🟡')
+                    emoji = {'de': '🟢', 'trung_binh': '🟡', 'kho': '🔴'}.get(difficulty, '⚪')
                     st.write(f"{emoji} **{difficulty.title()}**")
                 
                 with col2:
@@ -3848,7 +4127,7 @@ def render_quiz_analysis_tools():
             for difficulty, count in difficulty_counts.items():
                 if count > 0:
                     percentage = (count / len(questions)) * 100
-                    emoji = {'de': '🟢', 'trung_binh': '🟡', 'kho': '🔴'}.get(difficulty, '🟡')
+                    emoji = {'de': '🟢', 'trung_binh': '🟡', 'kho': '🔴'}.get(difficulty, '⚪')
                     
                     col1, col2 = st.columns([1, 3])
                     with col1:
@@ -4152,16 +4431,11 @@ def check_quiz_files():
     total_count = len(saved_quizzes)
     
     for name, info in saved_quizzes.items():
-        file_path = Path(info["file_path"])
-        if file_path.exists():
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    json.load(f)  # Try to parse JSON
-                valid_count += 1
-            except:
-                pass
+        # Quiz có đủ số câu như metadata trong quiz store
+        if len(engine.get_quiz_source_questions(name)) == info["questions_count"]:
+            valid_count += 1
     
-    return f"{valid_count}/{total_count} quiz files hợp lệ"
+    return f"{valid_count}/{total_count} quiz hợp lệ"
 
 def check_images():
     """Check image files."""
@@ -4391,6 +4665,14 @@ def render_processing_settings():
         value=st.session_state.get('processing_config', {}).get('quota_delay', 30)
     )
     
+    default_compile_workers = st.slider(
+        "Số luồng biên dịch song song:",
+        min_value=1,
+        max_value=8,
+        value=st.session_state.get('processing_config', {}).get('compile_workers', 1),
+        help="1 = tuần tự. Nhiều luồng hơn sẽ nhanh hơn nhưng vẫn tuân theo giới hạn quota"
+    )
+    
     # AI behavior settings
     st.markdown("**🤖 Cài đặt AI Agent:**")
     
@@ -4419,6 +4701,7 @@ def render_processing_settings():
             'batch_size': default_batch_size,
             'batch_delay': default_batch_delay,
             'quota_delay': default_quota_delay,
+            'compile_workers': default_compile_workers,
             'ai_aggressiveness': ai_aggressiveness,
             'enable_auto_retry': enable_auto_retry,
             'max_retries': max_retries